@@ -13,33 +13,75 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 from __future__ import absolute_import
-import pkg_resources
+import importlib
+import sys
 
-from cinderlib import cinderlib
-from cinderlib import objects
-from cinderlib import serialization
 from cinderlib import workarounds  # noqa
 
-try:
-    __version__ = pkg_resources.get_distribution('cinderlib').version
-except pkg_resources.DistributionNotFound:
-    __version__ = '0.0.0'
-
-DEFAULT_PROJECT_ID = objects.DEFAULT_PROJECT_ID
-DEFAULT_USER_ID = objects.DEFAULT_USER_ID
-Volume = objects.Volume
-Snapshot = objects.Snapshot
-Connection = objects.Connection
-KeyValue = objects.KeyValue
-
-load = serialization.load
-json = serialization.json
-jsons = serialization.jsons
-dump = serialization.dump
-dumps = serialization.dumps
-
-setup = cinderlib.setup
-Backend = cinderlib.Backend
-
-get_connector_properties = objects.brick_connector.get_connector_properties
-list_supported_drivers = cinderlib.Backend.list_supported_drivers
+# Public attributes and the module and attribute path they come from.  They
+# are imported on first access, because the modules are slow to import, on
+# Python versions that support module __getattr__ (PEP 562).
+_LAZY_ATTRIBUTES = {
+    'DEFAULT_PROJECT_ID': ('objects', 'DEFAULT_PROJECT_ID'),
+    'DEFAULT_USER_ID': ('objects', 'DEFAULT_USER_ID'),
+    'Volume': ('objects', 'Volume'),
+    'Snapshot': ('objects', 'Snapshot'),
+    'Connection': ('objects', 'Connection'),
+    'KeyValue': ('objects', 'KeyValue'),
+
+    'load': ('serialization', 'load'),
+    'json': ('serialization', 'json'),
+    'jsons': ('serialization', 'jsons'),
+    'dump': ('serialization', 'dump'),
+    'dumps': ('serialization', 'dumps'),
+    'jsonb': ('serialization', 'jsonb'),
+    'dumpb': ('serialization', 'dumpb'),
+    'write_jsons': ('serialization', 'write_jsons'),
+    'write_dumps': ('serialization', 'write_dumps'),
+    'dump_to': ('serialization', 'dump_to'),
+    'load_from': ('serialization', 'load_from'),
+
+    'setup': ('cinderlib', 'setup'),
+    'Backend': ('cinderlib', 'Backend'),
+
+    'get_connector_properties': ('objects',
+                                 'brick_connector.get_connector_properties'),
+    'list_supported_drivers': ('cinderlib', 'Backend.list_supported_drivers'),
+    'schedule_volume': ('cinderlib', 'Backend.schedule_volume'),
+}
+_SUBMODULES = ('cinderlib', 'exception', 'limiter', 'metrics', 'nos_brick',
+               'objects', 'persistence', 'scheduler', 'serialization',
+               'utils')
+
+
+def _get_version():
+    import pkg_resources
+    try:
+        return pkg_resources.get_distribution('cinderlib').version
+    except pkg_resources.DistributionNotFound:
+        return '0.0.0'
+
+
+def __getattr__(name):
+    if name == '__version__':
+        value = _get_version()
+    elif name in _LAZY_ATTRIBUTES:
+        module_name, path = _LAZY_ATTRIBUTES[name]
+        value = importlib.import_module(__name__ + '.' + module_name)
+        for attr in path.split('.'):
+            value = getattr(value, attr)
+    elif name in _SUBMODULES:
+        value = importlib.import_module(__name__ + '.' + name)
+    else:
+        raise AttributeError("module %r has no attribute %r" %
+                             (__name__, name))
+    globals()[name] = value
+    return value
+
+
+if sys.version_info < (3, 7):
+    # No module __getattr__ support, so we must import everything now
+    __getattr__('cinderlib')
+    for _name in ('__version__',) + tuple(_LAZY_ATTRIBUTES):
+        __getattr__(_name)
+    del _name
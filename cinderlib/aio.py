@@ -0,0 +1,170 @@
+# Copyright (c) 2019, Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Asyncio front-end for cinderlib.
+
+Every function in this module returns an asyncio future that can be awaited
+from a coroutine.  The blocking cinderlib call, that includes both the driver
+and the persistence calls, runs on a thread pool of the resource's backend,
+so the number of concurrent operations on each backend is limited by the
+size of its pool, and operations beyond that wait in FIFO order.
+
+The length of the queue can also be limited, in which case submitting more
+operations raises futurist.RejectedSubmission instead of queuing them, so
+callers get immediate backpressure.
+
+This module requires Python 3.
+"""
+
+import asyncio
+import threading
+
+import futurist
+from futurist import rejection
+
+import cinderlib
+
+DEFAULT_MAX_WORKERS = 4
+
+
+class Executors(object):
+    """Thread pools for the backends, created on first use."""
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, max_queued=None):
+        self.defaults = (max_workers, max_queued)
+        self._limits = {}
+        self._executors = {}
+        self._lock = threading.Lock()
+
+    def set_limits(self, max_workers=DEFAULT_MAX_WORKERS, max_queued=None,
+                   backend=None):
+        """Set the concurrency limits for a backend, or the default ones.
+
+        Executors that already exist are replaced, and the operations they
+        have already accepted will still complete.
+        """
+        with self._lock:
+            if backend is None:
+                self.defaults = (max_workers, max_queued)
+                ids = [backend_id for backend_id in self._executors
+                       if backend_id not in self._limits]
+            else:
+                self._limits[backend.id] = (max_workers, max_queued)
+                ids = [backend.id]
+            old = [self._executors.pop(backend_id)
+                   for backend_id in ids if backend_id in self._executors]
+        for executor in old:
+            executor.shutdown(wait=False)
+
+    def get(self, backend):
+        """Return the executor for the backend."""
+        executor = self._executors.get(backend.id)
+        if executor:
+            return executor
+
+        with self._lock:
+            executor = self._executors.get(backend.id)
+            if not executor:
+                max_workers, max_queued = self._limits.get(backend.id,
+                                                           self.defaults)
+                check = (rejection.reject_when_reached(max_queued)
+                         if max_queued is not None else None)
+                executor = futurist.ThreadPoolExecutor(
+                    max_workers=max_workers, check_and_reject=check)
+                self._executors[backend.id] = executor
+        return executor
+
+    def submit(self, backend, func, *args, **kwargs):
+        """Run func on the backend's executor and return an asyncio future.
+
+        Must be called from the thread running the event loop.
+        """
+        future = self.get(backend).submit(func, *args, **kwargs)
+        return asyncio.wrap_future(future)
+
+    def shutdown(self, wait=True):
+        """Shut down all the executors."""
+        with self._lock:
+            executors = list(self._executors.values())
+            self._executors.clear()
+        for executor in executors:
+            executor.shutdown(wait=wait)
+
+
+EXECUTORS = Executors()
+
+
+def submit(backend, func, *args, **kwargs):
+    """Run func on the backend's executor and return an asyncio future."""
+    return EXECUTORS.submit(backend, func, *args, **kwargs)
+
+
+def set_limits(max_workers=DEFAULT_MAX_WORKERS, max_queued=None,
+               backend=None):
+    """Set the concurrency limits for a backend, or the default ones."""
+    EXECUTORS.set_limits(max_workers, max_queued, backend)
+
+
+def shutdown(wait=True):
+    """Shut down the executors of all the backends."""
+    EXECUTORS.shutdown(wait)
+
+
+def _get_backend(resource):
+    """Return the resource's backend, which may have been stored by name."""
+    backend = resource.backend
+    if isinstance(backend, str):
+        try:
+            backend = cinderlib.Backend.backends[backend]
+        except KeyError:
+            raise ValueError('Backend %s of %s has not been set up' %
+                             (backend, resource))
+    return backend
+
+
+def _method(name, for_backend=False):
+    def method(resource, *args, **kwargs):
+        backend = resource if for_backend else _get_backend(resource)
+        return submit(backend, getattr(resource, name), *args, **kwargs)
+
+    method.__name__ = name
+    method.__doc__ = 'Awaitable equivalent of the %s %s method.' % (
+        'Backend' if for_backend else 'resource', name)
+    return method
+
+
+# Backend methods
+stats = _method('stats', for_backend=True)
+create_volume = _method('create_volume', for_backend=True)
+create_volumes = _method('create_volumes', for_backend=True)
+
+# Volume methods
+clone = _method('clone')
+extend = _method('extend')
+create_snapshot = _method('create_snapshot')
+connect = _method('connect')
+
+# Snapshot methods
+create_volume_from_snapshot = _method('create_volume')
+
+# Volume and Connection methods
+attach = _method('attach')
+detach = _method('detach')
+disconnect = _method('disconnect')
+
+# Volume, Snapshot, and Connection methods
+refresh = _method('refresh')
+
+# Volume and Snapshot methods
+delete = _method('delete')
@@ -14,42 +14,90 @@
 #    under the License.
 
 from __future__ import absolute_import
+import copy
+import hashlib
 import json as json_lib
 import logging
 import multiprocessing
 import os
+import random
 import six
+import tempfile
+import threading
+import time
 
 from cinder import coordination
 from cinder.db import api as db_api
-from cinder import objects as cinder_objects
-
-# We need this here until we remove from cinder/volume/manager.py:
-# VA_LIST = objects.VolumeAttachmentList
-cinder_objects.register_all()  # noqa
-
 from cinder.interface import util as cinder_interface_util
 from cinder import utils
 from cinder.volume import configuration
-from cinder.volume import manager
+import futurist
 from oslo_config import cfg
 from oslo_log import log as oslo_logging
 from oslo_utils import importutils
+from oslo_utils import reflection
 import urllib3
 
 import cinderlib
-from cinderlib import nos_brick
+from cinderlib import limiter
+from cinderlib import metrics
 from cinderlib import objects
 from cinderlib import persistence
+from cinderlib import scheduler
 from cinderlib import serialization
 from cinderlib import utils as cinderlib_utils
 
 
 __all__ = ['setup', 'Backend']
 
+# These modules are slow to import and are only needed once cinderlib has
+# been set up, so they are not imported when we only use the serialization.
+manager = cinderlib_utils.LazyModule('cinder.volume.manager')
+nos_brick = cinderlib_utils.LazyModule('cinderlib.nos_brick')
+
 LOG = logging.getLogger(__name__)
 
 
+class _StatsRefresher(threading.Thread):
+    """Thread that periodically refreshes the stats of a backend."""
+
+    def __init__(self, backend, interval, ttl, jitter):
+        super(_StatsRefresher, self).__init__(
+            name='cinderlib-stats-%s' % backend.id)
+        self.daemon = True
+        self.backend = backend
+        self.interval = interval
+        self.ttl = ttl
+        self.jitter = jitter
+        self._wakeup = threading.Event()
+        self._stopped = False
+
+    def run(self):
+        # Start at a random point of the interval so backends started at the
+        # same time don't refresh their stats at the same time.
+        delay = random.uniform(0, self.interval)
+        while True:
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+            if self._stopped:
+                return
+            try:
+                self.backend._refresh_stats()
+            except Exception as exc:
+                # Keep the last good stats
+                LOG.warning('Error refreshing stats for backend %s: %s',
+                            self.backend.id, exc)
+            delay = self.interval * random.uniform(1 - self.jitter,
+                                                   1 + self.jitter)
+
+    def wakeup(self):
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+
+
 class Backend(object):
     """Representation of a Cinder Driver.
 
@@ -60,47 +108,127 @@ class Backend(object):
     - jsons
     - load
     - stats
+    - stats_age
+    - select_pool
+    - schedule_volume
+    - start_stats_refresher
+    - stop_stats_refresher
+    - limiter
+    - set_operation_limits
     - create_volume
+    - create_volumes
+    - iter_volumes
     - global_setup
+    - setup_many
+    - initialize_all
     - validate_connector
+    - startup_report
     """
     backends = {}
     global_initialization = False
-    # Some drivers try access the DB directly for extra specs on creation.
-    # With this dictionary the DB class can get the necessary data
-    _volumes_inflight = {}
+    # Loading serialized objects before the setup keeps the backend names
+    fail_on_missing_backend = False
+    # Number of volumes retrieved on each query when iterating volumes
+    volumes_page_size = 1000
+    # Retrieve the volumes property with their snapshots and connections
+    eager_load_volumes = False
+    # Directory where list_supported_drivers caches the drivers information,
+    # defaults to the user's cache directory.
+    drivers_cache_dir = None
+    _supported_drivers = None
+    # Key of the installed drivers, computed once per process
+    _drivers_cache_key = None
+    # Strategy used to select the pool of new volumes
+    pool_selector = scheduler.CapacityPoolSelector()
+    # Time of the stats, capacity used on each pool by the volumes created or
+    # placed since then, as {pool_name: [thin_gb, thick_gb]}, and number of
+    # reservations made by the scheduler not yet claimed by a volume, as
+    # {(pool_name, size, thin): count}.
+    _consumed_capacity = None
+    # Serializes the changes to the cached list of volumes
+    _volumes_lock = threading.Lock()
+    # Selects the backend and pool of new volumes for schedule_volume
+    volume_scheduler = scheduler.Scheduler()
+    # Maximum concurrent operations of each type on each backend
+    operation_limits = None
+    _limiter = None
+    _limiter_lock = threading.Lock()
+    # Record the duration of the phases of the setup of cinderlib and drivers
+    startup_profiling = False
+    _global_timer = None
+    _startup_timer = None
+    _stats_updated_at = None
+    _stats_refresher = None
+    # Attributes that are only available once the driver has been set up
+    _LAZY_ATTRIBUTES = ('driver', '_stats', '_pool_names')
+    # Set up drivers on first use instead of on initialization
+    lazy_driver_setup = False
+    # Backend configurations already loaded by setup_many and initialize_all
+    _preloaded_configs = {}
+    # Serializes the changes to the global configuration, as lazy drivers can
+    # be set up concurrently.  Created again on setup in case threading has
+    # been monkey patched since the class was defined.
+    _config_lock = threading.Lock()
 
     def __init__(self, volume_backend_name, **driver_cfg):
         if not self.global_initialization:
             self.global_setup()
         driver_cfg['volume_backend_name'] = volume_backend_name
         Backend.backends[volume_backend_name] = self
-
-        conf = self._set_backend_config(driver_cfg)
-        self.driver = importutils.import_object(
-            conf.volume_driver,
-            configuration=conf,
-            db=self.persistence.db,
-            host='%s@%s' % (cfg.CONF.host, volume_backend_name),
-            cluster_name=None,  # We don't use cfg.CONF.cluster for now
-            active_backend_id=None)  # No failover for now
-        self.driver.do_setup(objects.CONTEXT)
-        self.driver.check_for_setup_error()
-
-        self.driver.init_capabilities()
-        self.driver.set_throttle()
-        self.driver.set_initialized()
         self._driver_cfg = driver_cfg
         self._volumes = None
+        # Some drivers try access the DB directly for extra specs on
+        # creation, so the DB class looks for the volume in this registry.
+        self._volumes_inflight = cinderlib_utils.InFlightRegistry()
+        self._driver_lock = threading.Lock()
+        self._pools_lock = threading.Lock()
+
+        if not self.lazy_driver_setup:
+            self._setup_driver()
+
+    def _setup_driver(self):
+        """Load the configuration and set up the driver of the backend."""
+        with self._driver_lock:
+            # Another thread may have set up the driver while we waited
+            if 'driver' in self.__dict__:
+                return
+
+            timer = cinderlib_utils.PhaseTimer(self.startup_profiling)
+            if timer.enabled:
+                self._startup_timer = timer
+
+            with timer.phase('config'):
+                conf = self._set_backend_config(self._driver_cfg)
+            with timer.phase('driver_import'):
+                driver = importutils.import_object(
+                    conf.volume_driver,
+                    configuration=conf,
+                    db=self.persistence.db,
+                    host='%s@%s' % (cfg.CONF.host, self.id),
+                    cluster_name=None,  # We don't use cfg.CONF.cluster now
+                    active_backend_id=None)  # No failover for now
+            with timer.phase('do_setup'):
+                driver.do_setup(objects.CONTEXT)
+            with timer.phase('check_for_setup_error'):
+                driver.check_for_setup_error()
+
+            with timer.phase('init_capabilities'):
+                driver.init_capabilities()
+            driver.set_throttle()
+            driver.set_initialized()
+
+            # Some drivers don't implement the caching correctly. Populate
+            # cache with data retrieved in init_capabilities.
+            stats = driver.capabilities.copy()
+            stats.pop('properties', None)
+            stats.pop('vendor_prefix', None)
+            self._stats = self._transform_legacy_stats(stats)
+            self._stats_updated_at = time.time()
 
-        # Some drivers don't implement the caching correctly. Populate cache
-        # with data retrieved in init_capabilities.
-        stats = self.driver.capabilities.copy()
-        stats.pop('properties', None)
-        stats.pop('vendor_prefix', None)
-        self._stats = self._transform_legacy_stats(stats)
-
-        self._pool_names = tuple(pool['pool_name'] for pool in stats['pools'])
+            self._pool_names = tuple(pool['pool_name']
+                                     for pool in stats['pools'])
+            # Set it last, as it flags that the driver has been set up
+            self.driver = driver
 
     @property
     def pool_names(self):
@@ -110,22 +238,83 @@ class Backend(object):
         return '<cinderlib.Backend %s>' % self.id
 
     def __getattr__(self, name):
+        # With lazy_driver_setup the driver is set up on first use
+        if name in self._LAZY_ATTRIBUTES:
+            # Don't try to set up the driver of a partially created backend
+            if '_driver_lock' not in self.__dict__:
+                raise AttributeError(name)
+            self._setup_driver()
+            return self.__dict__[name]
         return getattr(self.driver, name)
 
     @property
     def id(self):
         return self._driver_cfg['volume_backend_name']
 
+    def _get_volumes(self, eager_load=False):
+        # Only pass eager_load when needed to support older plugins
+        kwargs = {'eager_load': True} if eager_load else {}
+        return cinderlib_utils.IdList(
+            self.persistence.get_volumes(backend_name=self.id, **kwargs))
+
     @property
     def volumes(self):
+        """Backend's volumes, cached on first access.
+
+        Their snapshots and connections are retrieved together with them when
+        eager_load_volumes is set, instead of lazily on each volume.
+        """
         if self._volumes is None:
-            self._volumes = self.persistence.get_volumes(backend_name=self.id)
+            self._volumes = self._get_volumes(self.eager_load_volumes)
         return self._volumes
 
-    def volumes_filtered(self, volume_id=None, volume_name=None):
+    def volumes_filtered(self, volume_id=None, volume_name=None,
+                         eager_load=False):
+        """Return the backend's volumes that match the filters.
+
+        With eager_load the volumes' snapshots and connections are retrieved
+        together with the volumes instead of lazily, one volume at a time.
+        """
+        kwargs = {'eager_load': True} if eager_load else {}
         return self.persistence.get_volumes(backend_name=self.id,
                                             volume_id=volume_id,
-                                            volume_name=volume_name)
+                                            volume_name=volume_name,
+                                            **kwargs)
+
+    def iter_volumes(self, volume_name=None, page_size=None, sort_keys=None,
+                     sort_dirs=None, eager_load=False):
+        """Iterate over the backend's volumes one page at a time.
+
+        Unlike the volumes property the volumes are not cached, and only one
+        page of volumes is kept in memory at any given time.
+
+        Persistence plugins that don't support pagination, written for older
+        cinderlib releases, return all the volumes in a single page.
+        """
+        page_size = page_size or self.volumes_page_size
+        # Only pass the parameters that are set, and that the plugin accepts,
+        # to support older plugins.
+        kwargs = {'eager_load': eager_load, 'sort_keys': sort_keys,
+                  'sort_dirs': sort_dirs}
+        accepted = reflection.get_callable_args(self.persistence.get_volumes)
+        kwargs = {k: v for k, v in kwargs.items() if v and k in accepted}
+        load_children = eager_load and 'eager_load' not in kwargs
+        if 'limit' not in accepted or 'marker' not in accepted:
+            page_size = None
+        else:
+            kwargs['limit'] = page_size
+
+        while True:
+            page = self.persistence.get_volumes(backend_name=self.id,
+                                                volume_name=volume_name,
+                                                **kwargs)
+            if load_children:
+                persistence.base.PersistenceDriverBase._eager_load(page)
+            for volume in page:
+                yield volume
+            if not page_size or len(page) < page_size:
+                return
+            kwargs['marker'] = page[-1].id
 
     def _transform_legacy_stats(self, stats):
         """Convert legacy stats to new stats with pools key."""
@@ -140,36 +329,288 @@ class Backend(object):
             stats['pools'] = [pool]
         return stats
 
+    def _refresh_stats(self, refresh=True):
+        stats = self.driver.get_volume_stats(refresh=refresh)
+        self._stats = self._transform_legacy_stats(stats)
+        self._stats_updated_at = time.time()
+        return self._stats
+
+    def _get_consumed_capacity(self):
+        # Must be called holding the pools lock
+        # Refreshed stats already include the volumes created before
+        if (self._consumed_capacity is None or
+                self._consumed_capacity[0] != self._stats_updated_at):
+            self._consumed_capacity = (self._stats_updated_at, {}, {})
+        return self._consumed_capacity[1]
+
+    def _consumed_pools(self, stats):
+        # Must be called holding the pools lock
+        consumed = self._get_consumed_capacity()
+        pools = []
+        for pool in stats.get('pools') or ():
+            pool = pool.copy()
+            thin, thick = consumed.get(pool.get('pool_name'), (0, 0))
+            if thin:
+                scheduler.consume_capacity(pool, thin, thin=True)
+            if thick:
+                scheduler.consume_capacity(pool, thick, thin=False)
+            pools.append(pool)
+        return pools
+
+    def _pools_stats(self):
+        """Return the pools' cached stats with the capacity used since then.
+
+        Returned pools are copies of the cached ones, updated with the
+        capacity of the volumes created, or being created, since the stats
+        were gathered.
+        """
+        # Getting the stats may call the driver, so don't hold the lock
+        stats = self.stats()
+        with self._pools_lock:
+            return self._consumed_pools(stats)
+
+    def _add_consumed_capacity(self, pool_name, size, thin):
+        # Must be called holding the pools lock
+        consumed = self._get_consumed_capacity().setdefault(pool_name, [0, 0])
+        consumed[0 if thin else 1] += size
+        return (self._consumed_capacity[0], pool_name, size, thin)
+
+    def _reserve_capacity(self, pool_name, size, extra_specs=None,
+                          scheduled=False):
+        """Account for the capacity of a volume that will go in the pool.
+
+        Returns the reservation to release if the volume is not created.
+        Scheduled reservations are claimed by the volume created in the pool
+        later on with _claim_reservation.
+        """
+        thin = scheduler.is_thin(extra_specs)
+        with self._pools_lock:
+            reservation = self._add_consumed_capacity(pool_name, size, thin)
+            if scheduled:
+                pending = self._consumed_capacity[2]
+                key = (pool_name, size, thin)
+                pending[key] = pending.get(key, 0) + 1
+        return reservation
+
+    def _claim_reservation(self, pool_name, size, extra_specs=None):
+        """Return a scheduled reservation for a volume, or None if missing."""
+        thin = scheduler.is_thin(extra_specs)
+        key = (pool_name, size, thin)
+        with self._pools_lock:
+            self._get_consumed_capacity()
+            pending = self._consumed_capacity[2]
+            if not pending.get(key):
+                return None
+            pending[key] -= 1
+            return (self._consumed_capacity[0],) + key
+
+    def _release_capacity(self, volume):
+        """Release the capacity reserved for a volume that wasn't created."""
+        reservation, volume._reservation = volume._reservation, None
+        if not reservation:
+            return
+        stats_updated_at, pool_name, size, thin = reservation
+        with self._pools_lock:
+            # Refreshed stats have already discarded the reservation
+            if (self._consumed_capacity and
+                    self._consumed_capacity[0] == stats_updated_at):
+                consumed = self._consumed_capacity[1][pool_name]
+                consumed[0 if thin else 1] -= size
+
+    def _consume_capacity(self, volume):
+        """Account for a created volume's capacity until stats refresh."""
+        # The capacity was already reserved when the pool was selected
+        if volume._reservation:
+            volume._reservation = None
+            return
+        ovo = volume._ovo
+        pool_name = (ovo.host or '').partition('#')[2]
+        if not pool_name or not ovo.size:
+            return
+        extra_specs = None
+        # Don't trigger the lazy loading of the volume type
+        if ovo.obj_attr_is_set('volume_type') and ovo.volume_type:
+            extra_specs = ovo.volume_type.extra_specs
+        self._reserve_capacity(pool_name, ovo.size, extra_specs)
+
+    def select_pool(self, size, extra_specs=None):
+        """Return the name of the pool where a new volume should be placed.
+
+        The pool is selected by the backend's pool_selector using the cached
+        stats, taking into account the capacity used by the volumes created,
+        or being created, since the stats were gathered.
+        """
+        return self._select_pool(size, extra_specs)[0]
+
+    def _select_pool(self, size, extra_specs=None, reserve=False):
+        """Return the selected pool's name and the capacity reservation.
+
+        With reserve the volume's capacity is accounted for in the pool as
+        soon as it's selected, so volumes placed before the previous ones
+        have been created, like in create_volumes, don't all go to the same
+        pool.
+        """
+        stats = self.stats()
+        with self._pools_lock:
+            pools = self._consumed_pools(stats)
+            if not pools:
+                return self.pool_names[0], None
+            pool = self.pool_selector.select(self, pools, size, extra_specs)
+            reservation = None
+            if reserve and size:
+                reservation = self._add_consumed_capacity(
+                    pool['pool_name'], size, scheduler.is_thin(extra_specs))
+        return pool['pool_name'], reservation
+
+    @classmethod
+    def schedule_volume(cls, size, extra_specs=None, backends=None):
+        """Return the (backend, pool_name) where a new volume should go.
+
+        Backends default to all the initialized backends, and the selection
+        is made by the volume_scheduler using the cached stats.
+        """
+        if backends is None:
+            backends = list(cls.backends.values())
+        return cls.volume_scheduler.schedule(backends, size, extra_specs)
+
     def stats(self, refresh=False):
+        """Return the backend's stats.
+
+        When the background stats refresher is running this call never
+        blocks: it returns the last gathered stats, and a refresh request or
+        stats older than the refresher's TTL trigger an immediate refresh in
+        the background.
+        """
+        refresher = self._stats_refresher
+        if refresher:
+            age = self.stats_age
+            if refresh or (refresher.ttl is not None and
+                           (age is None or age > refresher.ttl)):
+                refresher.wakeup()
+            return self._stats
+
         # Some drivers don't implement the caching correctly, so we implement
         # it ourselves.
         if refresh:
-            stats = self.driver.get_volume_stats(refresh=refresh)
-            self._stats = self._transform_legacy_stats(stats)
-
+            return self._refresh_stats(refresh)
         return self._stats
 
+    @property
+    def stats_age(self):
+        """Seconds since the cached stats were gathered."""
+        if self._stats_updated_at is None:
+            return None
+        return time.time() - self._stats_updated_at
+
+    def start_stats_refresher(self, interval=60, ttl=None, jitter=0.1):
+        """Start refreshing the stats periodically in a background thread.
+
+        Stats are refreshed every interval seconds, randomly varied by the
+        jitter fraction to spread the refreshes of different backends, and
+        also when the stats method is called with refresh=True or when the
+        stats are older than ttl seconds.
+        """
+        self.stop_stats_refresher()
+        self._stats_refresher = _StatsRefresher(self, interval, ttl, jitter)
+        self._stats_refresher.start()
+
+    def stop_stats_refresher(self, wait=True):
+        """Stop the background stats refresher if it's running."""
+        refresher = self._stats_refresher
+        if refresher:
+            self._stats_refresher = None
+            refresher.stop()
+            if wait and refresher is not threading.current_thread():
+                refresher.join()
+
+    @property
+    def limiter(self):
+        """Limiter of the concurrent operations on the backend."""
+        if self._limiter is None:
+            with self._limiter_lock:
+                if self._limiter is None:
+                    self._limiter = limiter.OperationLimiter(
+                        self.operation_limits)
+        return self._limiter
+
+    def set_operation_limits(self, limits):
+        """Set the maximum concurrent operations of each type.
+
+        Operations already running or waiting keep the previous limits.
+        """
+        self._limiter = limiter.OperationLimiter(limits)
+
+    def _new_volume(self, size, name='', description='', bootable=False,
+                    **kwargs):
+        return objects.Volume(self, size=size, name=name,
+                              description=description, bootable=bootable,
+                              **kwargs)
+
     def create_volume(self, size, name='', description='', bootable=False,
                       **kwargs):
-        vol = objects.Volume(self, size=size, name=name,
-                             description=description, bootable=bootable,
-                             **kwargs)
+        vol = self._new_volume(size, name, description, bootable, **kwargs)
         vol.create()
         return vol
 
+    def create_volumes(self, volumes_specs, max_workers=None):
+        """Create multiple volumes calling the driver concurrently.
+
+        Each element in volumes_specs is a dictionary with the parameters we
+        would pass to create_volume.  Driver calls are made on a thread pool
+        of up to max_workers threads, and once they have all completed the
+        volumes are persisted in a single set_volumes call.
+
+        Returns a list, in the same order as volumes_specs, with the created
+        Volume or the exception raised on its creation, which will have the
+        volume in its resource attribute.  Invalid specs don't stop the
+        creation of the other volumes, and their element is the exception
+        raised when instantiating the volume.
+        """
+        result = [None] * len(volumes_specs)
+        volumes = []
+        futures = []
+        # Each volume is still reported as a create_volume operation
+        create = metrics.instrumented('create_volume')(objects.Volume._create)
+        with futurist.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for i, specs in enumerate(volumes_specs):
+                try:
+                    vol = self._new_volume(**specs)
+                except Exception as exc:
+                    LOG.error('Invalid volume specs %s: %s', specs, exc)
+                    result[i] = exc
+                    continue
+                volumes.append(vol)
+                futures.append((i, vol, executor.submit(create, vol)))
+
+        for i, vol, future in futures:
+            result[i] = future.exception() or vol
+        if volumes:
+            self.persistence.set_volumes(volumes)
+        return result
+
     def _volume_removed(self, volume):
-        i, vol = cinderlib_utils.find_by_id(volume.id, self._volumes)
-        if vol:
-            del self._volumes[i]
+        with self._volumes_lock:
+            cinderlib_utils.remove_by_id(volume.id, self._volumes)
+
+    def _creating_volume(self, volume):
+        """Context manager that tracks the volume while it's created."""
+        return self._volumes_inflight.track(volume)
 
     @classmethod
-    def _start_creating_volume(cls, volume):
-        cls._volumes_inflight[volume.id] = volume
+    def _get_inflight_volume(cls, volume_id):
+        """Return the volume with the id if it's being created, else None."""
+        for backend in list(cls.backends.values()):
+            volume = backend._volumes_inflight.get(volume_id)
+            if volume is not None:
+                return volume
+        return None
 
     def _volume_created(self, volume):
-        if self._volumes is not None:
-            self._volumes.append(volume)
-        self._volumes_inflight.pop(volume.id, None)
+        self._consume_capacity(volume)
+        # Volumes may be created concurrently, like in create_volumes
+        with self._volumes_lock:
+            if self._volumes is not None:
+                self._volumes.append(volume)
 
     def validate_connector(self, connector_dict):
         """Raise exception if missing info for volume's connect call."""
@@ -184,7 +625,9 @@ class Backend(object):
         objects.setup(cls.persistence, Backend, cls.project_id, cls.user_id,
                       cls.non_uuid_ids)
         for backend in cls.backends.values():
-            backend.driver.db = cls.persistence.db
+            # Drivers not set up yet will get the DB when they are set up
+            if 'driver' in backend.__dict__:
+                backend.driver.db = cls.persistence.db
 
         # Replace the standard DB implementation instance with the one from
         # the persistence plugin.
@@ -220,6 +663,7 @@ class Backend(object):
         cfg.CONF.set_default('state_path', os.getcwd())
         cfg.CONF.set_default('lock_path', '$state_path', 'oslo_concurrency')
 
+        cls._config_lock = threading.Lock()
         cls._parser = six.moves.configparser.SafeConfigParser()
         cls._parser.set('DEFAULT', 'enabled_backends', '')
 
@@ -269,51 +713,190 @@ class Backend(object):
                 val = six.text_type(val)
             cls._parser.set(section, key, val)
 
+    @classmethod
+    def _add_backend_section(cls, driver_cfg):
+        backend_name = driver_cfg['volume_backend_name']
+        if cls._parser.has_section(backend_name):
+            cls._parser.remove_section(backend_name)
+        cls._parser.add_section(backend_name)
+        cls.__set_parser_kv(driver_cfg, backend_name)
+
     def _set_backend_config(self, driver_cfg):
         backend_name = driver_cfg['volume_backend_name']
-        self._parser.add_section(backend_name)
-        self.__set_parser_kv(driver_cfg, backend_name)
-        self._parser.set('DEFAULT', 'enabled_backends',
-                         ','.join(self.backends.keys()))
-        self._update_cinder_config()
-        config = configuration.Configuration(manager.volume_backend_opts,
-                                             config_group=backend_name)
+        with self._config_lock:
+            # The configuration of the backend may have already been loaded
+            preloaded = self._preloaded_configs.pop(backend_name, None)
+            if preloaded and preloaded[0] == driver_cfg:
+                return preloaded[1]
+
+            self._add_backend_section(driver_cfg)
+            self._parser.set('DEFAULT', 'enabled_backends',
+                             ','.join(list(self.backends.keys())))
+            self._update_cinder_config()
+            config = configuration.Configuration(manager.volume_backend_opts,
+                                                 config_group=backend_name)
         return config
 
+    @classmethod
+    def _preload_configs(cls, backends_config):
+        """Load the configuration of multiple backends in a single reload."""
+        if not cls.global_initialization:
+            cls.global_setup()
+
+        backends_config = [dict(driver_cfg) for driver_cfg in backends_config]
+        with cls._config_lock:
+            enabled_backends = list(cls.backends.keys())
+            for driver_cfg in backends_config:
+                backend_name = driver_cfg['volume_backend_name']
+                cls._add_backend_section(driver_cfg)
+                if backend_name not in enabled_backends:
+                    enabled_backends.append(backend_name)
+            cls._parser.set('DEFAULT', 'enabled_backends',
+                            ','.join(enabled_backends))
+            cls._update_cinder_config()
+
+            for driver_cfg in backends_config:
+                backend_name = driver_cfg['volume_backend_name']
+                config = configuration.Configuration(
+                    manager.volume_backend_opts, config_group=backend_name)
+                cls._preloaded_configs[backend_name] = (dict(driver_cfg),
+                                                        config)
+        return backends_config
+
+    @classmethod
+    def _initialize(cls, driver_cfg):
+        """Create a backend setting up its driver even if it's lazy."""
+        backend = cls(**driver_cfg)
+        backend._setup_driver()
+        return backend
+
+    @classmethod
+    def setup_many(cls, backends_config):
+        """Initialize multiple backends reloading the configuration once.
+
+        Receives an iterable of dictionaries with the parameters we would
+        pass to the Backend's __init__, including volume_backend_name, and
+        returns a list with the Backends in the same order.
+
+        Initializing backends one by one reloads the configuration of all
+        existing backends every time, so this is considerably faster when
+        initializing a large number of them.
+        """
+        backends_config = cls._preload_configs(backends_config)
+        try:
+            return [cls._initialize(driver_cfg)
+                    for driver_cfg in backends_config]
+        finally:
+            cls._preloaded_configs.clear()
+
+    @classmethod
+    def initialize_all(cls, backends_config, max_workers=None):
+        """Initialize multiple backends concurrently.
+
+        Like setup_many, but drivers are imported and set up on a thread pool
+        of up to max_workers threads, and failing to initialize a backend
+        doesn't stop the initialization of the others.
+
+        Returns a list, in the same order as backends_config, with the
+        initialized Backend or the exception raised on its initialization.
+        """
+        previous_backends = cls.backends.copy()
+        backends_config = cls._preload_configs(backends_config)
+        try:
+            with futurist.ThreadPoolExecutor(
+                    max_workers=max_workers) as executor:
+                futures = [executor.submit(cls._initialize, driver_cfg)
+                           for driver_cfg in backends_config]
+        finally:
+            cls._preloaded_configs.clear()
+
+        result = []
+        for future, driver_cfg in zip(futures, backends_config):
+            exc = future.exception()
+            if exc:
+                backend_name = driver_cfg['volume_backend_name']
+                LOG.error('Error initializing backend %s: %s',
+                          backend_name, exc)
+                # Don't leave the failed backend registered
+                if backend_name in previous_backends:
+                    cls.backends[backend_name] = (
+                        previous_backends[backend_name])
+                else:
+                    cls.backends.pop(backend_name, None)
+            result.append(exc or future.result())
+        return result
+
     @classmethod
     def global_setup(cls, file_locks_path=None, root_helper='sudo',
                      suppress_requests_ssl_warnings=True, disable_logs=True,
                      non_uuid_ids=False, output_all_backend_info=False,
                      project_id=None, user_id=None, persistence_config=None,
                      fail_on_missing_backend=True, host=None,
+                     lazy_driver_setup=False, operation_limits=None,
+                     startup_profiling=False, collect_metrics=False,
                      **cinder_config_params):
         # Global setup can only be set once
         if cls.global_initialization:
             raise Exception('Already setup')
 
+        cls.startup_profiling = startup_profiling
+        timer = cinderlib_utils.PhaseTimer(startup_profiling)
+        if timer.enabled:
+            cls._global_timer = timer
+
         cls.fail_on_missing_backend = fail_on_missing_backend
+        cls.lazy_driver_setup = lazy_driver_setup
+        # Fail early on invalid limits, as backends create their limiter later
+        limiter.OperationLimiter(operation_limits)
+        cls.operation_limits = operation_limits
         cls.root_helper = root_helper
         cls.project_id = project_id
         cls.user_id = user_id
         cls.non_uuid_ids = non_uuid_ids
 
-        cls.set_persistence(persistence_config)
-        cls._set_cinder_config(host, file_locks_path, cinder_config_params)
+        with timer.phase('persistence'):
+            cls.set_persistence(persistence_config)
+        with timer.phase('cinder_config'):
+            cls._set_cinder_config(host, file_locks_path,
+                                   cinder_config_params)
 
-        serialization.setup(cls)
+        with timer.phase('serialization'):
+            serialization.setup(cls)
 
-        cls._set_logging(disable_logs)
-        cls._set_priv_helper(root_helper)
-        coordination.COORDINATOR.start()
+        with timer.phase('logging'):
+            cls._set_logging(disable_logs)
+        with timer.phase('priv_helper'):
+            cls._set_priv_helper(root_helper)
+        with timer.phase('coordination'):
+            coordination.COORDINATOR.start()
 
         if suppress_requests_ssl_warnings:
             urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
             urllib3.disable_warnings(
                 urllib3.exceptions.InsecurePlatformWarning)
 
+        if collect_metrics:
+            metrics.enable()
+
         cls.global_initialization = True
         cls.output_all_backend_info = output_all_backend_info
 
+    @classmethod
+    def startup_report(cls):
+        """Return the duration of the setup phases of cinderlib and backends.
+
+        Phases are only recorded when cinderlib is set up with
+        startup_profiling=True.  The report has the global_setup phases and
+        the phases of the setup of each backend's driver, which happens on
+        first use for lazy backends.
+        """
+        timer = cls._global_timer
+        return {
+            'global_setup': timer.report() if timer else None,
+            'backends': {name: backend._startup_timer.report()
+                         for name, backend in list(cls.backends.items())
+                         if backend._startup_timer}}
+
     @classmethod
     def _set_logging(cls, disable_logs):
         if disable_logs:
@@ -335,16 +918,22 @@ class Backend(object):
             return self._driver_cfg
         return {'volume_backend_name': self._driver_cfg['volume_backend_name']}
 
-    def _serialize(self, property_name):
-        result = [getattr(volume, property_name) for volume in self.volumes]
+    def _serialize_volumes(self, property_name):
+        """Generate the serialized volumes of this backend one at a time."""
         # We only need to output the full backend configuration once
+        backend = None
         if self.output_all_backend_info:
             backend = {'volume_backend_name': self.id}
-            for volume in result:
-                volume['backend'] = backend
+        for volume in self.volumes:
+            result = getattr(volume, property_name)
+            if backend:
+                result['backend'] = backend
+            yield result
+
+    def _serialize(self, property_name):
         return {'class': type(self).__name__,
                 'backend': self.config,
-                'volumes': result}
+                'volumes': list(self._serialize_volumes(property_name))}
 
     @property
     def json(self):
@@ -362,12 +951,21 @@ class Backend(object):
     def dumps(self):
         return json_lib.dumps(self.dump)
 
+    @property
+    def jsonb(self):
+        return cinderlib_utils.packb(self.json)
+
+    @property
+    def dumpb(self):
+        return cinderlib_utils.packb(self.dump)
+
     @classmethod
     def load(cls, json_src, save=False):
         backend = Backend.load_backend(json_src['backend'])
         volumes = json_src.get('volumes')
         if volumes:
-            backend._volumes = [objects.Volume.load(v, save) for v in volumes]
+            backend._volumes = cinderlib_utils.IdList(
+                objects.Volume.load(v, save) for v in volumes)
         return backend
 
     @classmethod
@@ -384,14 +982,14 @@ class Backend(object):
 
         return backend_name
 
-    def refresh(self):
+    def refresh(self, eager_load=False):
         if self._volumes is not None:
-            self._volumes = None
-            self.volumes
+            self._volumes = self._get_volumes(eager_load or
+                                              self.eager_load_volumes)
 
     @staticmethod
-    def list_supported_drivers():
-        """Returns dictionary with driver classes names as keys."""
+    def _load_supported_drivers():
+        """Return dictionary with the information of all Cinder drivers."""
 
         def convert_oslo_config(oslo_options):
             options = []
@@ -427,6 +1025,125 @@ class Backend(object):
         p.join()
         return result
 
+    @classmethod
+    def _get_drivers_cache_key(cls):
+        """Return a key that changes whenever installed drivers change.
+
+        Looking at every driver file is slow, so the key is only computed the
+        first time, or again after listing the drivers with use_cache=False.
+        """
+        if not cls._drivers_cache_key:
+            cls._drivers_cache_key = cls._compute_drivers_cache_key()
+        return cls._drivers_cache_key
+
+    @staticmethod
+    def _compute_drivers_cache_key():
+        # Slow to import, and only needed to list the drivers
+        import pkg_resources
+
+        cinder_dir = os.path.dirname(utils.__file__)
+        try:
+            cinder_version = pkg_resources.get_distribution('cinder').version
+        except pkg_resources.DistributionNotFound:
+            cinder_version = None
+
+        num_files = last_mtime = 0
+        drivers_dir = os.path.join(cinder_dir, 'volume', 'drivers')
+        for dirpath, dirnames, filenames in os.walk(drivers_dir):
+            for filename in filenames:
+                if filename.endswith('.py'):
+                    num_files += 1
+                    mtime = os.path.getmtime(os.path.join(dirpath, filename))
+                    last_mtime = max(last_mtime, mtime)
+
+        key = json_lib.dumps([cinderlib.__version__, cinder_version,
+                              cinder_dir, num_files, last_mtime])
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def _get_drivers_cache_file(cls):
+        cache_dir = cls.drivers_cache_dir
+        if not cache_dir:
+            cache_dir = os.path.join(
+                os.environ.get('XDG_CACHE_HOME') or
+                os.path.join(os.path.expanduser('~'), '.cache'),
+                'cinderlib')
+        return os.path.join(cache_dir, 'supported_drivers.json')
+
+    @classmethod
+    def _read_drivers_cache(cls, key):
+        if cls._supported_drivers and cls._supported_drivers[0] == key:
+            return cls._supported_drivers[1]
+
+        try:
+            with open(cls._get_drivers_cache_file(), 'r') as f:
+                cached = json_lib.load(f)
+            if cached['key'] == key:
+                cls._supported_drivers = (key, cached['drivers'])
+                return cached['drivers']
+        except (IOError, OSError, ValueError, KeyError, TypeError) as exc:
+            LOG.debug('Cannot use supported drivers cache: %s', exc)
+        return None
+
+    @classmethod
+    def _write_drivers_cache(cls, key, drivers):
+        cls._supported_drivers = (key, drivers)
+        filename = cls._get_drivers_cache_file()
+        try:
+            cache_dir = os.path.dirname(filename)
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            # Write to a temporary file and rename it to make it atomic
+            fd, tmp_filename = tempfile.mkstemp(dir=cache_dir)
+            with os.fdopen(fd, 'w') as f:
+                json_lib.dump({'key': key, 'drivers': drivers}, f)
+            os.rename(tmp_filename, filename)
+        except (IOError, OSError) as exc:
+            LOG.warning('Cannot write supported drivers cache %s: %s',
+                        filename, exc)
+
+    @classmethod
+    def list_supported_drivers(cls, driver_names=None, vendor=None,
+                               fields=None, use_cache=True):
+        """Returns dictionary with driver classes names as keys.
+
+        Information is cached on memory and on disk, in drivers_cache_dir, and
+        it's only gathered again when the installed drivers change between
+        processes or if use_cache is False.
+
+        Results can be filtered by the drivers' class names, by vendor, which
+        is the name of the package of the driver in cinder.volume.drivers, and
+        the drivers' information can be limited to specific fields.
+        """
+        drivers = None
+        if use_cache:
+            key = cls._get_drivers_cache_key()
+            drivers = cls._read_drivers_cache(key)
+        else:
+            # Installed drivers may have changed since we computed the key
+            cls._drivers_cache_key = None
+
+        if drivers is None:
+            drivers = cls._load_supported_drivers()
+            if use_cache:
+                cls._write_drivers_cache(key, drivers)
+
+        if driver_names is not None:
+            driver_names = set(driver_names)
+        vendor_prefix = vendor and 'cinder.volume.drivers.%s.' % vendor
+
+        result = {}
+        for name, info in drivers.items():
+            if driver_names is not None and name not in driver_names:
+                continue
+            if (vendor_prefix and
+                    not info.get('class_fqn', '').startswith(vendor_prefix)):
+                continue
+            # Copy the values so callers cannot modify the cached data
+            result[name] = {k: copy.deepcopy(v) for k, v in info.items()
+                            if fields is None or k in fields}
+        return result
+
 
 setup = Backend.global_setup
 # Used by serialization.load
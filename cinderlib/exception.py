@@ -21,6 +21,7 @@ VolumeNotFound = exception.VolumeNotFound
 SnapshotNotFound = exception.SnapshotNotFound
 ConnectionNotFound = exception.VolumeAttachmentNotFound
 InvalidVolume = exception.InvalidVolume
+NoValidBackend = exception.NoValidBackend
 
 
 class InvalidPersistence(Exception):
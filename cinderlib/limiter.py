@@ -0,0 +1,150 @@
+# Copyright (c) 2019, Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Limits on the number of concurrent operations on a backend.
+
+Operations that exceed their limit wait in FIFO order, so operations are
+never starved, and the limiter keeps track of the number of operations in
+flight and waiting for each type of operation.
+"""
+
+import collections
+import threading
+import time
+
+OPERATIONS = ('create_volume', 'delete_volume', 'extend_volume',
+              'clone_volume', 'create_snapshot', 'delete_snapshot',
+              'create_volume_from_snapshot', 'connect', 'disconnect')
+# Key in the limits for the operations that don't have a specific limit
+DEFAULT = 'default'
+
+
+def check_limit(limit):
+    """Raise ValueError if the limit is not None or a positive integer."""
+    if limit is not None and limit < 1:
+        raise ValueError('Operation limits must be at least 1, got %s' %
+                         limit)
+
+
+class FairSemaphore(object):
+    """Semaphore that wakes up waiting threads in FIFO order.
+
+    A limit of None means there's no limit, but operations are still
+    accounted for.  Limits below 1 raise ValueError, as no operation could
+    ever run.
+    """
+
+    def __init__(self, limit=None):
+        check_limit(limit)
+        self.limit = limit
+        self._available = limit
+        self._waiters = collections.deque()
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.total = 0
+        self.waited = 0
+        self.max_waiting = 0
+        self.wait_time = 0.0
+
+    def acquire(self):
+        with self._lock:
+            self.total += 1
+            # Only take a free slot if nobody is waiting to keep the order
+            if self.limit is None or (self._available and not self._waiters):
+                if self.limit is not None:
+                    self._available -= 1
+                self.in_flight += 1
+                return
+
+            waiter = threading.Lock()
+            waiter.acquire()
+            self._waiters.append(waiter)
+            self.waited += 1
+            self.max_waiting = max(self.max_waiting, len(self._waiters))
+
+        start = time.time()
+        # Released by the thread that hands us its slot
+        waiter.acquire()
+        with self._lock:
+            self.wait_time += time.time() - start
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                # Hand the slot directly to the first waiter
+                self._waiters.popleft().release()
+                return
+            self.in_flight -= 1
+            if self.limit is not None:
+                self._available += 1
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    def stats(self):
+        """Return a dictionary with the limit and the usage counters."""
+        with self._lock:
+            return {'limit': self.limit,
+                    'in_flight': self.in_flight,
+                    'waiting': len(self._waiters),
+                    'max_waiting': self.max_waiting,
+                    'total': self.total,
+                    'waited': self.waited,
+                    'wait_time': self.wait_time}
+
+
+class OperationLimiter(object):
+    """Limit the concurrent operations of each type on a backend.
+
+    Limits is a dictionary with the maximum number of concurrent operations
+    for each operation type, and the "default" key sets the limit for the
+    types without a specific one.  Missing limits mean no limit, and limits
+    below 1 raise ValueError.
+    """
+
+    def __init__(self, limits=None):
+        self.limits = dict(limits or {})
+        for limit in self.limits.values():
+            check_limit(limit)
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def _get_semaphore(self, operation):
+        semaphore = self._semaphores.get(operation)
+        if semaphore is None:
+            with self._lock:
+                semaphore = self._semaphores.get(operation)
+                if semaphore is None:
+                    limit = self.limits.get(operation,
+                                            self.limits.get(DEFAULT))
+                    semaphore = FairSemaphore(limit)
+                    self._semaphores[operation] = semaphore
+        return semaphore
+
+    def limit(self, operation):
+        """Return a context manager that runs within the operation limit."""
+        return self._get_semaphore(operation)
+
+    def stats(self):
+        """Return the usage counters of each operation type used so far."""
+        return {operation: semaphore.stats()
+                for operation, semaphore in list(self._semaphores.items())}
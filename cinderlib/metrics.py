@@ -0,0 +1,360 @@
+# Copyright (c) 2019, Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Latency metrics and tracing hooks for the resources' operations.
+
+When enabled, every operation on a resource (create a volume, connect it,
+delete a snapshot...) records its duration, its outcome, and how much of that
+time was spent in each phase:
+
+- driver: Calls to the storage driver.
+- persistence: Calls to the persistence plugin.
+- connector: Calls to os-brick to attach and detach volumes on this host.
+
+The time not accounted for in any phase is spent waiting for the operation
+limits and in cinderlib itself.
+
+Durations are aggregated in histograms per backend, operation, and phase,
+which can be exported in the Prometheus text format, and callbacks receive
+an OperationEvent for each operation, which can be used to create tracing
+spans or feed other metrics systems.
+
+Metrics are disabled by default, and when disabled the instrumentation has
+no measurable overhead.
+"""
+
+import collections
+import contextlib
+import functools
+import os
+import tempfile
+import threading
+import time
+
+from oslo_log import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+PHASES = ('driver', 'persistence', 'connector')
+SUCCESS = 'success'
+ERROR = 'error'
+# Storage operations can take minutes, so we go beyond Prometheus defaults
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0, 120.0, 300.0, float('inf'))
+
+OperationEvent = collections.namedtuple(
+    'OperationEvent',
+    ('backend', 'operation', 'resource_id', 'outcome', 'error', 'start',
+     'duration', 'phases'))
+OperationEvent.__doc__ = """Data of a finished operation given to callbacks.
+
+Start is the epoch time when the operation started, duration and the values
+of the phases dictionary are in seconds, and error is the name of the
+exception class when the outcome is "error".
+"""
+
+
+class Histogram(object):
+    """Cumulative histogram like the ones in Prometheus.
+
+    Not thread-safe, the registry serializes the observations.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class _NullContext(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NULL_CONTEXT = _NullContext()
+
+
+class _Operation(object):
+    """Track the time spent in each phase of an operation.
+
+    Phases are exclusive, so entering a phase pauses the one that is running
+    until we exit the new phase.
+    """
+
+    def __init__(self, backend, operation, resource_id):
+        self.backend = backend
+        self.operation = operation
+        self.resource_id = resource_id
+        self.phases = {}
+        self._phase = None
+        self._phase_start = None
+        self.start = time.time()
+
+    def _switch(self, phase):
+        now = time.time()
+        if self._phase:
+            self.phases[self._phase] = (self.phases.get(self._phase, 0.0) +
+                                        now - self._phase_start)
+        self._phase = phase
+        self._phase_start = now
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        previous = self._phase
+        self._switch(name)
+        try:
+            yield
+        finally:
+            self._switch(previous)
+
+    def event(self, exc_type):
+        return OperationEvent(self.backend, self.operation, self.resource_id,
+                              ERROR if exc_type else SUCCESS,
+                              exc_type and exc_type.__name__, self.start,
+                              time.time() - self.start, self.phases)
+
+
+class Registry(object):
+    """Aggregate operation durations and call the registered callbacks."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.enabled = False
+        self.buckets = buckets
+        self.callbacks = []
+        self._operations = {}
+        self._phases = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        try:
+            return self._local.operations
+        except AttributeError:
+            self._local.operations = []
+            return self._local.operations
+
+    @contextlib.contextmanager
+    def operation(self, backend, operation, resource_id=None):
+        """Context manager to measure an operation on a backend.
+
+        Operations can be nested, and phases are accounted to the innermost
+        operation.
+        """
+        op = _Operation(backend, operation, resource_id)
+        stack = self._stack()
+        stack.append(op)
+        exc_type = None
+        try:
+            yield op
+        except BaseException as exc:
+            exc_type = type(exc)
+            raise
+        finally:
+            stack.pop()
+            self.record(op.event(exc_type))
+
+    def phase(self, name):
+        """Context manager to account time to a phase of current operation.
+
+        Does nothing if metrics are disabled or there's no operation running
+        in this thread.
+        """
+        if not self.enabled:
+            return _NULL_CONTEXT
+        stack = self._stack()
+        if not stack:
+            return _NULL_CONTEXT
+        return stack[-1].phase(name)
+
+    def record(self, event):
+        """Add an operation event to the histograms and call the callbacks."""
+        with self._lock:
+            key = (event.backend, event.operation, event.outcome)
+            hist = self._operations.get(key)
+            if hist is None:
+                hist = self._operations[key] = Histogram(self.buckets)
+            hist.observe(event.duration)
+
+            for phase, duration in event.phases.items():
+                key = (event.backend, event.operation, phase)
+                hist = self._phases.get(key)
+                if hist is None:
+                    hist = self._phases[key] = Histogram(self.buckets)
+                hist.observe(duration)
+
+        for callback in list(self.callbacks):
+            try:
+                callback(event)
+            except Exception:
+                LOG.exception('Metrics callback %s failed', callback)
+
+    def add_callback(self, callback):
+        """Call callback with an OperationEvent after each operation."""
+        self.callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        self.callbacks.remove(callback)
+
+    def reset(self):
+        """Discard the data of the histograms."""
+        with self._lock:
+            self._operations.clear()
+            self._phases.clear()
+
+    def histograms(self):
+        """Return copies of the histograms.
+
+        Returns a tuple with 2 dictionaries, one with the operations'
+        histograms with (backend, operation, outcome) keys, and one with the
+        phases' histograms with (backend, operation, phase) keys.
+        """
+        def copy(histograms):
+            result = {}
+            for key, hist in histograms.items():
+                new = result[key] = Histogram(hist.buckets)
+                new.counts = list(hist.counts)
+                new.count = hist.count
+                new.sum = hist.sum
+            return result
+
+        with self._lock:
+            return copy(self._operations), copy(self._phases)
+
+    def export_prometheus(self):
+        """Return the histograms in the Prometheus text exposition format."""
+        operations, phases = self.histograms()
+        lines = []
+        _prometheus_histogram(
+            lines, 'cinderlib_operation_duration_seconds',
+            'Duration of the operations on cinderlib resources.',
+            ('backend', 'operation', 'outcome'), operations)
+        _prometheus_histogram(
+            lines, 'cinderlib_operation_phase_duration_seconds',
+            'Time spent on each phase of the operations on cinderlib '
+            'resources.',
+            ('backend', 'operation', 'phase'), phases)
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """Atomically write the Prometheus text format to a file.
+
+        Meant for the node exporter's textfile collector and other tools
+        that read the metrics from disk.
+        """
+        data = self.export_prometheus()
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                        prefix='.cinderlib-metrics')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+            os.rename(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('\n', '\\n')
+            .replace('"', '\\"'))
+
+
+def _format(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def _prometheus_histogram(lines, name, help_text, label_names, histograms):
+    lines.append('# HELP %s %s' % (name, help_text))
+    lines.append('# TYPE %s histogram' % name)
+    for key in sorted(histograms):
+        hist = histograms[key]
+        labels = ','.join('%s="%s"' % (label, _escape(value))
+                          for label, value in zip(label_names, key))
+        for upper, count in zip(hist.buckets, hist.counts):
+            lines.append('%s_bucket{%s,le="%s"} %d' %
+                         (name, labels, _format(upper), count))
+        lines.append('%s_sum{%s} %s' % (name, labels, _format(hist.sum)))
+        lines.append('%s_count{%s} %d' % (name, labels, hist.count))
+
+
+REGISTRY = Registry()
+
+
+def instrumented(operation):
+    """Decorator that measures a resource method as an operation.
+
+    The resource's backend id and resource id are used for the event.  The
+    backend may just be a name if the resource was loaded before its backend
+    was set up.
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(self, *args, **kwargs):
+            if not REGISTRY.enabled:
+                return f(self, *args, **kwargs)
+            backend_id = getattr(self.backend, 'id', self.backend)
+            with REGISTRY.operation(backend_id, operation, self.id):
+                return f(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def phase(name):
+    """Context manager to account time to a phase of the current operation."""
+    return REGISTRY.phase(name)
+
+
+def enable():
+    REGISTRY.enabled = True
+
+
+def disable():
+    REGISTRY.enabled = False
+
+
+def add_callback(callback):
+    """Call callback with an OperationEvent after each operation."""
+    REGISTRY.add_callback(callback)
+
+
+def remove_callback(callback):
+    REGISTRY.remove_callback(callback)
+
+
+def reset():
+    """Discard the collected metrics."""
+    REGISTRY.reset()
+
+
+def export_prometheus():
+    """Return the collected metrics in the Prometheus text format."""
+    return REGISTRY.export_prometheus()
+
+
+def write_prometheus(path):
+    """Atomically write the collected metrics in Prometheus text format."""
+    REGISTRY.write_prometheus(path)
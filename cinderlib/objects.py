@@ -14,6 +14,7 @@
 #    under the License.
 
 from __future__ import absolute_import
+import importlib
 import json as json_lib
 import sys
 import uuid
@@ -31,6 +32,7 @@ from oslo_utils import timeutils
 import six
 
 from cinderlib import exception
+from cinderlib import metrics
 from cinderlib import utils
 
 
@@ -45,6 +47,24 @@ CONNECTIONS_OVO_FIELD = 'volume_attachment'
 cinder_objs.register_all()
 
 
+def load_backend_class():
+    """Make sure the Backend class is available to the objects.
+
+    cinderlib's lazy imports may not have imported the module that defines
+    the Backend class, which registers itself in this module, when we use
+    the serialization before initializing cinderlib.
+    """
+    if Object.backend_class is None:
+        importlib.import_module('cinderlib.cinderlib')
+
+
+def _index_ovo_list(ovo_list):
+    """Store the elements of an OVO list in an IdList."""
+    # Assigning the objects field would coerce the IdList into a list
+    ovo_list._obj_objects = utils.IdList(ovo_list.objects)
+    return ovo_list
+
+
 class KeyValue(object):
     def __init__(self, key=None, value=None):
         self.key = key
@@ -66,6 +86,7 @@ class Object(object):
                                      overwrite=False)
 
     def _get_backend(self, backend_name_or_obj):
+        load_backend_class()
         if isinstance(backend_name_or_obj, six.string_types):
             try:
                 return self.backend_class.backends[backend_name_or_obj]
@@ -164,24 +185,18 @@ class Object(object):
         json_data = self.to_json(simplified)
         return json_lib.dumps(json_data, separators=(',', ':'))
 
-    def _only_ovo_data(self, ovo):
-        if isinstance(ovo, dict):
-            if 'versioned_object.data' in ovo:
-                value = ovo['versioned_object.data']
-                if ['objects'] == value.keys():
-                    return self._only_ovo_data(value['objects'])
-                key = ovo['versioned_object.name'].lower()
-                return {key: self._only_ovo_data(value)}
-
-            for key in ovo.keys():
-                ovo[key] = self._only_ovo_data(ovo[key])
-        if isinstance(ovo, list) and ovo:
-            return [self._only_ovo_data(e) for e in ovo]
-        return ovo
+    @property
+    def jsonb(self):
+        return self.to_jsonb(simplified=False)
+
+    def to_jsonb(self, simplified=True):
+        """Return the Json serialization in the compact binary format."""
+        return utils.packb(self.to_json(simplified))
 
     def to_dict(self):
-        json_ovo = self.json
-        return self._only_ovo_data(json_ovo['ovo'])
+        # Serialization imports this module, so import it on use
+        from cinderlib import serialization
+        return serialization.obj_to_dict(self._ovo)
 
     @property
     def dump(self):
@@ -194,6 +209,10 @@ class Object(object):
     def dumps(self):
         return json_lib.dumps(self.dump, separators=(',', ':'))
 
+    @property
+    def dumpb(self):
+        return utils.packb(self.dump)
+
     def __repr__(self):
         backend = self.backend
         if isinstance(self.backend, self.backend_class):
@@ -203,6 +222,7 @@ class Object(object):
 
     @classmethod
     def load(cls, json_src, save=False):
+        load_backend_class()
         backend = cls.backend_class.load_backend(json_src['backend'])
         ovo = cinder_base_ovo.CinderObject.obj_from_primitive(json_src['ovo'],
                                                               cls.CONTEXT)
@@ -292,6 +312,8 @@ class Volume(NamedObject):
         'glance_metadata': {},
     }
     LAZY_PROPERTIES = ('snapshots', 'connections')
+    # Capacity reserved in the backend's pool when the pool was selected
+    _reservation = None
 
     _ignore_keys = ('id', CONNECTIONS_OVO_FIELD, 'snapshots', 'volume_type')
 
@@ -324,8 +346,8 @@ class Volume(NamedObject):
                 cinder_objs.VolumeAttachmentList(context=self.CONTEXT))
             kwargs['snapshots'] = (
                 cinder_objs.SnapshotList(context=self.CONTEXT))
-            self._snapshots = []
-            self._connections = []
+            self._snapshots = utils.IdList()
+            self._connections = utils.IdList()
 
         qos_specs = kwargs.pop('qos_specs', None)
         extra_specs = kwargs.pop('extra_specs', {})
@@ -337,8 +359,14 @@ class Volume(NamedObject):
         # If we overwrote the host, then we ignore pool_name and don't set a
         # default value or copy the one from the source either.
         if 'host' not in kwargs and '__ovo' not in kwargs:
-            # TODO(geguileo): Add pool support
-            pool_name = pool_name or backend_or_vol.pool_names[0]
+            size = kwargs.get('size') or 0
+            if not pool_name:
+                pool_name, self._reservation = backend_or_vol._select_pool(
+                    size, extra_specs, reserve=True)
+            elif isinstance(backend_or_vol, self.backend_class):
+                # The scheduler may have reserved the capacity in the pool
+                self._reservation = backend_or_vol._claim_reservation(
+                    pool_name, size, extra_specs)
             self._ovo.host = ('%s@%s#%s' %
                               (cfg.CONF.host, backend_name, pool_name))
 
@@ -365,12 +393,14 @@ class Volume(NamedObject):
     def snapshots(self):
         # Lazy loading
         if self._snapshots is None:
-            self._snapshots = self.persistence.get_snapshots(volume_id=self.id)
+            self._snapshots = utils.IdList(
+                self.persistence.get_snapshots(volume_id=self.id))
             for snap in self._snapshots:
                 snap.volume = self
 
             ovos = [snap._ovo for snap in self._snapshots]
             self._ovo.snapshots = cinder_objs.SnapshotList(objects=ovos)
+            _index_ovo_list(self._ovo.snapshots)
             self._ovo.obj_reset_changes(('snapshots',))
         return self._snapshots
 
@@ -378,13 +408,14 @@ class Volume(NamedObject):
     def connections(self):
         # Lazy loading
         if self._connections is None:
-            self._connections = self.persistence.get_connections(
-                volume_id=self.id)
+            self._connections = utils.IdList(
+                self.persistence.get_connections(volume_id=self.id))
             for conn in self._connections:
                 conn.volume = self
             ovos = [conn._ovo for conn in self._connections]
             setattr(self._ovo, CONNECTIONS_OVO_FIELD,
                     cinder_objs.VolumeAttachmentList(objects=ovos))
+            _index_ovo_list(getattr(self._ovo, CONNECTIONS_OVO_FIELD))
             self._ovo.obj_reset_changes((CONNECTIONS_OVO_FIELD,))
 
         return self._connections
@@ -402,8 +433,8 @@ class Volume(NamedObject):
 
     def _populate_data(self):
         if self._ovo.obj_attr_is_set('snapshots'):
-            self._snapshots = []
-            for snap_ovo in self._ovo.snapshots:
+            self._snapshots = utils.IdList()
+            for snap_ovo in _index_ovo_list(self._ovo.snapshots):
                 # Set circular reference
                 snap_ovo.volume = self._ovo
                 Snapshot._load(self.backend, snap_ovo, self)
@@ -411,8 +442,9 @@ class Volume(NamedObject):
             self._snapshots = None
 
         if self._ovo.obj_attr_is_set(CONNECTIONS_OVO_FIELD):
-            self._connections = []
-            for conn_ovo in getattr(self._ovo, CONNECTIONS_OVO_FIELD):
+            self._connections = utils.IdList()
+            for conn_ovo in _index_ovo_list(getattr(self._ovo,
+                                                    CONNECTIONS_OVO_FIELD)):
                 # Set circular reference
                 conn_ovo.volume = self._ovo
                 Connection._load(self.backend, conn_ovo, self)
@@ -434,50 +466,54 @@ class Volume(NamedObject):
                     c.save()
         return vol
 
+    @metrics.instrumented('create_volume')
     def create(self):
-        self.backend._start_creating_volume(self)
         try:
-            model_update = self.backend.driver.create_volume(self._ovo)
-            self._ovo.status = 'available'
-            if model_update:
-                self._ovo.update(model_update)
-            self.backend._volume_created(self)
+            self._create()
+        finally:
+            self.save()
+
+    def _create(self):
+        """Create the volume on the backend without persisting it."""
+        try:
+            with self.backend._creating_volume(self):
+                with self.backend.limiter.limit('create_volume'), \
+                        metrics.phase('driver'):
+                    model_update = self.backend.driver.create_volume(
+                        self._ovo)
+                self._ovo.status = 'available'
+                if model_update:
+                    self._ovo.update(model_update)
+                self.backend._volume_created(self)
         except Exception:
             self._ovo.status = 'error'
+            self.backend._release_capacity(self)
             self._raise_with_resource()
-        finally:
-            self.save()
 
     def _snapshot_removed(self, snapshot):
         # The snapshot instance in memory could be out of sync and not be
         # identical, so check by ID.
-        i, snap = utils.find_by_id(snapshot.id, self._snapshots)
-        if snap:
-            del self._snapshots[i]
-
-        i, ovo = utils.find_by_id(snapshot.id, self._ovo.snapshots.objects)
-        if ovo:
-            del self._ovo.snapshots.objects[i]
+        utils.remove_by_id(snapshot.id, self._snapshots)
+        utils.remove_by_id(snapshot.id, self._ovo.snapshots.objects)
 
     def _connection_removed(self, connection):
         # The connection instance in memory could be out of sync and not be
         # identical, so check by ID.
-        i, conn = utils.find_by_id(connection.id, self._connections)
-        if conn:
-            del self._connections[i]
-
+        utils.remove_by_id(connection.id, self._connections)
         ovo_conns = getattr(self._ovo, CONNECTIONS_OVO_FIELD).objects
-        i, ovo_conn = utils.find_by_id(connection.id, ovo_conns)
-        if ovo_conn:
-            del ovo_conns[i]
+        utils.remove_by_id(connection.id, ovo_conns)
 
+    @metrics.instrumented('delete_volume')
     def delete(self):
         if self.snapshots:
             msg = 'Cannot delete volume %s with snapshots' % self.id
             raise exception.InvalidVolume(reason=msg)
         try:
-            self.backend.driver.delete_volume(self._ovo)
-            self.persistence.delete_volume(self)
+            with self.backend.limiter.limit('delete_volume'), \
+                    metrics.phase('driver'):
+                self.backend.driver.delete_volume(self._ovo)
+            with metrics.phase('persistence'):
+                self.persistence.delete_volume(self)
             self.backend._volume_removed(self)
             self._ovo.status = 'deleted'
         except Exception:
@@ -485,12 +521,15 @@ class Volume(NamedObject):
             self.save()
             self._raise_with_resource()
 
+    @metrics.instrumented('extend_volume')
     def extend(self, size):
         volume = self._ovo
         volume.previous_status = volume.status
         volume.status = 'extending'
         try:
-            self.backend.driver.extend_volume(volume, size)
+            with self.backend.limiter.limit('extend_volume'), \
+                    metrics.phase('driver'):
+                self.backend.driver.extend_volume(volume, size)
             volume.size = size
             volume.status = volume.previous_status
             volume.previous_status = None
@@ -500,19 +539,23 @@ class Volume(NamedObject):
         finally:
             self.save()
 
+    @metrics.instrumented('clone_volume')
     def clone(self, **new_vol_attrs):
         new_vol_attrs['source_vol_id'] = self.id
         new_vol = Volume(self, **new_vol_attrs)
-        self.backend._start_creating_volume(new_vol)
         try:
-            model_update = self.backend.driver.create_cloned_volume(
-                new_vol._ovo, self._ovo)
-            new_vol.status = 'available'
-            if model_update:
-                new_vol.update(model_update)
-            self.backend._volume_created(new_vol)
+            with self.backend._creating_volume(new_vol):
+                with self.backend.limiter.limit('clone_volume'), \
+                        metrics.phase('driver'):
+                    model_update = self.backend.driver.create_cloned_volume(
+                        new_vol._ovo, self._ovo)
+                new_vol.status = 'available'
+                if model_update:
+                    new_vol.update(model_update)
+                self.backend._volume_created(new_vol)
         except Exception:
             new_vol.status = 'error'
+            self.backend._release_capacity(new_vol)
             new_vol._raise_with_resource()
         finally:
             new_vol.save()
@@ -560,25 +603,29 @@ class Volume(NamedObject):
         if exc and not ignore_errors:
             raise exc
 
+    @metrics.instrumented('connect')
     def connect(self, connector_dict, **ovo_fields):
-        model_update = self.backend.driver.create_export(self.CONTEXT,
-                                                         self._ovo,
-                                                         connector_dict)
-        if model_update:
-            self._ovo.update(model_update)
-            self.save()
+        with self.backend.limiter.limit('connect'):
+            with metrics.phase('driver'):
+                model_update = self.backend.driver.create_export(
+                    self.CONTEXT, self._ovo, connector_dict)
+            if model_update:
+                self._ovo.update(model_update)
+                self.save()
 
-        try:
-            conn = Connection.connect(self, connector_dict, **ovo_fields)
-            if self._connections is not None:
-                self._connections.append(conn)
-                ovo_conns = getattr(self._ovo, CONNECTIONS_OVO_FIELD).objects
-                ovo_conns.append(conn._ovo)
-            self._ovo.status = 'in-use'
-            self.save()
-        except Exception:
-            self._remove_export()
-            self._raise_with_resource()
+            try:
+                conn = Connection.connect(self, connector_dict,
+                                          **ovo_fields)
+                if self._connections is not None:
+                    self._connections.append(conn)
+                    ovo_conns = getattr(self._ovo,
+                                        CONNECTIONS_OVO_FIELD).objects
+                    ovo_conns.append(conn._ovo)
+                self._ovo.status = 'in-use'
+                self.save()
+            except Exception:
+                self._remove_export()
+                self._raise_with_resource()
         return conn
 
     def _disconnect(self, connection):
@@ -589,9 +636,11 @@ class Volume(NamedObject):
             self._ovo.status = 'available'
             self.save()
 
+    @metrics.instrumented('disconnect')
     def disconnect(self, connection, force=False):
-        connection._disconnect(force)
-        self._disconnect(connection)
+        with self.backend.limiter.limit('disconnect'):
+            connection._disconnect(force)
+            self._disconnect(connection)
 
     def cleanup(self):
         for attach in self.connections:
@@ -599,7 +648,8 @@ class Volume(NamedObject):
         self._remove_export()
 
     def _remove_export(self):
-        self.backend.driver.remove_export(self._context, self._ovo)
+        with metrics.phase('driver'):
+            self.backend.driver.remove_export(self._context, self._ovo)
 
     def refresh(self):
         last_self = self.get_by_id(self.id)
@@ -611,7 +661,8 @@ class Volume(NamedObject):
         vars(self).update(vars(last_self))
 
     def save(self):
-        self.persistence.set_volume(self)
+        with metrics.phase('persistence'):
+            self.persistence.set_volume(self)
 
 
 class Connection(Object, LazyVolumeAttr):
@@ -630,8 +681,9 @@ class Connection(Object, LazyVolumeAttr):
 
     @classmethod
     def connect(cls, volume, connector, **kwargs):
-        conn_info = volume.backend.driver.initialize_connection(
-            volume._ovo, connector)
+        with metrics.phase('driver'):
+            conn_info = volume.backend.driver.initialize_connection(
+                volume._ovo, connector)
         conn = cls(volume.backend,
                    connector=connector,
                    volume=volume,
@@ -783,26 +835,34 @@ class Connection(Object, LazyVolumeAttr):
         return conn
 
     def _disconnect(self, force=False):
-        self.backend.driver.terminate_connection(self.volume._ovo,
-                                                 self.connector_info,
-                                                 force=force)
+        with metrics.phase('driver'):
+            self.backend.driver.terminate_connection(self.volume._ovo,
+                                                     self.connector_info,
+                                                     force=force)
         self.conn_info = None
         self._ovo.status = 'detached'
-        self.persistence.delete_connection(self)
+        with metrics.phase('persistence'):
+            self.persistence.delete_connection(self)
 
+    @metrics.instrumented('disconnect')
     def disconnect(self, force=False):
-        self._disconnect(force)
-        self.volume._disconnect(self)
+        with self.backend.limiter.limit('disconnect'):
+            self._disconnect(force)
+            self.volume._disconnect(self)
 
     def device_attached(self, device):
         self.device = device
         self.save()
 
+    @metrics.instrumented('attach')
     def attach(self):
-        device = self.connector.connect_volume(self.conn_info['data'])
+        with metrics.phase('connector'):
+            device = self.connector.connect_volume(self.conn_info['data'])
         self.device_attached(device)
         try:
-            if self.connector.check_valid_device(self.path):
+            with metrics.phase('connector'):
+                valid = self.connector.check_valid_device(self.path)
+            if valid:
                 error_msg = None
             else:
                 error_msg = ('Unable to access the backend storage via path '
@@ -820,10 +880,12 @@ class Connection(Object, LazyVolumeAttr):
         if self._volume:
             self.volume.local_attach = self
 
+    @metrics.instrumented('detach')
     def detach(self, force=False, ignore_errors=False, exc=None):
         if not exc:
             exc = brick_exception.ExceptionChainer()
-        with exc.context(force, 'Disconnect failed'):
+        with exc.context(force, 'Disconnect failed'), \
+                metrics.phase('connector'):
             self.connector.disconnect_volume(self.conn_info['data'],
                                              self.device,
                                              force=force,
@@ -857,7 +919,8 @@ class Connection(Object, LazyVolumeAttr):
         self._backend = value
 
     def save(self):
-        self.persistence.set_connection(self)
+        with metrics.phase('persistence'):
+            self.persistence.set_connection(self)
 
 
 class Snapshot(NamedObject, LazyVolumeAttr):
@@ -908,9 +971,12 @@ class Snapshot(NamedObject, LazyVolumeAttr):
             utils.add_by_id(snap._ovo, snap._volume._ovo.snapshots.objects)
         return snap
 
+    @metrics.instrumented('create_snapshot')
     def create(self):
         try:
-            model_update = self.backend.driver.create_snapshot(self._ovo)
+            with self.backend.limiter.limit('create_snapshot'), \
+                    metrics.phase('driver'):
+                model_update = self.backend.driver.create_snapshot(self._ovo)
             self._ovo.status = 'available'
             if model_update:
                 self._ovo.update(model_update)
@@ -920,10 +986,14 @@ class Snapshot(NamedObject, LazyVolumeAttr):
         finally:
             self.save()
 
+    @metrics.instrumented('delete_snapshot')
     def delete(self):
         try:
-            self.backend.driver.delete_snapshot(self._ovo)
-            self.persistence.delete_snapshot(self)
+            with self.backend.limiter.limit('delete_snapshot'), \
+                    metrics.phase('driver'):
+                self.backend.driver.delete_snapshot(self._ovo)
+            with metrics.phase('persistence'):
+                self.persistence.delete_snapshot(self)
             self._ovo.status = 'deleted'
         except Exception:
             self._ovo.status = 'error_deleting'
@@ -932,20 +1002,26 @@ class Snapshot(NamedObject, LazyVolumeAttr):
         if self._volume is not None:
             self._volume._snapshot_removed(self)
 
+    @metrics.instrumented('create_volume_from_snapshot')
     def create_volume(self, **new_vol_params):
         new_vol_params.setdefault('size', self.volume_size)
         new_vol_params['snapshot_id'] = self.id
         new_vol = Volume(self.volume, **new_vol_params)
-        self.backend._start_creating_volume(new_vol)
         try:
-            model_update = self.backend.driver.create_volume_from_snapshot(
-                new_vol._ovo, self._ovo)
-            new_vol._ovo.status = 'available'
-            if model_update:
-                new_vol._ovo.update(model_update)
-            self.backend._volume_created(new_vol)
+            with self.backend._creating_volume(new_vol):
+                limit = self.backend.limiter.limit(
+                    'create_volume_from_snapshot')
+                with limit, metrics.phase('driver'):
+                    model_update = (
+                        self.backend.driver.create_volume_from_snapshot(
+                            new_vol._ovo, self._ovo))
+                new_vol._ovo.status = 'available'
+                if model_update:
+                    new_vol._ovo.update(model_update)
+                self.backend._volume_created(new_vol)
         except Exception:
             new_vol._ovo.status = 'error'
+            self.backend._release_capacity(new_vol)
             new_vol._raise_with_resource()
         finally:
             new_vol.save()
@@ -964,7 +1040,8 @@ class Snapshot(NamedObject, LazyVolumeAttr):
         return cls.persistence.get_snapshots(snapshot_name=snapshot_name)
 
     def save(self):
-        self.persistence.set_snapshot(self)
+        with metrics.phase('persistence'):
+            self.persistence.set_snapshot(self)
 
 
 setup = Object.setup
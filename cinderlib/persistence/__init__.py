@@ -15,12 +15,15 @@
 from __future__ import absolute_import
 import inspect
 
-from cinder.cmd import volume as volume_cmd
 import six
 from stevedore import driver
 
 from cinderlib import exception
 from cinderlib.persistence import base
+from cinderlib import utils
+
+# Slow to import and only needed when persistence is set up
+volume_cmd = utils.LazyModule('cinder.cmd.volume')
 
 
 DEFAULT_STORAGE = 'memory'
@@ -47,8 +50,9 @@ def setup(config):
     available and other ways to use custom mechanisms:
 
     - Persistence plugins: Plugin mechanism uses Python entrypoints under
-      namespace cinderlib.persistence.storage, and cinderlib comes with 3
-      different mechanisms, "memory", "dbms", and "memory_dbms".  To use any of
+      namespace cinderlib.persistence.storage, and cinderlib comes with 4
+      different mechanisms, "memory", "memory_indexed", "dbms", and
+      "memory_dbms".  To use any of
       these one must pass the string name in the storage parameter and any
       other configuration as keyword arguments.
     - Passing a class that inherits from PersistenceDriverBase as storage
@@ -14,6 +14,7 @@
 #    under the License.
 
 from __future__ import absolute_import
+import contextlib
 
 # NOTE(geguileo): Probably a good idea not to depend on cinder.cmd.volume
 # having all the other imports as they could change.
@@ -41,7 +42,19 @@ class PersistenceDriverBase(object):
     def db(self):
         raise NotImplementedError()
 
-    def get_volumes(self, volume_id=None, volume_name=None, backend_name=None):
+    @contextlib.contextmanager
+    def batch(self):
+        """Group writes done within the context.
+
+        Plugins that support it will coalesce all the set operations done
+        within the context and store them together on exit.  By default
+        writes are done immediately.
+        """
+        yield
+
+    def get_volumes(self, volume_id=None, volume_name=None, backend_name=None,
+                    eager_load=False, limit=None, marker=None, sort_keys=None,
+                    sort_dirs=None):
         raise NotImplementedError()
 
     def get_snapshots(self, snapshot_id=None, snapshot_name=None,
@@ -54,6 +67,14 @@ class PersistenceDriverBase(object):
     def get_key_values(self, key):
         raise NotImplementedError()
 
+    @staticmethod
+    def _eager_load(volumes):
+        """Load snapshots and connections of the volumes."""
+        for volume in volumes:
+            volume.snapshots
+            volume.connections
+        return volumes
+
     def set_volume(self, volume):
         self.reset_change_tracker(volume)
         if volume.volume_type:
@@ -61,6 +82,10 @@ class PersistenceDriverBase(object):
             if volume.volume_type.qos_specs_id:
                 volume.volume_type.qos_specs.obj_reset_changes()
 
+    def set_volumes(self, volumes):
+        for volume in volumes:
+            self.set_volume(volume)
+
     def set_snapshot(self, snapshot):
         self.reset_change_tracker(snapshot)
 
@@ -103,7 +128,9 @@ class PersistenceDriverBase(object):
         result = {key: getattr(resource._ovo, key)
                   for key in resource._changed_fields
                   if not isinstance(resource.fields[key], fields.ObjectField)}
-        if getattr(resource._ovo, 'volume_type_id', None):
+        # Snapshots have a volume_type_id but not a volume_type field
+        if (getattr(resource._ovo, 'volume_type_id', None) and
+                'volume_type' in resource.fields):
             if ('qos_specs' in resource.volume_type._changed_fields and
                     resource.volume_type.qos_specs):
                 result['qos_specs'] = resource._ovo.volume_type.qos_specs.specs
@@ -166,9 +193,8 @@ class DB(object):
 
     def volume_type_get(self, context, id, inactive=False,
                         expected_fields=None):
-        if id in cinderlib.Backend._volumes_inflight:
-            vol = cinderlib.Backend._volumes_inflight[id]
-        else:
+        vol = cinderlib.Backend._get_inflight_volume(id)
+        if vol is None:
             vol = self.persistence.get_volumes(id)[0]
 
         if not vol._ovo.volume_type_id:
@@ -176,9 +202,8 @@ class DB(object):
         return vol_type_to_dict(vol._ovo.volume_type)
 
     def qos_specs_get(self, context, qos_specs_id, inactive=False):
-        if qos_specs_id in cinderlib.Backend._volumes_inflight:
-            vol = cinderlib.Backend._volumes_inflight[qos_specs_id]
-        else:
+        vol = cinderlib.Backend._get_inflight_volume(qos_specs_id)
+        if vol is None:
             vol = self.persistence.get_volumes(qos_specs_id)[0]
         if not vol._ovo.volume_type_id:
             return None
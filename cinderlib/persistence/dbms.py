@@ -15,16 +15,25 @@
 
 from __future__ import absolute_import
 
+import collections
+import contextlib
 import logging
+import threading
+import uuid
 
+from cinder.common import sqlalchemyutils
 from cinder.db import api as db_api
 from cinder.db import migration
 from cinder.db.sqlalchemy import api as sqla_api
 from cinder.db.sqlalchemy import models
 from cinder import objects as cinder_objs
+from cinder.objects import base as cinder_base_ovo
 from oslo_config import cfg
 from oslo_db import exception
 from oslo_log import log
+from oslo_utils import excutils
+from oslo_utils import timeutils
+from sqlalchemy import orm
 
 from cinderlib import objects
 from cinderlib.persistence import base as persistence_base
@@ -39,6 +48,14 @@ class KeyValue(models.BASE, models.models.ModelBase, objects.KeyValue):
     value = models.Column(models.Text)
 
 
+class VolumeBackend(models.BASE, models.models.ModelBase):
+    """Backend of each volume, to search volumes by backend using an index."""
+    __tablename__ = 'cinderlib_persistence_volume_backend'
+    volume_id = models.Column(models.String(36), primary_key=True)
+    backend_name = models.Column(models.String(255), nullable=False,
+                                 index=True)
+
+
 class DBPersistence(persistence_base.PersistenceDriverBase):
     GET_METHODS_PER_DB_MODEL = {
         cinder_objs.VolumeType.model: 'volume_type_get',
@@ -72,24 +89,28 @@ class DBPersistence(persistence_base.PersistenceDriverBase):
         self.db_instance.get_by_id = self.get_by_id
 
         migration.db_sync()
-        self._create_key_value_table()
+        self._create_cinderlib_tables()
+        # Pending writes of the current thread's batch, if there is one
+        self._batch = threading.local()
         super(DBPersistence, self).__init__()
 
     def vol_type_get(self, context, id, inactive=False,
                      expected_fields=None):
-        if id not in objects.Backend._volumes_inflight:
+        vol = objects.Backend._get_inflight_volume(id)
+        if vol is None:
             return self.original_vol_type_get(context, id, inactive)
 
-        vol = objects.Backend._volumes_inflight[id]._ovo
+        vol = vol._ovo
         if not vol.volume_type_id:
             return None
         return persistence_base.vol_type_to_dict(vol.volume_type)
 
     def qos_specs_get(self, context, qos_specs_id, inactive=False):
-        if qos_specs_id not in objects.Backend._volumes_inflight:
+        vol = objects.Backend._get_inflight_volume(qos_specs_id)
+        if vol is None:
             return self.original_qos_specs_get(context, qos_specs_id, inactive)
 
-        vol = objects.Backend._volumes_inflight[qos_specs_id]._ovo
+        vol = vol._ovo
         if not vol.volume_type_id:
             return None
         return persistence_base.vol_type_to_dict(vol.volume_type)['qos_specs']
@@ -108,9 +129,30 @@ class DBPersistence(persistence_base.PersistenceDriverBase):
         elif hasattr(sqla_api, 'configure'):
             sqla_api.configure(cfg.CONF)
 
-    def _create_key_value_table(self):
-        models.BASE.metadata.create_all(sqla_api.get_engine(),
-                                        tables=[KeyValue.__table__])
+    def _create_cinderlib_tables(self):
+        engine = sqla_api.get_engine()
+        migrate_backends = not engine.has_table(VolumeBackend.__tablename__)
+        models.BASE.metadata.create_all(
+            engine, tables=[KeyValue.__table__, VolumeBackend.__table__])
+        if migrate_backends:
+            self._migrate_volume_backends()
+
+    def _migrate_volume_backends(self):
+        """Populate the VolumeBackend table from existing volumes."""
+        session = sqla_api.get_session()
+        with session.begin():
+            query = sqla_api.model_query(objects.CONTEXT, models.Volume.id,
+                                         models.Volume.host, session=session,
+                                         read_deleted='no')
+            rows = [{'volume_id': volume_id,
+                     'backend_name': self._backend_name(host)}
+                    for volume_id, host in query if host]
+            LOG.debug('Migrating backend of %s volumes', len(rows))
+            session.bulk_insert_mappings(VolumeBackend, rows)
+
+    def _set_volume_backend(self, session, volume):
+        session.merge(VolumeBackend(
+            volume_id=volume.id, backend_name=self._backend_name(volume.host)))
 
     @property
     def db(self):
@@ -120,16 +162,63 @@ class DBPersistence(persistence_base.PersistenceDriverBase):
     def _build_filter(**kwargs):
         return {key: value for key, value in kwargs.items() if value}
 
-    def get_volumes(self, volume_id=None, volume_name=None, backend_name=None):
-        # Use the % wildcard to ignore the host name on the backend_name search
-        host = '%@' + backend_name if backend_name else None
-        filters = self._build_filter(id=volume_id, display_name=volume_name,
-                                     host=host)
-        LOG.debug('get_volumes for %s', filters)
-        ovos = cinder_objs.VolumeList.get_all(objects.CONTEXT, filters=filters)
+    @staticmethod
+    def _backend_name(host):
+        return host.split('@')[-1].split('#')[0]
+
+    def _volumes_query(self, session, filters, backend_name=None, limit=None,
+                       marker=None, sort_keys=None, sort_dirs=None):
+        """Return the query to get volumes or None if none would match.
+
+        Equivalent to Cinder's volume_get_all query, but it searches for the
+        backend on the indexed VolumeBackend table instead of using a LIKE on
+        the volume's host.
+        """
+        query = sqla_api._volume_get_query(objects.CONTEXT, session=session)
+        # Filters must go first, as they are applied to the last joined model
+        if filters:
+            query = sqla_api._process_volume_filters(query, filters)
+            if query is None:
+                return None
+        if backend_name:
+            query = query.join(
+                VolumeBackend,
+                VolumeBackend.volume_id == models.Volume.id).filter(
+                    VolumeBackend.backend_name == backend_name)
+        if marker:
+            marker = sqla_api._volume_get(objects.CONTEXT, marker, session)
+        sort_keys, sort_dirs = sqla_api.process_sort_params(
+            sort_keys, sort_dirs, default_dir='desc')
+        return sqlalchemyutils.paginate_query(query, models.Volume, limit,
+                                              sort_keys, marker=marker,
+                                              sort_dirs=sort_dirs)
+
+    def get_volumes(self, volume_id=None, volume_name=None, backend_name=None,
+                    eager_load=False, limit=None, marker=None, sort_keys=None,
+                    sort_dirs=None):
+        filters = self._build_filter(id=volume_id, display_name=volume_name)
+        LOG.debug('get_volumes for %s on backend %s', filters, backend_name)
+        context = objects.CONTEXT
+        session = sqla_api.get_session()
+        with session.begin():
+            query = self._volumes_query(session, filters, backend_name,
+                                        limit, marker, sort_keys, sort_dirs)
+            if query is None:
+                return []
+            if eager_load:
+                ovos = self._get_volume_ovos_eager(session, query)
+            else:
+                db_volumes = query.all()
+        if not eager_load:
+            ovos = cinder_base_ovo.obj_make_list(
+                context, cinder_objs.VolumeList(context), cinder_objs.Volume,
+                db_volumes,
+                expected_attrs=cinder_objs.VolumeList._get_expected_attrs(
+                    context))
+
         result = []
         for ovo in ovos:
-            backend = ovo.host.split('@')[-1].split('#')[0]
+            backend = self._backend_name(ovo.host)
 
             # Trigger lazy loading of specs
             if ovo.volume_type_id:
@@ -140,6 +229,76 @@ class DBPersistence(persistence_base.PersistenceDriverBase):
 
         return result
 
+    def _get_volume_ovos_eager(self, session, query):
+        """Get volume OVOs with all their related data in a few queries.
+
+        Volume types with their extra specs, snapshots, and attachments are
+        loaded together with the volumes, and QoS specs with one query,
+        instead of running several queries for each of the volumes.  Only
+        attachments still run a query each, done by Cinder to migrate their
+        legacy attachment specs.
+        """
+        context = objects.CONTEXT
+        query = query.options(
+            orm.joinedload('volume_type').joinedload('extra_specs'),
+            orm.subqueryload('snapshots').joinedload('snapshot_metadata'))
+        db_volumes = query.all()
+
+        qos_specs = self._get_qos_specs_ovos(
+            session, {db_vol.volume_type.qos_specs_id
+                      for db_vol in db_volumes
+                      if db_vol.volume_type and
+                      db_vol.volume_type.qos_specs_id})
+
+        # Attachments are built separately to skip their lazy loads
+        expected_attrs = [
+            attr
+            for attr in cinder_objs.VolumeList._get_expected_attrs(context)
+            if attr != 'volume_attachment']
+        expected_attrs.append('volume_type.extra_specs')
+        snap_expected_attrs = cinder_objs.Snapshot._get_expected_attrs(
+            context)
+        result = []
+        for db_vol in db_volumes:
+            ovo = cinder_objs.Volume._from_db_object(
+                context, cinder_objs.Volume(context), db_vol,
+                expected_attrs=expected_attrs)
+            ovo.snapshots = cinder_base_ovo.obj_make_list(
+                context, cinder_objs.SnapshotList(context),
+                cinder_objs.Snapshot,
+                [snap for snap in db_vol.snapshots if not snap.deleted],
+                expected_attrs=snap_expected_attrs)
+            # Don't load the attachments' volume, we already have it
+            ovo.volume_attachment = cinder_base_ovo.obj_make_list(
+                context, cinder_objs.VolumeAttachmentList(context),
+                cinder_objs.VolumeAttachment, db_vol.volume_attachment,
+                expected_attrs=[])
+            if ovo.volume_type:
+                ovo.volume_type.qos_specs = qos_specs.get(
+                    ovo.volume_type.qos_specs_id)
+                ovo.volume_type.obj_reset_changes()
+            ovo.obj_reset_changes()
+            result.append(ovo)
+        return result
+
+    @staticmethod
+    def _get_qos_specs_ovos(session, qos_ids):
+        if not qos_ids:
+            return {}
+        query = sqla_api.model_query(
+            objects.CONTEXT, models.QualityOfServiceSpecs, session=session,
+            read_deleted='no').filter(
+                models.QualityOfServiceSpecs.id.in_(qos_ids)).options(
+                    orm.joinedload('specs'))
+        result = {}
+        for specs in sqla_api._dict_with_qos_specs(query.all()):
+            result[specs['id']] = (
+                cinder_objs.QualityOfServiceSpecs._from_db_object(
+                    objects.CONTEXT,
+                    cinder_objs.QualityOfServiceSpecs(objects.CONTEXT),
+                    specs))
+        return result
+
     def get_snapshots(self, snapshot_id=None, snapshot_name=None,
                       volume_id=None):
         filters = self._build_filter(id=snapshot_id, volume_id=volume_id,
@@ -174,11 +333,58 @@ class DBPersistence(persistence_base.PersistenceDriverBase):
     def get_key_values(self, key=None):
         return self._get_kv(key)
 
-    def set_volume(self, volume):
-        changed = self.get_changed_fields(volume)
-        if not changed:
-            changed = self.get_fields(volume)
-
+    @contextlib.contextmanager
+    def batch(self):
+        """Coalesce all writes done within the context in one transaction.
+
+        Resources passed to the set methods are not written until we exit the
+        context, so saving the same resource multiple times results in a
+        single write with all its changes.  On exit all pending resources are
+        stored using a single DB transaction.  If an exception is raised
+        within the context the writes done until then are stored before the
+        exception is propagated, so resources already created on the storage
+        don't lose their metadata.
+
+        Pending changes are not visible to the get methods until we exit the
+        context.  Nested calls are included in the outermost batch.
+        """
+        if getattr(self._batch, 'pending', None) is not None:
+            yield
+            return
+
+        self._batch.pending = collections.OrderedDict()
+        try:
+            yield
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                try:
+                    self._flush(self._batch.pending)
+                except Exception:
+                    LOG.exception('Failed to store %s batched writes after '
+                                  'an error', len(self._batch.pending))
+        else:
+            self._flush(self._batch.pending)
+        finally:
+            self._batch.pending = None
+
+    def _add_to_batch(self, resource_type, resource):
+        pending = getattr(self._batch, 'pending', None)
+        if pending is None:
+            return False
+        pending[(resource_type, resource.id)] = resource
+        return True
+
+    def _remove_from_batch(self, resource_type, resource):
+        pending = getattr(self._batch, 'pending', None)
+        if pending is not None:
+            pending.pop((resource_type, resource.id), None)
+
+    def set_volumes(self, volumes):
+        with self.batch():
+            for volume in volumes:
+                self.set_volume(volume)
+
+    def _set_volume_type(self, volume, changed):
         extra_specs = changed.pop('extra_specs', None)
         qos_specs = changed.pop('qos_specs', None)
 
@@ -195,11 +401,16 @@ class DBPersistence(persistence_base.PersistenceDriverBase):
                                                {'name': volume.volume_type_id,
                                                 'consumer': 'back-end',
                                                 'specs': qos_specs})
-                # Cinder is automatically generating an ID, replace it
+                # Cinder is automatically generating an ID, replace it in the
+                # QoS and in its specs, which are rows in the same table.
                 query = sqla_api.model_query(objects.CONTEXT,
                                              models.QualityOfServiceSpecs)
                 query.filter_by(id=res['id']).update(
                     {'id': volume.volume_type.qos_specs_id})
+                query.filter_by(specs_id=res['id']).update(
+                    {'specs_id': volume.volume_type.qos_specs_id})
+                vol_type_fields['qos_specs_id'] = (
+                    volume.volume_type.qos_specs_id)
 
             self.db.volume_type_create(objects.CONTEXT, vol_type_fields)
         else:
@@ -213,6 +424,17 @@ class DBPersistence(persistence_base.PersistenceDriverBase):
                                           'consumer': 'back-end',
                                           'specs': qos_specs})
 
+    def set_volume(self, volume):
+        if self._add_to_batch('volume', volume):
+            return
+
+        changed = self.get_changed_fields(volume)
+        if not changed:
+            changed = self.get_fields(volume)
+
+        self._set_volume_type(volume, changed)
+        host_changed = 'host' in changed
+
         # Create the volume
         if 'id' in changed:
             LOG.debug('set_volume creating %s', changed)
@@ -225,9 +447,17 @@ class DBPersistence(persistence_base.PersistenceDriverBase):
         if changed:
             LOG.debug('set_volume updating %s', changed)
             self.db.volume_update(objects.CONTEXT, volume.id, changed)
+
+        if host_changed:
+            session = sqla_api.get_session()
+            with session.begin():
+                self._set_volume_backend(session, volume)
         super(DBPersistence, self).set_volume(volume)
 
     def set_snapshot(self, snapshot):
+        if self._add_to_batch('snapshot', snapshot):
+            return
+
         changed = self.get_changed_fields(snapshot)
         if not changed:
             changed = self.get_fields(snapshot)
@@ -246,17 +476,24 @@ class DBPersistence(persistence_base.PersistenceDriverBase):
             self.db.snapshot_update(objects.CONTEXT, snapshot.id, changed)
         super(DBPersistence, self).set_snapshot(snapshot)
 
-    def set_connection(self, connection):
-        changed = self.get_changed_fields(connection)
-        if not changed:
-            changed = self.get_fields(connection)
-
+    @staticmethod
+    def _connection_changes(connection, changed):
         if 'connection_info' in changed:
             connection._convert_connection_info_to_db_format(changed)
 
         if 'connector' in changed:
             connection._convert_connector_to_db_format(changed)
 
+    def set_connection(self, connection):
+        if self._add_to_batch('connection', connection):
+            return
+
+        changed = self.get_changed_fields(connection)
+        if not changed:
+            changed = self.get_fields(connection)
+
+        self._connection_changes(connection, changed)
+
         # Create
         if 'id' in changed:
             LOG.debug('set_connection creating %s', changed)
@@ -281,6 +518,7 @@ class DBPersistence(persistence_base.PersistenceDriverBase):
             session.add(kv)
 
     def delete_volume(self, volume):
+        self._remove_from_batch('volume', volume)
         if self.soft_deletes:
             LOG.debug('soft deleting volume %s', volume.id)
             self.db.volume_destroy(objects.CONTEXT, volume.id)
@@ -314,9 +552,12 @@ class DBPersistence(persistence_base.PersistenceDriverBase):
                         models.QualityOfServiceSpecs.id == qos_id,
                         models.QualityOfServiceSpecs.specs_id == qos_id
                     )).delete()
+        query = sqla_api.get_session().query(VolumeBackend)
+        query.filter_by(volume_id=volume.id).delete()
         super(DBPersistence, self).delete_volume(volume)
 
     def delete_snapshot(self, snapshot):
+        self._remove_from_batch('snapshot', snapshot)
         if self.soft_deletes:
             LOG.debug('soft deleting snapshot %s', snapshot.id)
             self.db.snapshot_destroy(objects.CONTEXT, snapshot.id)
@@ -327,6 +568,7 @@ class DBPersistence(persistence_base.PersistenceDriverBase):
         super(DBPersistence, self).delete_snapshot(snapshot)
 
     def delete_connection(self, connection):
+        self._remove_from_batch('connection', connection)
         if self.soft_deletes:
             LOG.debug('soft deleting connection %s', connection.id)
             self.db.attachment_destroy(objects.CONTEXT, connection.id)
@@ -341,6 +583,215 @@ class DBPersistence(persistence_base.PersistenceDriverBase):
         query = sqla_api.get_session().query(KeyValue)
         query.filter_by(key=key_value.key).delete()
 
+    def _split_changes(self, session, model, resources):
+        """Return changes of new resources and of existing resources.
+
+        Resources that have an id change are considered new unless they are
+        already in the DB, like the DBDuplicateEntry check on the set methods.
+        """
+        changes = []
+        for resource in resources:
+            changed = (self.get_changed_fields(resource) or
+                       self.get_fields(resource))
+            changes.append((resource, changed))
+
+        existing = self._existing_ids(
+            session, model.id,
+            [resource.id for resource, changed in changes if 'id' in changed])
+
+        new, updated = [], []
+        for resource, changed in changes:
+            if 'id' in changed and resource.id not in existing:
+                new.append((resource, changed))
+            else:
+                changed.pop('id', None)
+                updated.append((resource, changed))
+        return new, updated
+
+    @staticmethod
+    def _existing_ids(session, column, ids):
+        """Return the set of ids that are already in the column."""
+        existing = set()
+        ids = list(set(ids))
+        # Stay below SQLite's default limit of 999 variables per query
+        for i in range(0, len(ids), 500):
+            query = session.query(column).filter(column.in_(ids[i:i + 500]))
+            existing.update(row[0] for row in query)
+        return existing
+
+    @staticmethod
+    def _columns_only(model, changed):
+        columns = model.__table__.columns
+        return {key: value for key, value in changed.items()
+                if key in columns}
+
+    @staticmethod
+    def _metadata_rows(metadata, model):
+        return [model(key=key, value=value)
+                for key, value in (metadata or {}).items()]
+
+    def _replace_metadata(self, session, model, volume_id, metadata):
+        query = session.query(model).filter_by(volume_id=volume_id,
+                                               deleted=False)
+        if self.soft_deletes:
+            query.update({'deleted': True, 'deleted_at': timeutils.utcnow()},
+                         synchronize_session=False)
+        else:
+            query.delete(synchronize_session=False)
+        session.add_all(model(volume_id=volume_id, key=key, value=value)
+                        for key, value in metadata.items())
+
+    def _volume_type_rows(self, volume, extra_specs, qos_specs,
+                          existing_types, existing_qos):
+        """Return the rows of a volume's type and QoS specs to create.
+
+        Types and QoS specs whose ids are in the existing sets, which have
+        the ones already stored or in the batch, are skipped, and the sets
+        are updated with the new ones.
+        """
+        type_id = volume.volume_type_id
+        qos_id = volume.volume_type.qos_specs_id if qos_specs else None
+        rows = []
+        if type_id not in existing_types:
+            existing_types.add(type_id)
+            extra_specs = self._metadata_rows(extra_specs,
+                                              models.VolumeTypeExtraSpecs)
+            rows.append(models.VolumeType(id=type_id, name=type_id,
+                                          is_public=True, qos_specs_id=qos_id,
+                                          extra_specs=extra_specs))
+        if qos_id and qos_id not in existing_qos:
+            existing_qos.add(qos_id)
+            rows.append(models.QualityOfServiceSpecs(id=qos_id,
+                                                     key='QoS_Specs_Name',
+                                                     value=type_id))
+            specs = dict(qos_specs, consumer='back-end')
+            rows.extend(models.QualityOfServiceSpecs(id=str(uuid.uuid4()),
+                                                     specs_id=qos_id,
+                                                     key=key, value=value)
+                        for key, value in specs.items())
+        return rows
+
+    def _flush_volumes(self, session, volumes):
+        new, updated = self._split_changes(session, models.Volume, volumes)
+        # Changes on existing volume types are rare, so we don't batch them
+        deferred = []
+
+        # Volume types and QoS specs may already be stored or be shared
+        typed = [volume for volume, changed in new
+                 if changed.get('volume_type_id')]
+        existing_types = self._existing_ids(
+            session, models.VolumeType.id,
+            [volume.volume_type_id for volume in typed])
+        existing_qos = self._existing_ids(
+            session, models.QualityOfServiceSpecs.id,
+            [volume.volume_type.qos_specs_id for volume in typed
+             if volume.volume_type and volume.volume_type.qos_specs_id])
+
+        rows = []
+        for volume, changed in new:
+            extra_specs = changed.pop('extra_specs', None)
+            qos_specs = changed.pop('qos_specs', None)
+            if changed.get('volume_type_id'):
+                rows.extend(self._volume_type_rows(volume, extra_specs,
+                                                   qos_specs, existing_types,
+                                                   existing_qos))
+            changed['volume_metadata'] = self._metadata_rows(
+                changed.get('metadata'), models.VolumeMetadata)
+            changed['volume_admin_metadata'] = self._metadata_rows(
+                changed.get('admin_metadata'), models.VolumeAdminMetadata)
+            volume_row = models.Volume()
+            volume_row.update(changed)
+            rows.append(volume_row)
+            if volume.host:
+                rows.append(VolumeBackend(
+                    volume_id=volume.id,
+                    backend_name=self._backend_name(volume.host)))
+        LOG.debug('batch creating %s volumes', len(new))
+        session.add_all(rows)
+        session.flush()
+
+        mappings = []
+        for volume, changed in updated:
+            if 'extra_specs' in changed or 'qos_specs' in changed:
+                deferred.append((volume, {
+                    'extra_specs': changed.pop('extra_specs', None),
+                    'qos_specs': changed.pop('qos_specs', None)}))
+            metadata = changed.pop('metadata', None)
+            if metadata is not None:
+                self._replace_metadata(session, models.VolumeMetadata,
+                                       volume.id, metadata)
+            admin_metadata = changed.pop('admin_metadata', None)
+            if admin_metadata is not None:
+                self._replace_metadata(session, models.VolumeAdminMetadata,
+                                       volume.id, admin_metadata)
+            changed = self._columns_only(models.Volume, changed)
+            if 'host' in changed:
+                self._set_volume_backend(session, volume)
+            if changed:
+                changed['id'] = volume.id
+                mappings.append(changed)
+        LOG.debug('batch updating %s volumes', len(mappings))
+        session.bulk_update_mappings(models.Volume, mappings)
+        return deferred
+
+    def _flush_resources(self, session, model, resources, convert=None):
+        new, updated = self._split_changes(session, model, resources)
+        rows = []
+        for resource, changed in new:
+            if convert:
+                convert(resource, changed)
+            row = model()
+            row.update(changed)
+            rows.append(row)
+        LOG.debug('batch creating %s %s', len(rows), model.__tablename__)
+        session.add_all(rows)
+        session.flush()
+
+        mappings = []
+        for resource, changed in updated:
+            if convert:
+                convert(resource, changed)
+            changed = self._columns_only(model, changed)
+            if changed:
+                changed['id'] = resource.id
+                mappings.append(changed)
+        LOG.debug('batch updating %s %s', len(mappings), model.__tablename__)
+        session.bulk_update_mappings(model, mappings)
+
+    def _snapshot_changes(self, snapshot, changed):
+        changed['snapshot_metadata'] = self._metadata_rows(
+            changed.pop('metadata', None), models.SnapshotMetadata)
+
+    def _flush(self, pending):
+        if not pending:
+            return
+
+        resources = collections.defaultdict(list)
+        for (resource_type, resource_id), resource in pending.items():
+            resources[resource_type].append(resource)
+
+        session = sqla_api.get_session()
+        with session.begin():
+            # Respect dependencies: volumes, then snapshots and connections
+            deferred = self._flush_volumes(session, resources['volume'])
+            self._flush_resources(session, models.Snapshot,
+                                  resources['snapshot'],
+                                  self._snapshot_changes)
+            self._flush_resources(session, models.VolumeAttachment,
+                                  resources['connection'],
+                                  self._connection_changes)
+
+        for volume, changed in deferred:
+            self._set_volume_type(volume, changed)
+
+        base = super(DBPersistence, self)
+        for volume in resources['volume']:
+            base.set_volume(volume)
+        for snapshot in resources['snapshot']:
+            base.set_snapshot(snapshot)
+        for connection in resources['connection']:
+            base.set_connection(connection)
+
 
 class MemoryDBPersistence(DBPersistence):
     def __init__(self):
@@ -13,10 +13,19 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import functools
+import heapq
+
+from cinderlib import exception
 from cinderlib.persistence import base as persistence_base
 
 
 class MemoryPersistence(persistence_base.PersistenceDriverBase):
+    # Like Cinder's DB, always sort by these to have a stable order
+    DEFAULT_SORT_KEYS = ('created_at', 'id')
+    DEFAULT_SORT_DIR = 'desc'
+
     volumes = {}
     snapshots = {}
     connections = {}
@@ -43,7 +52,56 @@ class MemoryPersistence(persistence_base.PersistenceDriverBase):
             return values
         return [res for res in values if self._get_field(res, field) == value]
 
-    def get_volumes(self, volume_id=None, volume_name=None, backend_name=None):
+    @classmethod
+    def _sort_params(cls, sort_keys, sort_dirs):
+        sort_keys = list(sort_keys or [])
+        sort_dirs = list(sort_dirs or [])
+        default_dir = sort_dirs[0] if sort_dirs else cls.DEFAULT_SORT_DIR
+        sort_dirs.extend([default_dir] * (len(sort_keys) - len(sort_dirs)))
+        for key in cls.DEFAULT_SORT_KEYS:
+            if key not in sort_keys:
+                sort_keys.append(key)
+                sort_dirs.append(default_dir)
+        return list(zip(sort_keys, sort_dirs))
+
+    @staticmethod
+    def _compare(sort_params):
+        def compare(res1, res2):
+            for key, direction in sort_params:
+                value1 = getattr(res1, key)
+                value2 = getattr(res2, key)
+                if value1 == value2:
+                    continue
+                # Like SQL's ascending order, missing values go first
+                if value1 is None or (value2 is not None and value1 < value2):
+                    result = -1
+                else:
+                    result = 1
+                return result if direction == 'asc' else -result
+            return 0
+        return compare
+
+    def _paginate_volumes(self, volumes, limit, marker, sort_keys, sort_dirs):
+        """Sort volumes and return the page after the marker volume."""
+        if limit is None and not (marker or sort_keys or sort_dirs):
+            return volumes
+
+        compare = self._compare(self._sort_params(sort_keys, sort_dirs))
+        if marker:
+            marker_vol = self.volumes.get(marker)
+            if not marker_vol:
+                raise exception.VolumeNotFound(volume_id=marker)
+            volumes = [vol for vol in volumes if compare(vol, marker_vol) > 0]
+
+        key = functools.cmp_to_key(compare)
+        if limit is None:
+            return sorted(volumes, key=key)
+        # Don't sort all the volumes when we only want a page
+        return heapq.nsmallest(limit, volumes, key=key)
+
+    def get_volumes(self, volume_id=None, volume_name=None, backend_name=None,
+                    eager_load=False, limit=None, marker=None, sort_keys=None,
+                    sort_dirs=None):
         try:
             res = ([self.volumes[volume_id]] if volume_id
                    else self.volumes.values())
@@ -51,6 +109,9 @@ class MemoryPersistence(persistence_base.PersistenceDriverBase):
             return []
         res = self._filter_by(res, 'display_name', volume_name)
         res = self._filter_by(res, 'host', backend_name)
+        res = self._paginate_volumes(res, limit, marker, sort_keys, sort_dirs)
+        if eager_load:
+            res = self._eager_load(res)
         return res
 
     def get_snapshots(self, snapshot_id=None, snapshot_name=None,
@@ -111,3 +172,102 @@ class MemoryPersistence(persistence_base.PersistenceDriverBase):
 
     def delete_key_value(self, key_value):
         self.key_values.pop(key_value.key, None)
+
+
+class IndexedMemoryPersistence(MemoryPersistence):
+    """Memory persistence with secondary indexes on filtered fields.
+
+    Keeps hash indexes on the fields used to filter volumes (backend name and
+    display name), snapshots (volume id and display name), and connections
+    (volume id) so lookups cost O(result size) instead of scanning every
+    stored resource.
+    """
+    INDEXED_FIELDS = {
+        'volumes': ('host', 'display_name'),
+        'snapshots': ('volume_id', 'display_name'),
+        'connections': ('volume_id',),
+    }
+    # {(resource_type, field): {field_value: {resource_id: resource}}}
+    indexes = collections.defaultdict(dict)
+    # {(resource_type, resource_id): {field: field_value}}
+    indexed_values = {}
+
+    def _index(self, resource_type, resource):
+        self._unindex(resource_type, resource)
+        values = {field: self._get_field(resource, field)
+                  for field in self.INDEXED_FIELDS[resource_type]}
+        for field, value in values.items():
+            index = self.indexes[(resource_type, field)]
+            index.setdefault(value, {})[resource.id] = resource
+        self.indexed_values[(resource_type, resource.id)] = values
+
+    def _unindex(self, resource_type, resource):
+        values = self.indexed_values.pop((resource_type, resource.id), {})
+        for field, value in values.items():
+            index = self.indexes[(resource_type, field)]
+            resources = index.get(value)
+            if resources is not None:
+                resources.pop(resource.id, None)
+                if not resources:
+                    del index[value]
+
+    def _get_indexed(self, resource_type, resource_id=None, **filters):
+        filters = {field: value for field, value in filters.items() if value}
+        if resource_id:
+            res = getattr(self, resource_type).get(resource_id)
+            result = [res] if res else []
+        elif filters:
+            # Start from the smallest index match, the rest are just filters
+            result = min((self.indexes[(resource_type, field)].get(value, {})
+                          for field, value in filters.items()),
+                         key=len).values()
+        else:
+            result = getattr(self, resource_type).values()
+
+        for field, value in filters.items():
+            result = self._filter_by(result, field, value)
+        return list(result)
+
+    def get_volumes(self, volume_id=None, volume_name=None, backend_name=None,
+                    eager_load=False, limit=None, marker=None, sort_keys=None,
+                    sort_dirs=None):
+        res = self._get_indexed('volumes', volume_id,
+                                display_name=volume_name, host=backend_name)
+        res = self._paginate_volumes(res, limit, marker, sort_keys, sort_dirs)
+        if eager_load:
+            res = self._eager_load(res)
+        return res
+
+    def get_snapshots(self, snapshot_id=None, snapshot_name=None,
+                      volume_id=None):
+        return self._get_indexed('snapshots', snapshot_id,
+                                 volume_id=volume_id,
+                                 display_name=snapshot_name)
+
+    def get_connections(self, connection_id=None, volume_id=None):
+        return self._get_indexed('connections', connection_id,
+                                 volume_id=volume_id)
+
+    def set_volume(self, volume):
+        super(IndexedMemoryPersistence, self).set_volume(volume)
+        self._index('volumes', volume)
+
+    def set_snapshot(self, snapshot):
+        super(IndexedMemoryPersistence, self).set_snapshot(snapshot)
+        self._index('snapshots', snapshot)
+
+    def set_connection(self, connection):
+        super(IndexedMemoryPersistence, self).set_connection(connection)
+        self._index('connections', connection)
+
+    def delete_volume(self, volume):
+        self._unindex('volumes', volume)
+        super(IndexedMemoryPersistence, self).delete_volume(volume)
+
+    def delete_snapshot(self, snapshot):
+        self._unindex('snapshots', snapshot)
+        super(IndexedMemoryPersistence, self).delete_snapshot(snapshot)
+
+    def delete_connection(self, connection):
+        self._unindex('connections', connection)
+        super(IndexedMemoryPersistence, self).delete_connection(connection)
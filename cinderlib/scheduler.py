@@ -0,0 +1,254 @@
+# Copyright (c) 2019, Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Placement of new volumes based on the backends' cached stats.
+
+The capacity calculations and the extra specs matching follow the ones from
+Cinder's scheduler capacity and capabilities filters and capacity weigher,
+but they only use the stats cached in the Backends, so they never call the
+drivers.
+"""
+
+import itertools
+import threading
+
+from cinder.scheduler.filters import extra_specs_ops
+from cinder import utils
+
+from cinderlib import exception
+
+# Default used by Cinder when the pools don't report it
+DEFAULT_MAX_OVER_SUBSCRIPTION_RATIO = 20.0
+INFINITE = float('inf')
+UNKNOWN_VALUES = ('unknown', None)
+
+
+def is_thin(extra_specs):
+    """Check if a volume with these extra specs would be thin provisioned."""
+    return (extra_specs or {}).get('provisioning:type') != 'thick'
+
+
+def free_capacity(pool, thin=True):
+    """Return a pool's free capacity taking into account thin provisioning.
+
+    Returns INFINITE if the pool reports infinite capacity and None if the
+    capacity is unknown.
+    """
+    total = pool.get('total_capacity_gb')
+    free = pool.get('free_capacity_gb')
+    if total in UNKNOWN_VALUES or free in UNKNOWN_VALUES:
+        return None
+    if total == 'infinite' or free == 'infinite':
+        return INFINITE
+    try:
+        total = float(total)
+        free = float(free)
+    except (TypeError, ValueError):
+        return None
+
+    ratio = utils.calculate_max_over_subscription_ratio(
+        pool, DEFAULT_MAX_OVER_SUBSCRIPTION_RATIO)
+    provisioned = pool.get('provisioned_capacity_gb',
+                           pool.get('allocated_capacity_gb', 0))
+    return utils.calculate_virtual_free_capacity(
+        total, free, provisioned, pool.get('thin_provisioning_support', False),
+        ratio, pool.get('reserved_percentage', 0), thin)
+
+
+def satisfies_extra_specs(capabilities, extra_specs):
+    """Check if the capabilities satisfy the extra specs.
+
+    Like Cinder's capabilities filter, keys scoped with anything other than
+    "capabilities:" are ignored, and nested capabilities are referenced
+    joining their keys with ":".
+    """
+    for key, req in (extra_specs or {}).items():
+        scope = key.split(':')
+        if len(scope) > 1 and scope[0] != 'capabilities':
+            continue
+        if scope[0] == 'capabilities':
+            del scope[0]
+
+        cap = capabilities
+        for name in scope:
+            try:
+                cap = cap[name]
+            except (TypeError, KeyError):
+                return False
+
+        cap_list = cap if isinstance(cap, list) else [cap]
+        if not any(extra_specs_ops.match(value, req) for value in cap_list):
+            return False
+    return True
+
+
+def pools_capabilities(stats):
+    """Return a list of (pool, capabilities) tuples from a backend's stats.
+
+    The capabilities of a pool are the backend's stats updated with the
+    pool's stats, like in Cinder's host manager.
+    """
+    backend_caps = {k: v for k, v in stats.items() if k != 'pools'}
+    result = []
+    for pool in stats.get('pools') or ():
+        caps = backend_caps.copy()
+        caps.update(pool)
+        result.append((pool, caps))
+    return result
+
+
+def consume_capacity(pool, size, thin=True):
+    """Update a pool's stats with the capacity used by a new volume.
+
+    Modifies the pool in place, so it must not be the dictionary of the
+    stats cached in the backend, which belongs to the driver.
+    """
+    provisioned = pool.get('provisioned_capacity_gb',
+                           pool.get('allocated_capacity_gb', 0))
+    if isinstance(provisioned, (int, float)):
+        pool['provisioned_capacity_gb'] = provisioned + size
+    allocated = pool.get('allocated_capacity_gb')
+    if isinstance(allocated, (int, float)):
+        pool['allocated_capacity_gb'] = allocated + size
+
+    # Thin volumes don't use space until data is written
+    if not (thin and pool.get('thin_provisioning_support')):
+        free = pool.get('free_capacity_gb')
+        if isinstance(free, (int, float)):
+            pool['free_capacity_gb'] = free - size
+
+
+class PoolSelector(object):
+    """Base class for the strategies that place new volumes in pools."""
+
+    def select(self, backend, pools, size, extra_specs=None):
+        """Return the pool, from the backend's pools stats, for a new volume.
+
+        Must return one of the elements of pools, that is never empty.
+        """
+        raise NotImplementedError()
+
+
+class FirstPoolSelector(PoolSelector):
+    """Always place new volumes in the first pool of the backend."""
+
+    def select(self, backend, pools, size, extra_specs=None):
+        return pools[0]
+
+
+class CapacityPoolSelector(PoolSelector):
+    """Place new volumes in the pools with more free capacity.
+
+    Pools with enough free capacity for the volume are preferred over those
+    that don't, and among them the one with the highest weight, which is the
+    free capacity multiplied by the multiplier, is selected.  A negative
+    multiplier stacks volumes in the pools with less free capacity, like
+    Cinder's capacity_weight_multiplier.  Pools with unknown capacity are
+    the last of the pools with enough capacity.
+    """
+
+    def __init__(self, multiplier=1.0):
+        self.multiplier = multiplier
+
+    def weigh(self, pool, size, thin):
+        """Return a sortable weight for the pool, highest is preferred."""
+        free = free_capacity(pool, thin)
+        # Like Cinder, we assume volumes fit in pools with unknown capacity
+        if free is None:
+            return (True, -INFINITE)
+        if not self.multiplier:
+            return (free >= size, 0)
+        return (free >= size, free * self.multiplier)
+
+    def select(self, backend, pools, size, extra_specs=None):
+        thin = is_thin(extra_specs)
+        # max returns the first pool with the highest weight
+        return max(pools, key=lambda pool: self.weigh(pool, size, thin))
+
+
+class Scheduler(object):
+    """Select the backend and pool for new volumes among several backends.
+
+    Pools are filtered by the extra specs and by their free capacity, and
+    the remaining ones are weighed with a CapacityPoolSelector.  Ties among
+    the pools with the highest weight are broken in round-robin, so a
+    multiplier of 0 spreads volumes evenly among the valid pools.
+
+    Scheduling only uses the stats cached in the backends, with the capacity
+    of the volumes scheduled and created since they were gathered, and pools'
+    capabilities are only rebuilt when a backend's stats are refreshed.
+    """
+
+    def __init__(self, multiplier=1.0):
+        self.weigher = CapacityPoolSelector(multiplier)
+        self._counter = itertools.count()
+        self._capabilities = {}
+        self._lock = threading.Lock()
+
+    def _get_capabilities(self, backend):
+        """Return the capabilities of the backend's pools by pool name."""
+        # Drivers may update their stats in place, so use the refresh time
+        updated_at = backend._stats_updated_at
+        cached = self._capabilities.get(backend.id)
+        if not cached or cached[0] != updated_at:
+            caps = {pool.get('pool_name'): pool_caps
+                    for pool, pool_caps in pools_capabilities(backend.stats())}
+            cached = (updated_at, caps)
+            self._capabilities[backend.id] = cached
+        return cached[1]
+
+    def get_weighed_pools(self, backends, size, extra_specs=None):
+        """Return the valid pools as a list of (weight, backend, pool).
+
+        The list is sorted with the highest weights first, and pools with
+        the same weight keep the order of the backends and their stats.
+        """
+        thin = is_thin(extra_specs)
+        result = []
+        for backend in backends:
+            capabilities = self._get_capabilities(backend)
+            for pool in backend._pools_stats():
+                caps = capabilities.get(pool.get('pool_name'))
+                if caps is None or not satisfies_extra_specs(caps,
+                                                             extra_specs):
+                    continue
+                weight = self.weigher.weigh(pool, size, thin)
+                # Like Cinder's capacity filter, discard pools without space
+                if not weight[0]:
+                    continue
+                result.append((weight, backend, pool))
+        result.sort(key=lambda x: x[0], reverse=True)
+        return result
+
+    def schedule(self, backends, size, extra_specs=None):
+        """Return a (backend, pool_name) tuple for a new volume.
+
+        The capacity of the volume is reserved in the selected pool, so it's
+        taken into account by the following schedules, and the volume created
+        in the pool with the same size and extra specs claims it.  Raises
+        NoValidBackend if no pool is valid.
+        """
+        with self._lock:
+            weighed = self.get_weighed_pools(backends, size, extra_specs)
+            if not weighed:
+                raise exception.NoValidBackend(
+                    reason='No pool with %sGB and extra specs %s' %
+                    (size, extra_specs))
+
+            best = weighed[0][0]
+            ties = [w for w in weighed if w[0] == best]
+            __, backend, pool = ties[next(self._counter) % len(ties)]
+            backend._reserve_capacity(pool['pool_name'], size, extra_specs,
+                                      scheduled=True)
+        return backend, pool['pool_name']
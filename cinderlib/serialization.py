@@ -31,15 +31,23 @@ from oslo_versionedobjects import base as base_ovo
 from oslo_versionedobjects import fields as ovo_fields
 
 from cinderlib import objects
+from cinderlib import utils as cinderlib_utils
 
 
 # Variable used to avoid circular references
 BACKEND_CLASS = None
 
+# How obj_to_primitive serializes each kind of field
+_RAW, _RAW_LIST, _RAW_DICT, _OBJECT, _OBJECT_LIST, _OTHER = range(6)
+# Per OVO class serialization plans, see _get_plan
+_PLANS = {}
+
 
 def setup(backend_class):
     global BACKEND_CLASS
     BACKEND_CLASS = backend_class
+    # Fields may have changed, for example with non_uuid_ids
+    _PLANS.clear()
 
     # Use custom dehydration methods that prevent maximum recursion errors
     # due to circular references:
@@ -81,25 +89,79 @@ def _set_visited(element, visited):
     return visited
 
 
+def _is_raw(field_type):
+    """Check if the field type's primitive is its value."""
+    return type(field_type).to_primitive is ovo_fields.FieldType.to_primitive
+
+
+def _get_field_kind(field):
+    field_type = field._type
+    if isinstance(field_type, ovo_fields.Object):
+        return _OBJECT
+    if isinstance(field_type, (ovo_fields.List, ovo_fields.Dict)):
+        element_type = field_type._element_type._type
+        if isinstance(field_type, ovo_fields.Dict):
+            return _RAW_DICT if _is_raw(element_type) else _OTHER
+        if isinstance(element_type, ovo_fields.Object):
+            return _OBJECT_LIST
+        return _RAW_LIST if _is_raw(element_type) else _OTHER
+    if _is_raw(field_type):
+        return _RAW
+    return _OTHER
+
+
+def _get_plan(ovo_cls):
+    """Return precomputed information to serialize OVOs of a class.
+
+    Returns the OVO's name, namespace, version, and a list of tuples with the
+    name, storage attribute, kind, and field for each of the class fields.
+    """
+    plan = _PLANS.get(ovo_cls)
+    if plan is None:
+        fields_plan = [(name, base_ovo._get_attrname(name),
+                        _get_field_kind(field), field)
+                       for name, field in ovo_cls.fields.items()]
+        plan = (ovo_cls.obj_name(), ovo_cls.OBJ_PROJECT_NAMESPACE,
+                ovo_cls.VERSION, fields_plan)
+        _PLANS[ovo_cls] = plan
+    return plan
+
+
 def obj_to_primitive(self, target_version=None,
                      version_manifest=None, visited=None):
     # No target_version, version_manifest, or changes support
     visited = _set_visited(self, visited)
+    obj_name, namespace, version, fields_plan = _get_plan(type(self))
+    # Checking the storage attribute is what obj_attr_is_set does
+    attrs = vars(self)
     primitive = {}
-    for name, field in self.fields.items():
-        if self.obj_attr_is_set(name):
-            value = getattr(self, name)
-            # Skip cycles
-            if id(value) in visited:
-                continue
-            primitive[name] = field.to_primitive(self, name, value,
-                                                 visited)
-
-    obj_name = self.obj_name()
+    for name, attrname, kind, field in fields_plan:
+        if attrname not in attrs:
+            continue
+        value = attrs[attrname]
+        if kind == _RAW:
+            primitive[name] = value
+        # Skip cycles
+        elif id(value) in visited:
+            continue
+        elif value is None:
+            primitive[name] = None
+        elif kind == _OBJECT:
+            # Call the method in case the OVO class overrides it
+            primitive[name] = value.obj_to_primitive(visited=visited)
+        elif kind == _OBJECT_LIST:
+            primitive[name] = _obj_list_to_primitive(value, visited)
+        elif kind == _RAW_LIST:
+            primitive[name] = list(value)
+        elif kind == _RAW_DICT:
+            primitive[name] = dict(value)
+        else:
+            primitive[name] = field.to_primitive(self, name, value, visited)
+
     obj = {
         self._obj_primitive_key('name'): obj_name,
-        self._obj_primitive_key('namespace'): self.OBJ_PROJECT_NAMESPACE,
-        self._obj_primitive_key('version'): self.VERSION,
+        self._obj_primitive_key('namespace'): namespace,
+        self._obj_primitive_key('version'): version,
         self._obj_primitive_key('data'): primitive
     }
 
@@ -112,6 +174,82 @@ def obj_to_primitive(self, target_version=None,
     return obj
 
 
+def _obj_list_to_primitive(value, visited):
+    result = []
+    for elem in value:
+        if id(elem) in visited:
+            continue
+        if elem is None:
+            result.append(None)
+        else:
+            result.append(elem.obj_to_primitive(visited=visited))
+    return result
+
+
+def _overrides_to_primitive(ovo):
+    method = six.get_unbound_function(type(ovo).obj_to_primitive)
+    return method is not obj_to_primitive
+
+
+def _only_ovo_data(primitive):
+    """Remove the versioned objects metadata from a serialized OVO."""
+    if isinstance(primitive, dict):
+        if 'versioned_object.data' in primitive:
+            value = primitive['versioned_object.data']
+            if ['objects'] == value.keys():
+                return _only_ovo_data(value['objects'])
+            key = primitive['versioned_object.name'].lower()
+            return {key: _only_ovo_data(value)}
+
+        for key in primitive.keys():
+            primitive[key] = _only_ovo_data(primitive[key])
+    if isinstance(primitive, list) and primitive:
+        return [_only_ovo_data(e) for e in primitive]
+    return primitive
+
+
+def obj_to_dict(ovo, visited=None):
+    """Return the OVO's data without the versioned objects metadata.
+
+    Returns the same as removing the metadata from obj_to_primitive's
+    result, but without building the intermediate primitive first.
+    """
+    if _overrides_to_primitive(ovo):
+        return _only_ovo_data(ovo.obj_to_primitive(visited=visited))
+
+    visited = _set_visited(ovo, visited)
+    obj_name, __, __, fields_plan = _get_plan(type(ovo))
+    attrs = vars(ovo)
+    data = {}
+    for name, attrname, kind, field in fields_plan:
+        if attrname not in attrs:
+            continue
+        value = attrs[attrname]
+        if kind == _RAW:
+            data[name] = value
+        elif id(value) in visited:
+            continue
+        elif value is None:
+            data[name] = None
+        elif kind == _OBJECT:
+            data[name] = obj_to_dict(value, visited)
+        elif kind == _OBJECT_LIST:
+            data[name] = [None if elem is None
+                          else obj_to_dict(elem, visited)
+                          for elem in value if id(elem) not in visited]
+        elif kind == _RAW_LIST:
+            data[name] = list(value)
+        elif kind == _RAW_DICT:
+            data[name] = dict(value)
+        else:
+            data[name] = _only_ovo_data(
+                field.to_primitive(ovo, name, value, visited))
+
+    if ['objects'] == data.keys():
+        return data['objects']
+    return {obj_name.lower(): data}
+
+
 def obj_from_primitive(
         cls, primitive, context=None,
         original_method=cinder_base_ovo.CinderObject.obj_from_primitive):
@@ -155,10 +293,18 @@ def dict_to_primitive(self, obj, attr, value, visited=None):
 
 
 def load(json_src, save=False):
-    """Load any json serialized cinderlib object."""
-    if isinstance(json_src, six.string_types):
+    """Load any json serialized cinderlib object.
+
+    Accepts Json data as Python objects, as a string, or in the compact
+    binary format.
+    """
+    if cinderlib_utils.is_packed(json_src):
+        json_src = cinderlib_utils.unpackb(json_src)
+    elif isinstance(json_src, six.string_types):
         json_src = json_lib.loads(json_src)
 
+    # Backend class must be available for getattr and the objects' load
+    objects.load_backend_class()
     if isinstance(json_src, list):
         return [getattr(objects, obj['class']).load(obj, save)
                 for obj in json_src]
@@ -184,3 +330,104 @@ def dump():
 def dumps():
     """Convert to a Json string everything we have in this system."""
     return json_lib.dumps(dump(), separators=(',', ':'))
+
+
+def jsonb():
+    """Convert to compact binary format everything we have in this system."""
+    return cinderlib_utils.packb(json())
+
+
+def dumpb():
+    """Convert to compact binary format everything we have in this system."""
+    return cinderlib_utils.packb(dump())
+
+
+def _write(fileobj, property_name):
+    """Write all backends to a file one volume at a time.
+
+    Produces the same contents as jsons and dumps without having to build the
+    whole document in memory first.
+    """
+    def _dumps(obj):
+        return json_lib.dumps(obj, separators=(',', ':'))
+
+    fileobj.write('[')
+    for i, backend in enumerate(BACKEND_CLASS.backends.values()):
+        if i:
+            fileobj.write(',')
+        fileobj.write('{"class":%s,"backend":%s,"volumes":[' %
+                      (_dumps(type(backend).__name__),
+                       _dumps(backend.config)))
+        for j, volume in enumerate(backend._serialize_volumes(property_name)):
+            if j:
+                fileobj.write(',')
+            fileobj.write(_dumps(volume))
+        fileobj.write(']}')
+    fileobj.write(']')
+
+
+def write_jsons(fileobj):
+    """Write to a file object the Json string of everything in this system."""
+    _write(fileobj, 'json')
+
+
+def write_dumps(fileobj):
+    """Write to a file object the Json string of everything in this system."""
+    _write(fileobj, 'dump')
+
+
+def _write_line(fileobj, data):
+    fileobj.write(json_lib.dumps(data, separators=(',', ':')))
+    fileobj.write('\n')
+
+
+def dump_to(fileobj):
+    """Write everything we have in this system to a file one per line.
+
+    Each line contains a single Json serialized resource, and each backend is
+    followed by its volumes, which include their snapshots and connections.
+
+    Volumes not already loaded in their backend are read from the persistence
+    storage one page at a time, so they are not all kept in memory.
+    """
+    for backend in BACKEND_CLASS.backends.values():
+        _write_line(fileobj, {'class': type(backend).__name__,
+                              'backend': backend.config})
+        # Volumes don't need to repeat the full backend configuration
+        backend_info = {'volume_backend_name': backend.id}
+        volumes = backend._volumes
+        if volumes is None:
+            volumes = backend.iter_volumes(eager_load=True)
+        for volume in volumes:
+            data = volume.dump
+            data['backend'] = backend_info
+            _write_line(fileobj, data)
+
+
+def load_from(fileobj, save=True):
+    """Load resources written by dump_to one line at a time.
+
+    Returns the list of loaded backends.  Volumes are added to their backend
+    only if it has already loaded its volumes or if we are not saving them
+    into the persistence storage, otherwise they will be loaded from the
+    storage when needed.
+    """
+    backends = []
+    for line in fileobj:
+        if not line.strip():
+            continue
+        data = json_lib.loads(line)
+        resource = getattr(objects, data['class']).load(data, save)
+        # Backends, or just their names if they are not present
+        if not isinstance(resource, objects.Object):
+            if isinstance(resource, BACKEND_CLASS):
+                backends.append(resource)
+            continue
+
+        backend = resource.backend
+        if isinstance(backend, BACKEND_CLASS):
+            if backend._volumes is not None:
+                cinderlib_utils.add_by_id(resource, backend._volumes)
+            elif not save:
+                backend._volumes = cinderlib_utils.IdList([resource])
+    return backends
@@ -0,0 +1,122 @@
+# Copyright (c) 2019, Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""In-process volume driver that doesn't use any storage.
+
+Volumes and snapshots only exist in the driver's memory, so it can be used to
+measure cinderlib's own overhead, without storage or host dependencies:
+
+    cinderlib.Backend(volume_driver=FakeVolumeDriver.PATH,
+                      volume_backend_name='fake')
+"""
+
+import threading
+import uuid
+
+from cinder.volume import driver
+
+
+class FakeVolumeDriver(driver.VolumeDriver):
+    PATH = __name__ + '.FakeVolumeDriver'
+    VERSION = '1.0.0'
+    POOL_NAME = 'fake_pool'
+    CAPACITY_GB = 1024 * 1024
+
+    def __init__(self, *args, **kwargs):
+        super(FakeVolumeDriver, self).__init__(*args, **kwargs)
+        self.volumes = {}
+        self.snapshots = {}
+        self._lock = threading.Lock()
+
+    def do_setup(self, context):
+        pass
+
+    def check_for_setup_error(self):
+        pass
+
+    def get_volume_stats(self, refresh=False):
+        if refresh or not self._stats:
+            with self._lock:
+                used = sum(self.volumes.values())
+            self._stats = {
+                'volume_backend_name': self.configuration.safe_get(
+                    'volume_backend_name'),
+                'vendor_name': 'Open Source',
+                'driver_version': self.VERSION,
+                'storage_protocol': 'fake',
+                'pools': [{
+                    'pool_name': self.POOL_NAME,
+                    'total_capacity_gb': self.CAPACITY_GB,
+                    'free_capacity_gb': self.CAPACITY_GB - used,
+                    'allocated_capacity_gb': used,
+                    'reserved_percentage': 0,
+                    'thin_provisioning_support': True,
+                    'thick_provisioning_support': False,
+                    'multiattach': True,
+                }],
+            }
+        return self._stats
+
+    def _add_volume(self, volume):
+        with self._lock:
+            self.volumes[volume.id] = volume.size
+
+    def create_volume(self, volume):
+        self._add_volume(volume)
+
+    def create_cloned_volume(self, volume, src_vref):
+        self._add_volume(volume)
+
+    def create_volume_from_snapshot(self, volume, snapshot):
+        self._add_volume(volume)
+
+    def extend_volume(self, volume, new_size):
+        with self._lock:
+            self.volumes[volume.id] = new_size
+
+    def delete_volume(self, volume):
+        with self._lock:
+            self.volumes.pop(volume.id, None)
+
+    def create_snapshot(self, snapshot):
+        with self._lock:
+            self.snapshots[snapshot.id] = snapshot.volume_id
+
+    def delete_snapshot(self, snapshot):
+        with self._lock:
+            self.snapshots.pop(snapshot.id, None)
+
+    def create_export(self, context, volume, connector):
+        pass
+
+    def ensure_export(self, context, volume):
+        pass
+
+    def remove_export(self, context, volume):
+        pass
+
+    def initialize_connection(self, volume, connector):
+        return {'driver_volume_type': 'iscsi',
+                'data': {'target_discovered': False,
+                         'target_portal': '127.0.0.1:3260',
+                         'target_iqn': 'iqn.2019-01.org.cinderlib:%s' %
+                                       volume.id,
+                         'target_lun': 0,
+                         'volume_id': volume.id,
+                         'auth_method': 'CHAP',
+                         'auth_username': 'cinderlib',
+                         'auth_password': uuid.uuid4().hex}}
+
+    def terminate_connection(self, volume, connector, **kwargs):
+        pass
@@ -0,0 +1,90 @@
+# Copyright (c) 2019, Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Helpers to time operations and report the results of benchmarks."""
+
+from __future__ import print_function
+
+import json
+import math
+import platform
+import time
+import timeit
+
+import cinderlib
+
+
+def percentile(ordered, percent):
+    """Nearest-rank percentile of a sorted list."""
+    index = int(math.ceil(percent / 100.0 * len(ordered))) - 1
+    return ordered[max(index, 0)]
+
+
+def summarize(suite, operation, latencies, operations=None, **labels):
+    """Return a dictionary with the throughput and latencies of calls.
+
+    Operations is the number of operations done by the calls, for calls that
+    do more than one, like bulk inserts, and defaults to the number of calls.
+    Latencies are in milliseconds, and labels are added to the result.
+    """
+    ordered = sorted(latencies)
+    total = sum(ordered)
+    operations = len(ordered) if operations is None else operations
+    result = {'suite': suite,
+              'operation': operation,
+              'count': operations,
+              'total_s': total,
+              'ops_per_sec': operations / total if total else None,
+              'mean_ms': total / len(ordered) * 1000,
+              'p50_ms': percentile(ordered, 50) * 1000,
+              'p99_ms': percentile(ordered, 99) * 1000,
+              'max_ms': ordered[-1] * 1000}
+    result.update(labels)
+    return result
+
+
+def timed(func, *args, **kwargs):
+    """Call func and return its result and how long it took."""
+    start = timeit.default_timer()
+    result = func(*args, **kwargs)
+    return result, timeit.default_timer() - start
+
+
+def timed_each(func, elements):
+    """Call func for each element and return the results and latencies."""
+    results = []
+    latencies = []
+    for element in elements:
+        result, latency = timed(func, element)
+        results.append(result)
+        latencies.append(latency)
+    return results, latencies
+
+
+def write_report(results, output=None, **metadata):
+    """Write the results, and the environment's metadata, as Json.
+
+    Writes to stdout if no output file name is provided.
+    """
+    metadata.update(time=time.time(),
+                    cinderlib_version=cinderlib.__version__,
+                    python_version=platform.python_version(),
+                    platform=platform.platform())
+    data = json.dumps({'metadata': metadata, 'results': results}, indent=2,
+                      sort_keys=True)
+    if output:
+        with open(output, 'w') as f:
+            f.write(data)
+    else:
+        print(data)
@@ -0,0 +1,423 @@
+# Copyright (c) 2019, Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Conformance and performance harness for persistence plugins.
+
+Runs the tests of the persistence plugins' contract, the same ones the
+plugins included in cinderlib pass, and a set of load profiles that report
+the ops/sec and latency percentiles of the plugin's operations:
+
+- bulk_insert: Insert volumes one at a time and in a single batch.
+- filtered_get: Get volumes, snapshots, and connections by their filters.
+- churn: Interleaved inserts, deletes, gets, and updates of volumes.
+- key_value: Set, get, update, and delete key-value pairs.
+
+Any plugin available on the cinderlib.persistence.storage entry point can be
+tested, with its configuration options passed as key=value pairs:
+
+ python -m cinderlib.tests.persistence_harness STORAGE [--config KEY=VALUE]
+     [--sizes 1000,10000,100000] [--operations 1000]
+     [--profiles bulk_insert,filtered_get,churn,key_value]
+     [--skip-contract] [--output FILE]
+
+Results are written as Json, like the ones of tools/benchmark.py.
+
+Plugins can also run the contract in their own test suites inheriting from
+PersistenceContractTest and setting PERSISTENCE_CFG.
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import json
+import random
+import sys
+import unittest
+
+import cinderlib
+from cinderlib.tests import fake_driver
+from cinderlib.tests import perf_utils
+from cinderlib.tests.unit.persistence import base
+
+
+BACKEND_NAME = 'harness'
+PAGE_SIZE = 100
+# Repetitions of the operations that return all the resources
+REPETITIONS = 3
+
+
+class PersistenceContractTest(base.BasePersistenceTest):
+    """Persistence contract tests that only use the plugins' interface.
+
+    Resources are removed after each test using the plugin's delete methods,
+    so the contract can run on any plugin regardless of how it stores them.
+    """
+
+    def tearDown(self):
+        pers = self.persistence
+        for connection in list(pers.get_connections()):
+            pers.delete_connection(connection)
+        for snapshot in list(pers.get_snapshots()):
+            pers.delete_snapshot(snapshot)
+        for volume in list(pers.get_volumes()):
+            pers.delete_volume(volume)
+        for key_value in list(pers.get_key_values(None)):
+            pers.delete_key_value(key_value)
+        super(PersistenceContractTest, self).tearDown()
+
+    def test_db(self):
+        # Drivers use these methods of the DB
+        for method in ('volume_get', 'snapshot_get', 'volume_type_get',
+                       'qos_specs_get'):
+            self.assertTrue(callable(getattr(self.persistence.db, method)))
+
+    def test_set_volume(self):
+        vol = cinderlib.Volume(self.backend, size=1, name='disk')
+        self.persistence.set_volume(vol)
+        res = self.persistence.get_volumes(volume_id=vol.id)
+        self.assertListEqualObj([vol], res)
+
+    def test_set_snapshot(self):
+        vol = cinderlib.Volume(self.backend, size=1, name='disk')
+        self.persistence.set_volume(vol)
+        snap = cinderlib.Snapshot(vol, name='disk')
+        self.persistence.set_snapshot(snap)
+        res = self.persistence.get_snapshots(snapshot_id=snap.id)
+        self.assertListEqualObj([snap], res)
+
+    def test_set_connection(self):
+        vol = cinderlib.Volume(self.backend, size=1, name='disk')
+        self.persistence.set_volume(vol)
+        conn = cinderlib.Connection(self.backend, volume=vol, connector={},
+                                    connection_info={'conn': {'data': {}}})
+        self.persistence.set_connection(conn)
+        res = self.persistence.get_connections(connection_id=conn.id)
+        self.assertListEqualObj([conn], res)
+
+    def test_set_key_values(self):
+        kv = cinderlib.KeyValue('key', 'value')
+        self.persistence.set_key_value(kv)
+        res = self.persistence.get_key_values('key')
+        self.assertEqual([('key', 'value')],
+                         [(r.key, r.value) for r in res])
+
+
+def contract_suite(persistence_config):
+    """Return a unittest suite with the contract tests for a plugin."""
+    test_class = type('PersistenceContractTest', (PersistenceContractTest,),
+                      {'PERSISTENCE_CFG': persistence_config})
+    return unittest.defaultTestLoader.loadTestsFromTestCase(test_class)
+
+
+def run_contract(persistence_config, verbosity=1):
+    """Run the contract tests for a plugin and return the unittest result."""
+    runner = unittest.TextTestRunner(verbosity=verbosity)
+    return runner.run(contract_suite(persistence_config))
+
+
+class _Profile(object):
+    """Measure the operations of a load profile and keep their results."""
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+        self.results = []
+
+    def add(self, operation, latencies, operations=None):
+        self.results.append(perf_utils.summarize(self.name, operation,
+                                                 latencies, operations,
+                                                 size=self.size))
+
+    def measure(self, operation, func, elements, operations=None):
+        res, latencies = perf_utils.timed_each(func, elements)
+        self.add(operation, latencies, operations)
+        return res
+
+
+def _check(condition, msg, *args):
+    # Not an assert, as they are stripped when running with -O
+    if not condition:
+        raise AssertionError(msg % args)
+
+
+def _check_single(results, resources, operation):
+    for res, resource in zip(results, resources):
+        _check(len(res) == 1 and res[0].id == resource.id,
+               '%s returned %s instead of %s', operation,
+               [r.id for r in res], resource.id)
+
+
+def _new_volumes(backend, count, prefix='vol'):
+    return [cinderlib.Volume(backend, size=1, name='%s%s' % (prefix, i),
+                             status='available',
+                             metadata={'key': 'value%s' % i})
+            for i in range(count)]
+
+
+def _delete(persistence, volumes=(), snapshots=(), connections=()):
+    for connection in connections:
+        persistence.delete_connection(connection)
+    for snapshot in snapshots:
+        persistence.delete_snapshot(snapshot)
+    for volume in volumes:
+        persistence.delete_volume(volume)
+
+
+def bulk_insert(persistence, backend, size, operations):
+    """Insert volumes one at a time and in a single batch."""
+    profile = _Profile('bulk_insert', size)
+    volumes = _new_volumes(backend, size)
+    profile.measure('set_volume', persistence.set_volume, volumes)
+    profile.measure('delete_volume', persistence.delete_volume, volumes)
+
+    volumes = _new_volumes(backend, size)
+    profile.measure('set_volumes', persistence.set_volumes, [volumes], size)
+    stored = persistence.get_volumes(backend_name=backend.id)
+    _check(len(stored) == size, 'set_volumes stored %s of %s volumes',
+           len(stored), size)
+    _delete(persistence, volumes)
+    return profile.results
+
+
+def filtered_get(persistence, backend, size, operations):
+    """Get volumes, snapshots, and connections by their filters.
+
+    Snapshots and connections are only created for the sampled volumes.
+    """
+    profile = _Profile('filtered_get', size)
+    volumes = _new_volumes(backend, size)
+    persistence.set_volumes(volumes)
+    sample = random.sample(volumes, min(size, operations))
+    snapshots = [cinderlib.Snapshot(vol, name='snap-' + vol.name)
+                 for vol in sample]
+    connections = [cinderlib.Connection(backend, volume=vol, connector={},
+                                        connection_info={'conn': {'data': {}}})
+                   for vol in sample]
+    for snapshot, connection in zip(snapshots, connections):
+        persistence.set_snapshot(snapshot)
+        persistence.set_connection(connection)
+
+    res = profile.measure(
+        'get_volumes_by_id',
+        lambda vol: persistence.get_volumes(volume_id=vol.id), sample)
+    _check_single(res, sample, 'get_volumes_by_id')
+    res = profile.measure(
+        'get_volumes_by_name',
+        lambda vol: persistence.get_volumes(volume_name=vol.name), sample)
+    _check_single(res, sample, 'get_volumes_by_name')
+    res = profile.measure(
+        'get_volumes_page',
+        lambda vol: persistence.get_volumes(backend_name=backend.id,
+                                            limit=PAGE_SIZE, marker=vol.id),
+        sample)
+    _check(all(len(page) <= PAGE_SIZE for page in res),
+           'get_volumes returned more than %s volumes', PAGE_SIZE)
+    res = profile.measure(
+        'get_volumes_by_backend',
+        lambda i: persistence.get_volumes(backend_name=backend.id),
+        range(REPETITIONS))
+    _check(len(res[0]) == size, 'get_volumes returned %s of %s volumes',
+           len(res[0]), size)
+
+    res = profile.measure(
+        'get_snapshots_by_id',
+        lambda snap: persistence.get_snapshots(snapshot_id=snap.id),
+        snapshots)
+    _check_single(res, snapshots, 'get_snapshots_by_id')
+    res = profile.measure(
+        'get_snapshots_by_volume',
+        lambda snap: persistence.get_snapshots(volume_id=snap.volume_id),
+        snapshots)
+    _check_single(res, snapshots, 'get_snapshots_by_volume')
+    res = profile.measure(
+        'get_connections_by_id',
+        lambda conn: persistence.get_connections(connection_id=conn.id),
+        connections)
+    _check_single(res, connections, 'get_connections_by_id')
+    res = profile.measure(
+        'get_connections_by_volume',
+        lambda conn: persistence.get_connections(volume_id=conn.volume_id),
+        connections)
+    _check_single(res, connections, 'get_connections_by_volume')
+
+    _delete(persistence, volumes, snapshots, connections)
+    return profile.results
+
+
+def churn(persistence, backend, size, operations):
+    """Interleave inserts, deletes, gets, and updates of volumes.
+
+    The number of stored volumes stays around size, as there are as many
+    inserts as deletes.
+    """
+    profile = _Profile('churn', size)
+    live = _new_volumes(backend, size)
+    persistence.set_volumes(live)
+    new_volumes = iter(_new_volumes(backend, operations, 'churn'))
+    # Same sequence of operations on every run
+    rand = random.Random(size)
+    latencies = collections.defaultdict(list)
+
+    for i in range(operations):
+        action = ('set_volume_insert', 'delete_volume', 'get_volumes_by_id',
+                  'set_volume_update')[i % 4]
+        if action == 'set_volume_insert':
+            volume = next(new_volumes)
+            __, latency = perf_utils.timed(persistence.set_volume, volume)
+            live.append(volume)
+        elif action == 'delete_volume':
+            index = rand.randrange(len(live))
+            volume = live[index]
+            live[index] = live[-1]
+            live.pop()
+            __, latency = perf_utils.timed(persistence.delete_volume, volume)
+        elif action == 'get_volumes_by_id':
+            volume = rand.choice(live)
+            res, latency = perf_utils.timed(persistence.get_volumes,
+                                            volume_id=volume.id)
+            _check_single([res], [volume], action)
+        else:
+            volume = rand.choice(live)
+            volume._ovo.status = 'in-use'
+            __, latency = perf_utils.timed(persistence.set_volume, volume)
+        latencies[action].append(latency)
+
+    for action, action_latencies in sorted(latencies.items()):
+        profile.add(action, action_latencies)
+
+    stored = persistence.get_volumes(backend_name=backend.id)
+    _check(len(stored) == len(live), 'Have %s volumes instead of %s',
+           len(stored), len(live))
+    _delete(persistence, live)
+    return profile.results
+
+
+def key_value(persistence, backend, size, operations):
+    """Set, get, update, and delete key-value pairs."""
+    profile = _Profile('key_value', size)
+    kvs = [cinderlib.KeyValue('harness-key%s' % i, 'value%s' % i)
+           for i in range(size)]
+    profile.measure('set_key_value_insert', persistence.set_key_value, kvs)
+
+    sample = random.sample(kvs, min(size, operations))
+    res = profile.measure('get_key_values_by_key',
+                          lambda kv: persistence.get_key_values(kv.key),
+                          sample)
+    for kv, result in zip(sample, res):
+        _check([(kv.key, kv.value)] == [(r.key, r.value) for r in result],
+               'get_key_values returned wrong data for %s', kv.key)
+
+    profile.measure(
+        'set_key_value_update',
+        lambda kv: persistence.set_key_value(cinderlib.KeyValue(kv.key, 'x')),
+        sample)
+    res = profile.measure('get_key_values_all',
+                          lambda i: persistence.get_key_values(None),
+                          range(REPETITIONS))
+    _check(len(res[0]) == size, 'get_key_values returned %s of %s pairs',
+           len(res[0]), size)
+
+    profile.measure('delete_key_value', persistence.delete_key_value, kvs)
+    return profile.results
+
+
+PROFILES = collections.OrderedDict(
+    (profile.__name__, profile)
+    for profile in (bulk_insert, filtered_get, churn, key_value))
+
+
+def run_profiles(persistence, backend, sizes, operations,
+                 profiles=tuple(PROFILES)):
+    """Run load profiles on a plugin and return their results.
+
+    Operations is the number of operations of the profiles that don't
+    operate on all the stored resources, like gets by id or churn.  The
+    plugin should be empty, and it will be left empty.
+    """
+    results = []
+    for size in sizes:
+        for name in profiles:
+            results.extend(PROFILES[name](persistence, backend, size,
+                                          operations))
+    return results
+
+
+def _set_up(persistence_config):
+    # We may be called from code that has already set up cinderlib
+    if cinderlib.Backend.global_initialization:
+        cinderlib.Backend.set_persistence(persistence_config)
+    else:
+        cinderlib.setup(persistence_config=persistence_config)
+    return cinderlib.Backend(volume_driver=fake_driver.FakeVolumeDriver.PATH,
+                             volume_backend_name=BACKEND_NAME)
+
+
+def _config_option(option):
+    key, __, value = option.partition('=')
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass
+    return key, value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Check the conformance and the performance of a '
+                    'cinderlib persistence plugin.')
+    parser.add_argument('storage',
+                        help='Name of the plugin in the '
+                             'cinderlib.persistence.storage entry point')
+    parser.add_argument('--config', type=_config_option, action='append',
+                        default=[], metavar='KEY=VALUE',
+                        help='Plugin configuration option, values are '
+                             'parsed as Json when possible')
+    parser.add_argument('--sizes',
+                        type=lambda v: [int(s) for s in v.split(',')],
+                        default=[1000, 10000, 100000],
+                        help='Comma separated number of stored resources')
+    parser.add_argument('--operations', type=int, default=1000,
+                        help='Number of sampled operations of each type')
+    parser.add_argument('--profiles', type=lambda v: v.split(','),
+                        default=list(PROFILES),
+                        help='Comma separated profiles to run: %s' %
+                             ','.join(PROFILES))
+    parser.add_argument('--skip-contract', action='store_true',
+                        help="Don't run the contract tests")
+    parser.add_argument('--output', help='File for the Json results')
+    args = parser.parse_args(argv)
+
+    unknown = set(args.profiles).difference(PROFILES)
+    if unknown:
+        parser.error('Unknown profiles: %s' % ', '.join(sorted(unknown)))
+
+    config = dict(args.config, storage=args.storage)
+    if not args.skip_contract:
+        if not run_contract(config).wasSuccessful():
+            print('Plugin does not conform to the contract', file=sys.stderr)
+            return 1
+
+    backend = _set_up(config)
+    results = run_profiles(backend.persistence, backend, args.sizes,
+                           args.operations, args.profiles)
+    for result in results:
+        result['persistence'] = args.storage
+    perf_utils.write_report(results, args.output, persistence=args.storage,
+                            sizes=args.sizes, operations=args.operations)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
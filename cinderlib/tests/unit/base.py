@@ -34,12 +34,20 @@ def _replace_oslo_cli_parse():
                                                                cfg.ConfigOpts)
 
 
-_replace_oslo_cli_parse()
-cinderlib.setup(persistence_config={'storage': utils.get_mock_persistence()})
-
-
 class BaseTest(unittest2.TestCase):
     PERSISTENCE_CFG = None
+    # Cinderlib is set up once with the mock persistence, like the unit
+    # tests expect, but not on import so we can reuse the tests elsewhere.
+    _cinderlib_set_up = False
+
+    @classmethod
+    def setUpClass(cls):
+        super(BaseTest, cls).setUpClass()
+        if not cls.PERSISTENCE_CFG and not BaseTest._cinderlib_set_up:
+            _replace_oslo_cli_parse()
+            cinderlib.setup(
+                persistence_config={'storage': utils.get_mock_persistence()})
+            BaseTest._cinderlib_set_up = True
 
     def setUp(self):
         if not self.PERSISTENCE_CFG:
@@ -48,7 +56,6 @@ class BaseTest(unittest2.TestCase):
         self.backend_name = 'fake_backend'
         self.backend = utils.FakeBackend(volume_backend_name=self.backend_name)
         self.persistence = self.backend.persistence
-        cinderlib.Backend._volumes_inflight = {}
 
     def tearDown(self):
         # Clear all existing backends
@@ -121,9 +121,8 @@ class TestSnapshot(base.BaseTest):
         create_mock.side_effect = exception.NotFound
         with self.assertRaises(exception.NotFound) as assert_context:
             self.snap.create_volume()
-        self.assertEqual(1, len(self.backend._volumes_inflight))
-        vol2 = list(self.backend._volumes_inflight.values())[0]
-        self.assertEqual(vol2, assert_context.exception.resource)
+        self.assertEqual(0, len(self.backend._volumes_inflight))
+        vol2 = assert_context.exception.resource
         create_mock.assert_called_once_with(vol2, self.snap._ovo)
         self.assertEqual('error', vol2.status)
         self.persistence.set_volume.assert_called_once_with(mock.ANY)
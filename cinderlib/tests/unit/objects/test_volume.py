@@ -16,8 +16,10 @@
 import mock
 
 from cinderlib import exception
+from cinderlib import metrics
 from cinderlib import objects
 from cinderlib.tests.unit import base
+from cinderlib import utils
 
 
 class TestVolume(base.BaseTest):
@@ -53,11 +55,45 @@ class TestVolume(base.BaseTest):
         self.assertIsNotNone(vol2.id)
         self.assertNotEqual(vol.id, vol2.id)
 
+    def test_init_select_pool(self):
+        with mock.patch.object(
+                self.backend, '_select_pool',
+                return_value=('pool2', mock.sentinel.reservation)
+        ) as mock_select:
+            vol = objects.Volume(self.backend, size=10,
+                                 extra_specs={'k': 'v'})
+        mock_select.assert_called_once_with(10, {'k': 'v'}, reserve=True)
+        self.assertTrue(vol._ovo.host.endswith('@%s#pool2' %
+                                               self.backend_name))
+        self.assertEqual(mock.sentinel.reservation, vol._reservation)
+
+    def test_init_pool_name(self):
+        with mock.patch.object(self.backend, '_select_pool') as mock_select:
+            vol = objects.Volume(self.backend, size=10, pool_name='pool3')
+        mock_select.assert_not_called()
+        self.assertTrue(vol._ovo.host.endswith('#pool3'))
+
     def test_init_from_ovo(self):
         vol = objects.Volume(self.backend, size=10)
         vol2 = objects.Volume(self.backend, __ovo=vol._ovo)
         self.assertEqual(vol._ovo, vol2._ovo)
 
+    def test_init_from_ovo_id_lists(self):
+        vol = objects.Volume(self.backend, size=10)
+        snap = objects.Snapshot(vol)
+        vol._ovo.snapshots.objects.append(snap._ovo)
+        vol2 = objects.Volume(self.backend, __ovo=vol._ovo)
+
+        self.assertIsInstance(vol2._snapshots, utils.IdList)
+        self.assertIsInstance(vol2._connections, utils.IdList)
+        self.assertIsInstance(vol2._ovo.snapshots.objects, utils.IdList)
+        self.assertIsInstance(vol2._ovo.volume_attachment.objects,
+                              utils.IdList)
+        self.assertEqual([snap.id], [s.id for s in vol2.snapshots])
+        vol2._snapshot_removed(snap)
+        self.assertEqual([], vol2.snapshots)
+        self.assertEqual([], vol2._ovo.snapshots.objects)
+
     def test_snapshots_lazy_loading(self):
         vol = objects.Volume(self.backend, size=10)
         vol._snapshots = None
@@ -136,11 +172,63 @@ class TestVolume(base.BaseTest):
         self.assertEqual('available', vol.status)
         self.persistence.set_volume.assert_called_once_with(vol)
 
+    def test_create_metrics(self):
+        registry = metrics.Registry()
+        registry.enabled = True
+        self.patch('cinderlib.metrics.REGISTRY', registry)
+        events = []
+        registry.add_callback(events.append)
+        self.backend.driver.create_volume.return_value = None
+
+        vol = self.backend.create_volume(10)
+
+        self.assertEqual(1, len(events))
+        self.assertEqual((self.backend.id, 'create_volume', vol.id,
+                          'success', None), events[0][:5])
+        self.assertEqual({'driver', 'persistence'}, set(events[0].phases))
+
+    def test_create_metrics_failure(self):
+        registry = metrics.Registry()
+        registry.enabled = True
+        self.patch('cinderlib.metrics.REGISTRY', registry)
+        events = []
+        registry.add_callback(events.append)
+        self.backend.driver.create_volume.side_effect = ValueError
+
+        self.assertRaises(ValueError, self.backend.create_volume, 10)
+
+        self.assertEqual('error', events[0].outcome)
+        self.assertEqual('ValueError', events[0].error)
+        self.assertEqual({'driver', 'persistence'}, set(events[0].phases))
+
+    def test_create_limited(self):
+        self.backend.set_operation_limits({'create_volume': 1})
+
+        def create_volume(ovo):
+            stats = self.backend.limiter.stats()['create_volume']
+            self.assertEqual(1, stats['in_flight'])
+
+        self.backend.driver.create_volume.side_effect = create_volume
+        self.backend.create_volume(10)
+        stats = self.backend.limiter.stats()['create_volume']
+        self.assertEqual(0, stats['in_flight'])
+        self.assertEqual(1, stats['total'])
+
+    def test_create_inflight(self):
+        def create_volume(ovo):
+            self.assertIs(vol, self.backend._get_inflight_volume(ovo.id))
+
+        self.backend.driver.create_volume.side_effect = create_volume
+        vol = objects.Volume(self.backend, size=10)
+        vol.create()
+        self.assertEqual(0, len(self.backend._volumes_inflight))
+
     def test_create_error(self):
         self.backend.driver.create_volume.side_effect = exception.NotFound
         with self.assertRaises(exception.NotFound) as assert_context:
             self.backend.create_volume(10, name='vol_name', description='des')
         vol = assert_context.exception.resource
+        self.assertEqual(0, len(self.backend._volumes_inflight))
         self.assertIsInstance(vol, objects.Volume)
         self.assertEqual(10, vol.size)
         self.assertEqual('vol_name', vol.name)
@@ -221,10 +309,9 @@ class TestVolume(base.BaseTest):
         with self.assertRaises(exception.NotFound) as assert_context:
             vol.clone(size=11)
 
-        # Cloning volume is still in flight
-        self.assertEqual(1, len(self.backend._volumes_inflight))
-        new_vol = list(self.backend._volumes_inflight.values())[0]
-        self.assertEqual(new_vol, assert_context.exception.resource)
+        # Failed volume is no longer in flight
+        self.assertEqual(0, len(self.backend._volumes_inflight))
+        new_vol = assert_context.exception.resource
         mock_clone.assert_called_once_with(new_vol, vol._ovo)
 
         self.persistence.set_volume.assert_called_once_with(new_vol)
@@ -359,7 +446,8 @@ class TestVolume(base.BaseTest):
     @mock.patch('cinderlib.objects.Connection.connect')
     def test_connect(self, mock_connect):
         vol = objects.Volume(self.backend_name, status='available', size=10)
-        mock_connect.return_value._ovo = objects.cinder_objs.VolumeAttachment()
+        mock_connect.return_value._ovo = objects.cinder_objs.VolumeAttachment(
+            id='fake-uuid')
 
         mock_export = self.backend.driver.create_export
         mock_export.return_value = None
@@ -19,6 +19,7 @@ from cinder.db.sqlalchemy import models
 from oslo_versionedobjects import fields
 
 import cinderlib
+from cinderlib import exception
 from cinderlib.tests.unit import base
 from cinderlib.tests.unit import utils
 
@@ -26,6 +27,7 @@ from cinderlib.tests.unit import utils
 class BasePersistenceTest(base.BaseTest):
     @classmethod
     def setUpClass(cls):
+        super(BasePersistenceTest, cls).setUpClass()
         cls.original_impl = volume_cmd.session.IMPL
         cinderlib.Backend.global_initialization = False
         cinderlib.setup(persistence_config=cls.PERSISTENCE_CFG)
@@ -116,6 +118,96 @@ class BasePersistenceTest(base.BaseTest):
     def test_set_volume(self):
         raise NotImplementedError('Test class must implement this method')
 
+    def test_set_volumes(self):
+        vols = [cinderlib.Volume(self.backend, size=i, name='disk%s' % i)
+                for i in range(1, 3)]
+        self.persistence.set_volumes(vols)
+        res = self.persistence.get_volumes()
+        self.assertListEqualObj(self.sorted(vols), self.sorted(res))
+
+    def test_batch(self):
+        vol = cinderlib.Volume(self.backend, size=1, name='disk')
+        snap = cinderlib.Snapshot(vol, name='snap')
+        with self.persistence.batch():
+            self.persistence.set_volume(vol)
+            self.persistence.set_snapshot(snap)
+            vol._ovo.size = 2
+            self.persistence.set_volume(vol)
+
+        res = self.persistence.get_volumes(volume_id=vol.id)
+        self.assertListEqualObj([vol], res)
+        self.assertEqual(2, res[0].size)
+        res = self.persistence.get_snapshots(volume_id=vol.id)
+        self.assertListEqualObj([snap], res)
+
+    def test_get_volumes_eager_load(self):
+        snaps = self.create_snapshots()
+        vol = snaps[0].volume
+        conn = cinderlib.Connection(self.backend, volume=vol,
+                                    connection_info={'conn': {'data': {}}})
+        self.persistence.set_connection(conn)
+        # Make the volume look like it has not loaded its snapshots and
+        # connections, in case the plugin returns the same instance.
+        vol._snapshots = vol._connections = None
+
+        res = self.persistence.get_volumes(volume_id=vol.id, eager_load=True)
+        self.assertListEqualObj([vol], res)
+        self.assertIsNotNone(res[0]._snapshots)
+        self.assertIsNotNone(res[0]._connections)
+        self.assertListEqualObj([snaps[0]], res[0].snapshots)
+        self.assertListEqualObj([conn], res[0].connections)
+
+    def test_get_volumes_sorted(self):
+        vols = self.create_n_volumes(3)
+        res = self.persistence.get_volumes(sort_keys=['size'],
+                                           sort_dirs=['desc'])
+        self.assertListEqualObj(self.sorted(vols, 'size')[::-1], res)
+
+    def test_get_volumes_limit(self):
+        vols = self.create_n_volumes(3)
+        res = self.persistence.get_volumes(sort_keys=['size'],
+                                           sort_dirs=['asc'], limit=2)
+        self.assertListEqualObj(self.sorted(vols, 'size')[:2], res)
+
+    def test_get_volumes_limit_eager_load(self):
+        snaps = self.sorted(self.create_snapshots(), 'volume_size')
+        snaps[0].volume._snapshots = None
+        res = self.persistence.get_volumes(sort_keys=['size'],
+                                           sort_dirs=['asc'], limit=1,
+                                           eager_load=True)
+        self.assertListEqualObj([snaps[0].volume], res)
+        self.assertListEqualObj([snaps[0]], res[0].snapshots)
+
+    def test_get_volumes_marker(self):
+        vols = self.sorted(self.create_n_volumes(4), 'size')
+        res = self.persistence.get_volumes(sort_keys=['size'],
+                                           sort_dirs=['asc'], limit=2,
+                                           marker=vols[1].id)
+        self.assertListEqualObj(vols[2:], res)
+
+    def test_get_volumes_marker_last(self):
+        vols = self.sorted(self.create_n_volumes(2), 'size')
+        res = self.persistence.get_volumes(sort_keys=['size'],
+                                           sort_dirs=['asc'], limit=2,
+                                           marker=vols[-1].id)
+        self.assertListEqualObj([], res)
+
+    def test_get_volumes_marker_not_found(self):
+        self.create_n_volumes(2)
+        self.assertRaises(exception.VolumeNotFound,
+                          self.persistence.get_volumes, limit=1,
+                          marker='fake-uuid')
+
+    def test_get_volumes_default_sort_pages(self):
+        vols = self.create_n_volumes(5)
+        res = []
+        marker = None
+        for i in range(3):
+            page = self.persistence.get_volumes(limit=2, marker=marker)
+            res.extend(page)
+            marker = page[-1].id
+        self.assertListEqualObj(vols, self.sorted(res))
+
     def test_get_volumes_all(self):
         vols = self.create_n_volumes(2)
         res = self.persistence.get_volumes()
@@ -17,7 +17,10 @@ import tempfile
 
 from cinder.db.sqlalchemy import api as sqla_api
 from cinder import objects as cinder_ovos
+import mock
 from oslo_db import api as oslo_db_api
+from oslo_db import exception
+import sqlalchemy
 
 import cinderlib
 from cinderlib.persistence import dbms
@@ -36,6 +39,7 @@ class TestDBPersistence(base.BasePersistenceTest):
         sqla_api.model_query(self.context,
                              sqla_api.models.Volume).delete()
         sqla_api.get_session().query(dbms.KeyValue).delete()
+        sqla_api.get_session().query(dbms.VolumeBackend).delete()
         super(TestDBPersistence, self).tearDown()
 
     def test_db(self):
@@ -94,6 +98,256 @@ class TestDBPersistence(base.BasePersistenceTest):
 
         self.assertEqualObj(conn, cl_conn)
 
+    def test_batch_writes_on_exit(self):
+        vol = cinderlib.Volume(self.backend, size=1, name='disk')
+        with self.persistence.batch():
+            self.persistence.set_volume(vol)
+            self.assertListEqual([], sqla_api.volume_get_all(self.context))
+        self.assertEqual(1, len(sqla_api.volume_get_all(self.context)))
+
+    def test_batch_single_transaction(self):
+        vols = [cinderlib.Volume(self.backend, size=i) for i in range(1, 4)]
+        with mock.patch.object(sqla_api, 'get_session',
+                               wraps=sqla_api.get_session) as mock_session:
+            self.persistence.set_volumes(vols)
+        mock_session.assert_called_once_with()
+        self.assertEqual(3, len(sqla_api.volume_get_all(self.context)))
+
+    def test_batch_update_existing(self):
+        vols = self.create_n_volumes(2)
+        vols[0]._ovo.size = 10
+        vols[0]._ovo.metadata = {'k': 'v'}
+        with self.persistence.batch():
+            self.persistence.set_volume(vols[0])
+            # Resources with id changes that are already in the DB
+            self.persistence.set_volume(cinderlib.Volume(
+                self.backend, __ovo=vols[1]._ovo.obj_clone()))
+
+        res = self.persistence.get_volumes(volume_id=vols[0].id)[0]
+        self.assertEqual(10, res.size)
+        self.assertEqual({'k': 'v'}, res.metadata)
+        self.assertEqual(2, len(sqla_api.volume_get_all(self.context)))
+
+    def test_batch_volume_type(self):
+        qos_specs = {'q1': 'r1'}
+        extra_specs = {'k1': 'v1'}
+        vol = cinderlib.Volume(self.backend, size=1, qos_specs=qos_specs,
+                               extra_specs=extra_specs)
+        self.persistence.set_volumes([vol])
+
+        res = self.persistence.get_volumes(volume_id=vol.id)
+        self.assertListEqualObj([vol], res)
+        self._check_volume_type(extra_specs, qos_specs, res[0])
+
+    def test_batch_existing_volume_type(self):
+        qos_specs = {'q1': 'r1'}
+        extra_specs = {'k1': 'v1'}
+        vol = cinderlib.Volume(self.backend, size=1, qos_specs=qos_specs,
+                               extra_specs=extra_specs)
+        self.persistence.set_volume(vol)
+        # Leave the volume type and QoS specs behind
+        sqla_api.model_query(self.context, sqla_api.models.Volume).delete()
+        sqla_api.get_session().query(dbms.VolumeBackend).delete()
+
+        self.persistence.set_volumes([vol])
+
+        res = self.persistence.get_volumes(volume_id=vol.id)
+        self.assertListEqualObj([vol], res)
+        self._check_volume_type(extra_specs, qos_specs, res[0])
+
+    def test_batch_shared_volume_type(self):
+        vol = cinderlib.Volume(self.backend, size=1, qos_specs={'q1': 'r1'},
+                               extra_specs={'k1': 'v1'})
+        vol2 = cinderlib.Volume(self.backend, size=2)
+        vol2._ovo.volume_type = vol._ovo.volume_type
+        vol2._ovo.volume_type_id = vol.volume_type_id
+
+        self.persistence.set_volumes([vol, vol2])
+
+        res = self.persistence.get_volumes(volume_id=vol2.id)
+        self.assertEqual(vol.volume_type_id, res[0].volume_type_id)
+        self.assertEqual({'k1': 'v1'}, res[0].volume_type.extra_specs)
+
+    def test_batch_flushed_on_error(self):
+        self.backend.driver.create_volume.side_effect = [None, ValueError]
+        vols = []
+
+        def batch():
+            with self.persistence.batch():
+                vols.append(self.backend.create_volume(1, name='disk1'))
+                self.backend.create_volume(2, name='disk2')
+
+        self.assertRaises(ValueError, batch)
+        # The created volume and the failed one are both stored
+        res = self.sorted(self.persistence.get_volumes(), 'size')
+        self.assertEqual([(vols[0].id, 'available'), (mock.ANY, 'error')],
+                         [(vol.id, vol.status) for vol in res])
+        # The next writes are not batched
+        vols[0]._ovo.status = 'in-use'
+        self.persistence.set_volume(vols[0])
+        res = self.persistence.get_volumes(volume_id=vols[0].id)
+        self.assertEqual('in-use', res[0].status)
+
+    @mock.patch('cinderlib.persistence.dbms.DBPersistence._flush',
+                side_effect=[exception.DBError, None])
+    def test_batch_flush_error_on_error(self, mock_flush):
+        def batch():
+            with self.persistence.batch():
+                raise ValueError()
+
+        # We get the original exception
+        self.assertRaises(ValueError, batch)
+        mock_flush.assert_called_once_with(mock.ANY)
+
+    def test_batch_connection(self):
+        vol = cinderlib.Volume(self.backend, size=1, name='disk')
+        conn = cinderlib.Connection(self.backend, volume=vol, connector={},
+                                    connection_info={'conn': {'data': {}}})
+        with self.persistence.batch():
+            self.persistence.set_volume(vol)
+            self.persistence.set_connection(conn)
+            conn._ovo.attach_mode = 'ro'
+            self.persistence.set_connection(conn)
+
+        res = self.persistence.get_connections(volume_id=vol.id)
+        self.assertListEqualObj([conn], res)
+        self.assertEqual('ro', res[0].attach_mode)
+
+    def test_batch_delete_pending(self):
+        vol = cinderlib.Volume(self.backend, size=1, name='disk')
+        with self.persistence.batch():
+            self.persistence.set_volume(vol)
+            self.persistence.delete_volume(vol)
+        self.assertListEqual([], sqla_api.volume_get_all(self.context))
+
+    def test_batch_nested(self):
+        vol = cinderlib.Volume(self.backend, size=1, name='disk')
+        with self.persistence.batch():
+            with self.persistence.batch():
+                self.persistence.set_volume(vol)
+            self.assertListEqual([], sqla_api.volume_get_all(self.context))
+        self.assertEqual(1, len(sqla_api.volume_get_all(self.context)))
+
+    def _get_queries(self, func, *args, **kwargs):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = sqla_api.get_engine()
+        sqlalchemy.event.listen(engine, 'before_cursor_execute',
+                                before_cursor_execute)
+        try:
+            res = func(*args, **kwargs)
+        finally:
+            sqlalchemy.event.remove(engine, 'before_cursor_execute',
+                                    before_cursor_execute)
+        return res, statements
+
+    def _load_volumes(self, **kwargs):
+        res = self.persistence.get_volumes(**kwargs)
+        for vol in res:
+            vol.snapshots
+            vol.connections
+            vol.volume_type.extra_specs
+            vol.volume_type.qos_specs
+        return res
+
+    def test_get_volumes_eager_load_constant_queries(self):
+        def create(n):
+            vols = []
+            for i in range(n):
+                vol = cinderlib.Volume(self.backend, size=1,
+                                       qos_specs={'q': str(i)},
+                                       extra_specs={'k': str(i)})
+                vols.append(vol)
+                self.persistence.set_volume(vol)
+                snap = cinderlib.Snapshot(vol)
+                self.persistence.set_snapshot(snap)
+                conn = cinderlib.Connection(
+                    self.backend, volume=vol, connector={},
+                    connection_info={'conn': {'data': {}}})
+                self.persistence.set_connection(conn)
+            return vols
+
+        create(2)
+        res, few = self._get_queries(self._load_volumes, eager_load=True)
+        self.assertEqual(2, len(res))
+        create(3)
+        res, many = self._get_queries(self._load_volumes, eager_load=True)
+        self.assertEqual(5, len(res))
+
+        # Cinder checks the legacy attachment specs of each attachment
+        def split(statements):
+            specs = [stmt for stmt in statements
+                     if 'FROM attachment_specs' in stmt]
+            others = [stmt for stmt in statements
+                      if stmt not in specs and stmt != 'SELECT 1']
+            return specs, others
+
+        few_specs, few_others = split(few)
+        many_specs, many_others = split(many)
+        self.assertEqual((2, 5), (len(few_specs), len(many_specs)))
+        self.assertEqual(len(few_others), len(many_others))
+
+        lazy_res, lazy = self._get_queries(self._load_volumes)
+        self.assertGreater(len(lazy), len(many))
+        for vol in res + lazy_res:
+            self.assertEqual(1, len(vol.snapshots))
+            self.assertEqual(1, len(vol.connections))
+            self.assertEqual(vol.volume_type.extra_specs['k'],
+                             vol.volume_type.qos_specs.specs['q'])
+
+    def _get_volume_backends(self):
+        query = sqla_api.get_session().query(dbms.VolumeBackend)
+        return {row.volume_id: row.backend_name for row in query}
+
+    def test_volume_backend_indexed(self):
+        indexes = sqlalchemy.inspect(sqla_api.get_engine()).get_indexes(
+            dbms.VolumeBackend.__tablename__)
+        self.assertIn(['backend_name'],
+                      [index['column_names'] for index in indexes])
+
+    def test_set_volume_backend(self):
+        vol = cinderlib.Volume(self.backend, size=1, name='disk')
+        self.persistence.set_volume(vol)
+        self.assertEqual({vol.id: self.backend.id},
+                         self._get_volume_backends())
+
+        vol._ovo.host = 'host@fake2#pool'
+        self.persistence.set_volume(vol)
+        self.assertEqual({vol.id: 'fake2'}, self._get_volume_backends())
+
+        self.persistence.delete_volume(vol)
+        self.assertEqual({}, self._get_volume_backends())
+
+    def test_batch_volume_backend(self):
+        vol = cinderlib.Volume(self.backend, size=1, name='disk')
+        self.persistence.set_volumes([vol])
+        self.assertEqual({vol.id: self.backend.id},
+                         self._get_volume_backends())
+
+        vol._ovo.host = 'host@fake2#pool'
+        self.persistence.set_volumes([vol])
+        self.assertEqual({vol.id: 'fake2'}, self._get_volume_backends())
+
+    def test_get_volumes_by_backend_no_like(self):
+        vols = self.create_n_volumes(2)
+        res, statements = self._get_queries(self.persistence.get_volumes,
+                                            backend_name=self.backend.id)
+        self.assertListEqualObj(vols, self.sorted(res))
+        query = [stmt for stmt in statements if 'volumes.host' in stmt][0]
+        self.assertNotIn('LIKE', query)
+        self.assertIn(dbms.VolumeBackend.__tablename__, query)
+
+    def test_migrate_volume_backends(self):
+        vols = self.create_n_volumes(2)
+        sqla_api.get_session().query(dbms.VolumeBackend).delete()
+
+        self.persistence._migrate_volume_backends()
+        self.assertEqual({vol.id: self.backend.id for vol in vols},
+                         self._get_volume_backends())
+
     def test_set_key_values(self):
         res = sqla_api.get_session().query(dbms.KeyValue).all()
         self.assertListEqual([], res)
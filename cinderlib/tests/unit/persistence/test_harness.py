@@ -0,0 +1,34 @@
+# Copyright (c) 2019, Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from cinderlib.tests import persistence_harness
+
+
+class TestMemoryContract(persistence_harness.PersistenceContractTest):
+    PERSISTENCE_CFG = {'storage': 'memory'}
+
+    def test_run_profiles(self):
+        res = persistence_harness.run_profiles(self.persistence, self.backend,
+                                               sizes=[10, 20], operations=5)
+
+        self.assertEqual(set(persistence_harness.PROFILES),
+                         {r['suite'] for r in res})
+        self.assertEqual({10, 20}, {r['size'] for r in res})
+        for result in res:
+            self.assertGreater(result['count'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        # Profiles leave the plugin empty
+        self.assertEqual([], list(self.persistence.get_volumes()))
+        self.assertEqual([], list(self.persistence.get_key_values(None)))
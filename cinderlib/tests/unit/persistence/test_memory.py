@@ -13,6 +13,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+
 import cinderlib
 from cinderlib.tests.unit.persistence import base
 
@@ -64,3 +66,40 @@ class TestMemoryPersistence(base.BasePersistenceTest):
         self.persistence.set_key_value(expected[0])
         self.assertTrue('key' in self.persistence.key_values)
         self.assertEqual(expected, list(self.persistence.key_values.values()))
+
+
+class TestIndexedMemoryPersistence(TestMemoryPersistence):
+    PERSISTENCE_CFG = {'storage': 'memory_indexed'}
+
+    def tearDown(self):
+        self.persistence.indexes = collections.defaultdict(dict)
+        self.persistence.indexed_values = {}
+        super(TestIndexedMemoryPersistence, self).tearDown()
+
+    def test_get_volumes_by_name_after_rename(self):
+        vol = self.create_volumes([{'size': 1, 'name': 'disk'}])[0]
+        vol._ovo.display_name = 'disk2'
+        self.persistence.set_volume(vol)
+
+        res = self.persistence.get_volumes(volume_name='disk')
+        self.assertListEqualObj([], res)
+        res = self.persistence.get_volumes(volume_name='disk2')
+        self.assertListEqualObj([vol], res)
+
+    def test_delete_volume_removes_from_indexes(self):
+        vols = self.create_n_volumes(2)
+        self.persistence.delete_volume(vols[0])
+
+        res = self.persistence.get_volumes(backend_name=self.backend.id)
+        self.assertListEqualObj([vols[1]], res)
+        self.assertNotIn(vols[0].name,
+                         self.persistence.indexes[('volumes',
+                                                   'display_name')])
+        self.assertNotIn(('volumes', vols[0].id),
+                         self.persistence.indexed_values)
+
+    def test_get_snapshots_by_volume_after_delete(self):
+        snaps = self.create_snapshots()
+        self.persistence.delete_snapshot(snaps[0])
+        res = self.persistence.get_snapshots(volume_id=snaps[0].volume_id)
+        self.assertListEqualObj([], res)
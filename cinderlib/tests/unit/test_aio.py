@@ -0,0 +1,142 @@
+# Copyright (c) 2019, Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+
+import futurist
+import mock
+import six
+import unittest2
+
+from cinderlib.tests.unit import base
+
+if six.PY3:
+    import asyncio
+
+    from cinderlib import aio
+
+
+@unittest2.skipIf(six.PY2, 'asyncio requires Python 3')
+class TestAio(base.BaseTest):
+    def setUp(self):
+        super(TestAio, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(self.loop.close)
+        self.executors = aio.Executors(max_workers=2)
+        self.patch('cinderlib.aio.EXECUTORS', self.executors)
+        self.addCleanup(self.executors.shutdown)
+
+    def _run(self, *futures):
+        return self.loop.run_until_complete(asyncio.gather(*futures))
+
+    def test_create_volume(self):
+        with mock.patch.object(self.backend, 'create_volume') as mock_create:
+            res = self._run(aio.create_volume(self.backend, 1, name='disk'))
+        self.assertEqual([mock_create.return_value], res)
+        mock_create.assert_called_once_with(1, name='disk')
+
+    def test_resource_method(self):
+        vol = mock.Mock(backend=self.backend)
+        res = self._run(aio.extend(vol, 2), aio.delete(vol))
+        self.assertEqual([vol.extend.return_value, vol.delete.return_value],
+                         res)
+        vol.extend.assert_called_once_with(2)
+        vol.delete.assert_called_once_with()
+
+    def test_resource_method_backend_name(self):
+        vol = mock.Mock(backend=self.backend_name)
+        with mock.patch.object(self.executors, 'submit') as mock_submit:
+            res = aio.extend(vol, 2)
+        self.assertEqual(mock_submit.return_value, res)
+        mock_submit.assert_called_once_with(self.backend, vol.extend, 2)
+
+    def test_resource_method_backend_missing(self):
+        vol = mock.Mock(backend='missing')
+        self.assertRaises(ValueError, aio.extend, vol, 2)
+
+    def test_snapshot_create_volume(self):
+        snap = mock.Mock(backend=self.backend)
+        res = self._run(aio.create_volume_from_snapshot(snap, size=2))
+        self.assertEqual([snap.create_volume.return_value], res)
+        snap.create_volume.assert_called_once_with(size=2)
+
+    def test_exception(self):
+        vol = mock.Mock(backend=self.backend)
+        vol.extend.side_effect = ValueError
+        self.assertRaises(ValueError, self._run, aio.extend(vol, 2))
+
+    def test_runs_in_backend_executor(self):
+        threads = []
+        vol = mock.Mock(backend=self.backend)
+        vol.attach.side_effect = lambda: threads.append(
+            threading.current_thread())
+
+        self._run(aio.attach(vol))
+
+        self.assertNotEqual(threading.current_thread(), threads[0])
+        self.assertIs(self.executors.get(self.backend),
+                      self.executors.get(self.backend))
+
+    def test_concurrency_limit(self):
+        started = threading.Semaphore(0)
+        event = threading.Event()
+        running = []
+        lock = threading.Lock()
+
+        def operation():
+            with lock:
+                running.append(len(running) + 1)
+            started.release()
+            event.wait(5)
+
+        futures = [aio.submit(self.backend, operation) for i in range(4)]
+        started.acquire(timeout=5)
+        started.acquire(timeout=5)
+        # Only 2 workers so the other operations are queued
+        self.assertFalse(started.acquire(timeout=0.1))
+        self.assertEqual([1, 2], running)
+        event.set()
+        self._run(*futures)
+        self.assertEqual([1, 2, 3, 4], running)
+
+    def test_max_queued(self):
+        aio.set_limits(max_workers=1, max_queued=1, backend=self.backend)
+        started = threading.Event()
+        event = threading.Event()
+
+        def operation():
+            started.set()
+            return event.wait(5)
+
+        first = aio.submit(self.backend, operation)
+        started.wait(5)
+        second = aio.submit(self.backend, operation)
+
+        self.assertRaises(futurist.RejectedSubmission,
+                          aio.submit, self.backend, operation)
+        event.set()
+        self.assertEqual([True, True], self._run(first, second))
+
+    def test_set_limits_replaces_executor(self):
+        executor = self.executors.get(self.backend)
+        aio.set_limits(max_workers=1, backend=self.backend)
+        self.assertIsNot(executor, self.executors.get(self.backend))
+        self.assertEqual((1, None), self.executors._limits[self.backend.id])
+        # Default limits don't change backends with specific limits
+        executor = self.executors.get(self.backend)
+        aio.set_limits(max_workers=3)
+        self.assertIs(executor, self.executors.get(self.backend))
+        self.assertEqual((3, None), self.executors.defaults)
@@ -12,13 +12,26 @@
 #    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 #    License for the specific language governing permissions and limitations
 #    under the License.
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import types
 
+import futurist
 import mock
 from oslo_config import cfg
+import six
 
 import cinderlib
+from cinderlib import exception
+from cinderlib import metrics
 from cinderlib import objects
+from cinderlib.persistence import base as persistence_base
 from cinderlib.tests.unit import base
+from cinderlib import utils
 
 
 class TestCinderlib(base.BaseTest):
@@ -64,6 +77,100 @@ class TestCinderlib(base.BaseTest):
         driver.get_volume_stats.assert_not_called()
         self.assertEqual(('default',), backend.pool_names)
 
+    @mock.patch('oslo_utils.importutils.import_object')
+    @mock.patch('cinderlib.Backend._set_backend_config')
+    def test_init_lazy(self, mock_config, mock_import):
+        self.patch('cinderlib.Backend.global_initialization', True)
+        self.patch('cinderlib.Backend.lazy_driver_setup', True)
+        driver = mock_import.return_value
+        driver.capabilities = {'pools': [{'pool_name': 'default'}]}
+        driver_cfg = {'k': 'v', 'volume_backend_name': 'Test'}
+
+        backend = objects.Backend(**driver_cfg)
+
+        self.assertEqual(backend, objects.Backend.backends['Test'])
+        self.assertEqual(driver_cfg, backend._driver_cfg)
+        self.assertEqual('Test', backend.id)
+        self.assertIsNone(backend._volumes)
+        mock_config.assert_not_called()
+        mock_import.assert_not_called()
+
+        self.assertEqual(('default',), backend.pool_names)
+        self.assertEqual(driver, backend.driver)
+        mock_config.assert_called_once_with(driver_cfg)
+        mock_import.assert_called_once()
+        driver.do_setup.assert_called_once_with(objects.CONTEXT)
+        driver.set_initialized.assert_called_once_with()
+
+    @mock.patch('oslo_utils.importutils.import_object')
+    @mock.patch('cinderlib.Backend._set_backend_config')
+    def test_init_lazy_driver_method(self, mock_config, mock_import):
+        self.patch('cinderlib.Backend.global_initialization', True)
+        self.patch('cinderlib.Backend.lazy_driver_setup', True)
+        driver = mock_import.return_value
+        driver.capabilities = {'pools': [{'pool_name': 'default'}]}
+        backend = objects.Backend('Test')
+
+        self.assertEqual(driver.get_pool, backend.get_pool)
+        self.assertEqual(driver.get_pool, backend.get_pool)
+        mock_import.assert_called_once()
+
+    @mock.patch('oslo_utils.importutils.import_object')
+    @mock.patch('cinderlib.Backend._set_backend_config')
+    def test_init_lazy_setup_error(self, mock_config, mock_import):
+        self.patch('cinderlib.Backend.global_initialization', True)
+        self.patch('cinderlib.Backend.lazy_driver_setup', True)
+        driver = mock.Mock(capabilities={'pools': [{'pool_name': 'p'}]})
+        mock_import.side_effect = [exception.NotFound, driver]
+        backend = objects.Backend('Test')
+
+        self.assertRaises(exception.NotFound, getattr, backend, 'driver')
+        self.assertNotIn('driver', vars(backend))
+        # We try again on the next access
+        self.assertEqual(driver, backend.driver)
+        self.assertEqual(2, mock_import.call_count)
+
+    @mock.patch('oslo_utils.importutils.import_object')
+    def test_init_lazy_concurrent(self, mock_import):
+        mock_update, mock_conf = self._patch_config()
+        self.patch('cinderlib.Backend.lazy_driver_setup', True)
+        # Threading may have been monkey patched after the lock was created
+        self.patch('cinderlib.Backend._config_lock', threading.Lock())
+        mock_import.return_value.capabilities = {
+            'pools': [{'pool_name': 'default'}]}
+        running = []
+
+        def update_config():
+            # Fail if another thread is changing the configuration
+            running.append(True)
+            time.sleep(0.05)
+            self.assertEqual(1, len(running))
+            running.pop()
+
+        mock_update.side_effect = update_config
+        backends = [objects.Backend('b1'), objects.Backend('b2')]
+        executor = futurist.ThreadPoolExecutor(max_workers=2)
+        futures = [executor.submit(getattr, backend, 'driver')
+                   for backend in backends]
+        executor.shutdown()
+
+        for future in futures:
+            self.assertIsNone(future.exception())
+        self.assertEqual(2, mock_update.call_count)
+        self.assertEqual({'b1', 'b2'}, set(self.backend._parser.sections()))
+
+    @mock.patch('oslo_utils.importutils.import_object')
+    def test_setup_many_lazy(self, mock_import):
+        self._patch_config()
+        self.patch('cinderlib.Backend.lazy_driver_setup', True)
+        mock_import.return_value.capabilities = {
+            'pools': [{'pool_name': 'default'}]}
+
+        res = objects.Backend.setup_many([{'volume_backend_name': 'b1'}])
+
+        self.assertIn('driver', vars(res[0]))
+        mock_import.assert_called_once()
+
     @mock.patch('urllib3.disable_warnings')
     @mock.patch('cinder.coordination.COORDINATOR')
     @mock.patch('cinderlib.Backend._set_priv_helper')
@@ -113,6 +220,205 @@ class TestCinderlib(base.BaseTest):
         self.assertEqual(mock.sentinel.backend_info,
                          cls.output_all_backend_info)
 
+    @mock.patch('urllib3.disable_warnings')
+    @mock.patch('cinder.coordination.COORDINATOR')
+    @mock.patch('cinderlib.Backend._set_priv_helper')
+    @mock.patch('cinderlib.Backend._set_logging')
+    @mock.patch('cinderlib.cinderlib.serialization')
+    @mock.patch('cinderlib.Backend._set_cinder_config')
+    @mock.patch('cinderlib.Backend.set_persistence')
+    def test_global_setup_startup_profiling(self, *mocks):
+        for attr in ('global_initialization', 'startup_profiling',
+                     '_global_timer', 'fail_on_missing_backend',
+                     'lazy_driver_setup', 'operation_limits', 'root_helper',
+                     'project_id', 'user_id', 'non_uuid_ids',
+                     'output_all_backend_info'):
+            self.patch('cinderlib.Backend.' + attr,
+                       getattr(cinderlib.Backend, attr))
+        cinderlib.Backend.global_initialization = False
+
+        cinderlib.Backend.global_setup(startup_profiling=True)
+
+        self.assertTrue(cinderlib.Backend.startup_profiling)
+        report = cinderlib.Backend.startup_report()
+        self.assertEqual(['persistence', 'cinder_config', 'serialization',
+                          'logging', 'priv_helper', 'coordination'],
+                         list(report['global_setup']['phases']))
+        self.assertEqual(sum(report['global_setup']['phases'].values()),
+                         report['global_setup']['total'])
+        self.assertEqual({}, report['backends'])
+
+    @mock.patch('urllib3.disable_warnings')
+    @mock.patch('cinder.coordination.COORDINATOR')
+    @mock.patch('cinderlib.Backend._set_priv_helper')
+    @mock.patch('cinderlib.Backend._set_logging')
+    @mock.patch('cinderlib.cinderlib.serialization')
+    @mock.patch('cinderlib.Backend._set_cinder_config')
+    @mock.patch('cinderlib.Backend.set_persistence')
+    def test_global_setup_collect_metrics(self, *mocks):
+        for attr in ('global_initialization', 'startup_profiling',
+                     '_global_timer', 'fail_on_missing_backend',
+                     'lazy_driver_setup', 'operation_limits', 'root_helper',
+                     'project_id', 'user_id', 'non_uuid_ids',
+                     'output_all_backend_info'):
+            self.patch('cinderlib.Backend.' + attr,
+                       getattr(cinderlib.Backend, attr))
+        cinderlib.Backend.global_initialization = False
+        registry = self.patch('cinderlib.metrics.REGISTRY',
+                              metrics.Registry())
+
+        cinderlib.Backend.global_setup(collect_metrics=True)
+
+        self.assertTrue(registry.enabled)
+
+    @mock.patch('oslo_utils.importutils.import_object')
+    @mock.patch('cinderlib.Backend._set_backend_config')
+    def test_init_startup_profiling(self, mock_config, mock_import):
+        self.patch('cinderlib.Backend.global_initialization', True)
+        self.patch('cinderlib.Backend.startup_profiling', True)
+        self.patch('cinderlib.Backend._global_timer', None)
+        driver = mock_import.return_value
+        driver.capabilities = {'pools': [{'pool_name': 'default'}]}
+
+        cinderlib.Backend(volume_backend_name='Test')
+
+        report = cinderlib.Backend.startup_report()
+        self.assertIsNone(report['global_setup'])
+        self.assertEqual(['Test'], list(report['backends']))
+        self.assertEqual(['config', 'driver_import', 'do_setup',
+                          'check_for_setup_error', 'init_capabilities'],
+                         list(report['backends']['Test']['phases']))
+
+    @mock.patch('oslo_utils.importutils.import_object')
+    @mock.patch('cinderlib.Backend._set_backend_config')
+    def test_init_startup_profiling_failure(self, mock_config, mock_import):
+        self.patch('cinderlib.Backend.global_initialization', True)
+        self.patch('cinderlib.Backend.startup_profiling', True)
+        mock_import.return_value.do_setup.side_effect = ValueError
+
+        self.assertRaises(ValueError, cinderlib.Backend,
+                          volume_backend_name='Test')
+
+        report = cinderlib.Backend.startup_report()
+        self.assertEqual(['config', 'driver_import', 'do_setup'],
+                         list(report['backends']['Test']['phases']))
+
+    def test_startup_report_disabled(self):
+        self.patch('cinderlib.Backend._global_timer', None)
+        self.assertEqual({'global_setup': None, 'backends': {}},
+                         self.backend.startup_report())
+
+    def _patch_config(self):
+        self.patch('cinderlib.Backend.global_initialization', True)
+        self.patch('cinderlib.Backend._parser',
+                   six.moves.configparser.SafeConfigParser())
+        mock_update = self.patch('cinderlib.Backend._update_cinder_config')
+        mock_conf = self.patch('cinder.volume.configuration.Configuration')
+        return mock_update, mock_conf
+
+    @mock.patch('oslo_utils.importutils.import_object')
+    def test_setup_many(self, mock_import):
+        mock_update, mock_conf = self._patch_config()
+        mock_import.return_value.capabilities = {
+            'pools': [{'pool_name': 'default'}]}
+        cfgs = [{'volume_backend_name': 'b1', 'k': 'v'},
+                {'volume_backend_name': 'b2', 'k': ['v1', 'v2']}]
+
+        res = objects.Backend.setup_many(cfgs)
+
+        self.assertEqual(2, len(res))
+        self.assertEqual([objects.Backend.backends['b1'],
+                          objects.Backend.backends['b2']], res)
+        self.assertEqual(cfgs, [backend._driver_cfg for backend in res])
+        mock_update.assert_called_once_with()
+        parser = objects.Backend._parser
+        self.assertEqual('fake_backend,b1,b2',
+                         parser.get('DEFAULT', 'enabled_backends'))
+        self.assertEqual('v', parser.get('b1', 'k'))
+        self.assertEqual('v1\nk = v2', parser.get('b2', 'k'))
+        self.assertEqual([mock.call(mock.ANY, config_group='b1'),
+                          mock.call(mock.ANY, config_group='b2')],
+                         mock_conf.call_args_list)
+        self.assertEqual(2, mock_import.call_count)
+        self.assertEqual({}, objects.Backend._preloaded_configs)
+
+    @mock.patch('oslo_utils.importutils.import_object')
+    def test_setup_many_error(self, mock_import):
+        self._patch_config()
+        mock_import.side_effect = exception.NotFound
+
+        self.assertRaises(exception.NotFound, objects.Backend.setup_many,
+                          [{'volume_backend_name': 'b1'}])
+        self.assertEqual({}, objects.Backend._preloaded_configs)
+
+    @mock.patch('oslo_utils.importutils.import_object')
+    def test_initialize_all(self, mock_import):
+        mock_update, mock_conf = self._patch_config()
+        driver = mock.Mock(capabilities={'pools': [{'pool_name': 'p'}]})
+
+        def import_object(name, **kwargs):
+            if kwargs['host'].endswith('@fake_backend'):
+                raise exception.NotFound
+            return driver
+
+        mock_import.side_effect = import_object
+        cfgs = [{'volume_backend_name': 'b1'},
+                {'volume_backend_name': self.backend_name},
+                {'volume_backend_name': 'b2'}]
+
+        res = objects.Backend.initialize_all(cfgs, max_workers=2)
+
+        self.assertEqual(3, len(res))
+        self.assertEqual(objects.Backend.backends['b1'], res[0])
+        self.assertIsInstance(res[1], exception.NotFound)
+        self.assertEqual(objects.Backend.backends['b2'], res[2])
+        # The previous backend with the same name is still registered
+        self.assertEqual(self.backend,
+                         objects.Backend.backends[self.backend_name])
+        self.assertEqual(driver, res[0].driver)
+        mock_update.assert_called_once_with()
+        self.assertEqual(3, mock_conf.call_count)
+        self.assertEqual({}, objects.Backend._preloaded_configs)
+
+    @mock.patch('oslo_utils.importutils.import_object',
+                side_effect=exception.NotFound)
+    def test_initialize_all_new_backend_fails(self, mock_import):
+        self._patch_config()
+
+        res = objects.Backend.initialize_all([{'volume_backend_name': 'b1'}])
+
+        self.assertEqual(1, len(res))
+        self.assertIsInstance(res[0], exception.NotFound)
+        self.assertNotIn('b1', objects.Backend.backends)
+
+    def test_set_backend_config_preloaded(self):
+        mock_update, mock_conf = self._patch_config()
+        driver_cfg = {'volume_backend_name': 'b1', 'k': 'v'}
+        self.patch('cinderlib.Backend._preloaded_configs',
+                   {'b1': (driver_cfg.copy(), mock.sentinel.conf)})
+
+        res = self.backend._set_backend_config(driver_cfg)
+
+        self.assertEqual(mock.sentinel.conf, res)
+        mock_update.assert_not_called()
+        mock_conf.assert_not_called()
+        self.assertFalse(objects.Backend._parser.has_section('b1'))
+        self.assertEqual({}, objects.Backend._preloaded_configs)
+
+    def test_set_backend_config_preloaded_different(self):
+        mock_update, mock_conf = self._patch_config()
+        driver_cfg = {'volume_backend_name': 'b1', 'k': 'v'}
+        self.patch('cinderlib.Backend._preloaded_configs',
+                   {'b1': ({'volume_backend_name': 'b1', 'k': 'v2'},
+                           mock.sentinel.conf)})
+
+        res = self.backend._set_backend_config(driver_cfg)
+
+        self.assertEqual(mock_conf.return_value, res)
+        mock_update.assert_called_once_with()
+        self.assertEqual('v', objects.Backend._parser.get('b1', 'k'))
+        mock_conf.assert_called_once_with(mock.ANY, config_group='b1')
+
     def test_pool_names(self):
         pool_names = [mock.sentinel._pool_names]
         self.backend._pool_names = pool_names
@@ -120,13 +426,25 @@ class TestCinderlib(base.BaseTest):
 
     def test_volumes(self):
         self.backend._volumes = None
+        vols = [mock.Mock(id=i) for i in range(2)]
+        self.persistence.get_volumes.return_value = vols
         res = self.backend.volumes
-        self.assertEqual(self.persistence.get_volumes.return_value, res)
-        self.assertEqual(self.persistence.get_volumes.return_value,
-                         self.backend._volumes)
+        self.assertIsInstance(res, utils.IdList)
+        self.assertEqual(vols, res)
+        self.assertIs(res, self.backend._volumes)
         self.persistence.get_volumes.assert_called_once_with(
             backend_name=self.backend.id)
 
+    def test_volumes_eager_load(self):
+        self.backend._volumes = None
+        self.patch('cinderlib.Backend.eager_load_volumes', True)
+        vols = [mock.Mock(id=i) for i in range(2)]
+        self.persistence.get_volumes.return_value = vols
+        res = self.backend.volumes
+        self.assertEqual(vols, res)
+        self.persistence.get_volumes.assert_called_once_with(
+            backend_name=self.backend.id, eager_load=True)
+
     def test_id(self):
         self.assertEqual(self.backend._driver_cfg['volume_backend_name'],
                          self.backend.id)
@@ -141,6 +459,66 @@ class TestCinderlib(base.BaseTest):
             volume_id=mock.sentinel.vol_id,
             volume_name=mock.sentinel.vol_name)
 
+    def test_volumes_filtered_eager_load(self):
+        res = self.backend.volumes_filtered(mock.sentinel.vol_id,
+                                            mock.sentinel.vol_name,
+                                            eager_load=True)
+        self.assertEqual(self.persistence.get_volumes.return_value, res)
+        self.persistence.get_volumes.assert_called_once_with(
+            backend_name=self.backend.id,
+            volume_id=mock.sentinel.vol_id,
+            volume_name=mock.sentinel.vol_name,
+            eager_load=True)
+
+    def _autospec_get_volumes(self):
+        plugin = mock.create_autospec(persistence_base.PersistenceDriverBase,
+                                      instance=True)
+        self.persistence.get_volumes = plugin.get_volumes
+        return plugin.get_volumes
+
+    def test_iter_volumes(self):
+        get_volumes = self._autospec_get_volumes()
+        vols = [mock.Mock(id=i) for i in range(5)]
+        get_volumes.side_effect = [vols[:2], vols[2:4], vols[4:]]
+        res = self.backend.iter_volumes(mock.sentinel.vol_name, page_size=2,
+                                        sort_keys=['size'])
+        self.assertIsInstance(res, types.GeneratorType)
+        self.assertEqual(vols, list(res))
+        self.assertEqual([], self.backend._volumes)
+        get_volumes.assert_has_calls([
+            mock.call(backend_name=self.backend.id,
+                      volume_name=mock.sentinel.vol_name, limit=2,
+                      sort_keys=['size'], **marker)
+            for marker in ({}, {'marker': 1}, {'marker': 3})])
+
+    def test_iter_volumes_full_last_page(self):
+        get_volumes = self._autospec_get_volumes()
+        vols = [mock.Mock(id=i) for i in range(2)]
+        get_volumes.side_effect = [vols, []]
+        res = list(self.backend.iter_volumes(page_size=2, eager_load=True))
+        self.assertEqual(vols, res)
+        self.assertEqual(2, get_volumes.call_count)
+        get_volumes.assert_called_with(
+            backend_name=self.backend.id, volume_name=None, limit=2,
+            marker=1, eager_load=True)
+
+    def test_iter_volumes_no_pagination(self):
+        vols = [mock.Mock(id=i) for i in range(3)]
+
+        class OldPlugin(object):
+            def get_volumes(self, volume_id=None, volume_name=None,
+                            backend_name=None):
+                return vols
+
+        self.patch('cinderlib.Backend.persistence', OldPlugin())
+        mock_load = self.patch('cinderlib.persistence.base.'
+                               'PersistenceDriverBase._eager_load')
+        res = list(self.backend.iter_volumes(page_size=2, eager_load=True,
+                                             sort_keys=['size']))
+        self.assertEqual(vols, res)
+        # Snapshots and connections are loaded by cinderlib
+        mock_load.assert_called_once_with(vols)
+
     def test_stats(self):
         expect = {'pools': [mock.sentinel.data]}
         with mock.patch.object(self.backend.driver, 'get_volume_stats',
@@ -159,6 +537,241 @@ class TestCinderlib(base.BaseTest):
             self.assertEqual(expect, res)
             mock_stat.assert_called_once_with(refresh=mock.sentinel.refresh)
 
+    def _create_thick_volume(self, **kwargs):
+        # Other tests may leave a sentinel as the default user and project
+        return self.backend.create_volume(
+            10, extra_specs={'provisioning:type': 'thick'}, user_id='user',
+            project_id='project', **kwargs)
+
+    def test_select_pool_spreads(self):
+        self.backend._stats = {'pools': [
+            {'pool_name': 'p1', 'free_capacity_gb': 100,
+             'total_capacity_gb': 100},
+            {'pool_name': 'p2', 'free_capacity_gb': 95,
+             'total_capacity_gb': 100}]}
+        self.backend.driver.create_volume.return_value = None
+
+        vols = [self._create_thick_volume() for i in range(4)]
+
+        self.assertEqual(['p1', 'p2', 'p1', 'p2'],
+                         [vol.host.split('#')[1] for vol in vols])
+        self.assertEqual([80, 75], [pool['free_capacity_gb']
+                                    for pool in self.backend._pools_stats()])
+        # Cached stats are not modified
+        self.assertEqual([100, 95], [pool['free_capacity_gb']
+                                     for pool in self.backend._stats['pools']])
+
+    def test_select_pool_not_created(self):
+        self.backend._stats = {'pools': [
+            {'pool_name': 'p1', 'free_capacity_gb': 100,
+             'total_capacity_gb': 100},
+            {'pool_name': 'p2', 'free_capacity_gb': 95,
+             'total_capacity_gb': 100}]}
+        self.backend.driver.create_volume.side_effect = exception.NotFound
+
+        self.assertRaises(exception.NotFound, self._create_thick_volume)
+
+        self.assertEqual('p1', self.backend.select_pool(10))
+        self.assertEqual([100, 95], [pool['free_capacity_gb']
+                                     for pool in self.backend._pools_stats()])
+
+    def test_select_pool_reserves(self):
+        self.backend._stats = {'pools': [
+            {'pool_name': 'p1', 'free_capacity_gb': 100,
+             'total_capacity_gb': 100},
+            {'pool_name': 'p2', 'free_capacity_gb': 95,
+             'total_capacity_gb': 100}]}
+
+        pools = [self.backend._select_pool(10, {'provisioning:type': 'thick'},
+                                           reserve=True)[0]
+                 for i in range(4)]
+
+        self.assertEqual(['p1', 'p2', 'p1', 'p2'], pools)
+        self.assertEqual([80, 75], [pool['free_capacity_gb']
+                                    for pool in self.backend._pools_stats()])
+        # Selecting without reserving doesn't change the capacity
+        self.assertEqual('p1', self.backend.select_pool(10))
+        self.assertEqual([80, 75], [pool['free_capacity_gb']
+                                    for pool in self.backend._pools_stats()])
+
+    def test_create_volumes_spreads(self):
+        self.backend._stats = {'pools': [
+            {'pool_name': 'p1', 'free_capacity_gb': 100,
+             'total_capacity_gb': 100},
+            {'pool_name': 'p2', 'free_capacity_gb': 100,
+             'total_capacity_gb': 100}]}
+        self.backend.driver.create_volume.return_value = None
+        specs = {'size': 10, 'extra_specs': {'provisioning:type': 'thick'},
+                 'user_id': 'user', 'project_id': 'project'}
+
+        res = self.backend.create_volumes([specs] * 4)
+
+        self.assertEqual(['p1', 'p2', 'p1', 'p2'],
+                         [vol.host.split('#')[1] for vol in res])
+        # Created volumes don't consume their reserved capacity again
+        self.assertEqual([80, 80], [pool['free_capacity_gb']
+                                    for pool in self.backend._pools_stats()])
+
+    def test_select_pool_stats_refreshed(self):
+        self.backend._stats = {'pools': [
+            {'pool_name': 'p1', 'free_capacity_gb': 100,
+             'total_capacity_gb': 100}]}
+        self.backend.driver.create_volume.return_value = None
+        self._create_thick_volume()
+        self.assertEqual(90, self.backend._pools_stats()[0]
+                         ['free_capacity_gb'])
+
+        self.backend.driver.get_volume_stats.return_value = {'pools': [
+            {'pool_name': 'p1', 'free_capacity_gb': 90,
+             'total_capacity_gb': 100}]}
+        with mock.patch('time.time', return_value=1):
+            self.backend.stats(refresh=True)
+
+        self.assertEqual(90, self.backend._pools_stats()[0]
+                         ['free_capacity_gb'])
+
+    def test_select_pool_selector(self):
+        pools = [{'pool_name': 'p1'}, {'pool_name': 'p2'}]
+        self.backend._stats = {'pools': pools}
+        selector = mock.Mock()
+        selector.select.return_value = pools[1]
+        self.backend.pool_selector = selector
+
+        res = self.backend.select_pool(1, {'k': 'v'})
+
+        self.assertEqual('p2', res)
+        selector.select.assert_called_once_with(self.backend, pools, 1,
+                                                {'k': 'v'})
+
+    def test_select_pool_no_pools_stats(self):
+        self.backend._stats = {}
+        self.assertEqual(self.backend_name, self.backend.select_pool(1))
+
+    @mock.patch('cinderlib.Backend.volume_scheduler')
+    def test_schedule_volume(self, mock_scheduler):
+        res = cinderlib.schedule_volume(mock.sentinel.size,
+                                        mock.sentinel.extra_specs)
+        self.assertEqual(mock_scheduler.schedule.return_value, res)
+        mock_scheduler.schedule.assert_called_once_with(
+            list(self.backend.backends.values()), mock.sentinel.size,
+            mock.sentinel.extra_specs)
+
+    @mock.patch('cinderlib.Backend.volume_scheduler')
+    def test_schedule_volume_backends(self, mock_scheduler):
+        res = self.backend.schedule_volume(1, backends=[self.backend])
+        self.assertEqual(mock_scheduler.schedule.return_value, res)
+        mock_scheduler.schedule.assert_called_once_with([self.backend], 1,
+                                                        None)
+
+    def test_limiter(self):
+        self.patch('cinderlib.Backend.operation_limits', {'connect': 2})
+        op_limiter = self.backend.limiter
+        self.assertIs(op_limiter, self.backend.limiter)
+        self.assertEqual({'connect': 2}, op_limiter.limits)
+
+    def test_set_operation_limits(self):
+        op_limiter = self.backend.limiter
+        self.backend.set_operation_limits({'default': 1})
+        self.assertIsNot(op_limiter, self.backend.limiter)
+        self.assertEqual({'default': 1}, self.backend.limiter.limits)
+
+    def test_stats_refresh_timestamp(self):
+        self.backend.driver.get_volume_stats.return_value = {'pools': []}
+        self.assertIsNone(self.backend.stats_age)
+        self.backend.stats(refresh=True)
+        self.assertLess(self.backend.stats_age, 5)
+
+    def test_stats_refresher_no_block(self):
+        self.backend._stats = mock.sentinel.stats
+        refresher = mock.Mock(ttl=None)
+        self.backend._stats_refresher = refresher
+
+        self.assertEqual(mock.sentinel.stats, self.backend.stats())
+        refresher.wakeup.assert_not_called()
+
+        self.assertEqual(mock.sentinel.stats,
+                         self.backend.stats(refresh=True))
+        refresher.wakeup.assert_called_once_with()
+        self.backend.driver.get_volume_stats.assert_not_called()
+
+    @mock.patch('time.time', return_value=100)
+    def test_stats_refresher_ttl(self, mock_time):
+        self.backend._stats = mock.sentinel.stats
+        self.backend._stats_updated_at = 90
+        refresher = mock.Mock(ttl=10)
+        self.backend._stats_refresher = refresher
+
+        self.assertEqual(mock.sentinel.stats, self.backend.stats())
+        refresher.wakeup.assert_not_called()
+
+        # Stale stats are returned while they are refreshed
+        mock_time.return_value = 101
+        self.assertEqual(mock.sentinel.stats, self.backend.stats())
+        refresher.wakeup.assert_called_once_with()
+        self.backend.driver.get_volume_stats.assert_not_called()
+
+    def _wait_for(self, condition, timeout=5):
+        end = time.time() + timeout
+        while not condition():
+            self.assertLess(time.time(), end, 'Timed out')
+            time.sleep(0.01)
+
+    def test_start_stats_refresher(self):
+        stats = {'pools': [{'pool_name': 'p'}]}
+        self.backend.driver.get_volume_stats.return_value = stats
+        self.backend.start_stats_refresher(interval=0.01, jitter=0)
+        self.addCleanup(self.backend.stop_stats_refresher)
+        refresher = self.backend._stats_refresher
+        self.assertTrue(refresher.daemon)
+
+        self._wait_for(
+            lambda: self.backend.driver.get_volume_stats.call_count > 1)
+        self.assertEqual(stats, self.backend.stats())
+        self.backend.driver.get_volume_stats.assert_called_with(refresh=True)
+
+        self.backend.stop_stats_refresher()
+        self.assertIsNone(self.backend._stats_refresher)
+        self.assertFalse(refresher.is_alive())
+
+    def test_start_stats_refresher_replaces(self):
+        self.backend.driver.get_volume_stats.return_value = {'pools': []}
+        self.backend.start_stats_refresher(interval=60)
+        first = self.backend._stats_refresher
+        self.backend.start_stats_refresher(interval=60)
+        self.addCleanup(self.backend.stop_stats_refresher)
+        self.assertFalse(first.is_alive())
+        self.assertIsNot(first, self.backend._stats_refresher)
+
+    def test_stats_refresher_wakeup(self):
+        self.backend._stats = {}
+        self.backend.driver.get_volume_stats.return_value = {'pools': []}
+        self.backend.start_stats_refresher(interval=60)
+        self.addCleanup(self.backend.stop_stats_refresher)
+
+        self.backend.stats(refresh=True)
+
+        self._wait_for(lambda: self.backend.driver.get_volume_stats.called)
+
+    def test_stats_refresher_error_keeps_stats(self):
+        self.backend._stats = mock.sentinel.stats
+        calls = []
+
+        def get_volume_stats(refresh):
+            calls.append(refresh)
+            raise exception.NotFound
+
+        self.backend.driver.get_volume_stats.side_effect = get_volume_stats
+        self.backend.start_stats_refresher(interval=0.01, jitter=0)
+        self.addCleanup(self.backend.stop_stats_refresher)
+
+        self._wait_for(lambda: len(calls) > 1)
+        self.assertEqual(mock.sentinel.stats, self.backend.stats())
+        self.assertTrue(self.backend._stats_refresher.is_alive())
+
+    def test_stop_stats_refresher_not_running(self):
+        self.backend.stop_stats_refresher()
+        self.assertIsNone(self.backend._stats_refresher)
+
     @mock.patch('cinderlib.objects.Volume')
     def test_create_volume(self, mock_vol):
         kwargs = {'k': 'v', 'k2': 'v2'}
@@ -175,6 +788,54 @@ class TestCinderlib(base.BaseTest):
                                          **kwargs)
         mock_vol.return_value.create.assert_called_once_with()
 
+    def test_create_volumes(self):
+        def create_volume(volume):
+            if volume.display_name == 'disk2':
+                raise exception.NotFound()
+
+        self.backend.driver.create_volume.side_effect = create_volume
+        specs = [{'size': 1, 'name': 'disk1'}, {'size': 2, 'name': 'disk2'}]
+        res = self.backend.create_volumes(specs, max_workers=2)
+
+        self.assertEqual(2, len(res))
+        self.assertIsInstance(res[0], objects.Volume)
+        self.assertEqual('disk1', res[0].name)
+        self.assertEqual('available', res[0].status)
+        self.assertIsInstance(res[1], exception.NotFound)
+        self.assertEqual('disk2', res[1].resource.name)
+        self.assertEqual('error', res[1].resource.status)
+        self.assertEqual(2, self.backend.driver.create_volume.call_count)
+        self.assertEqual([res[0]], self.backend.volumes)
+        self.persistence.set_volumes.assert_called_once_with(
+            [res[0], res[1].resource])
+
+    def test_create_volumes_invalid_specs(self):
+        self.backend.driver.create_volume.return_value = None
+        specs = [{'name': 'no_size'}, {'size': 1, 'name': 'disk1'}]
+
+        res = self.backend.create_volumes(specs)
+
+        self.assertIsInstance(res[0], TypeError)
+        self.assertIsInstance(res[1], objects.Volume)
+        self.assertEqual('disk1', res[1].name)
+        self.assertEqual(1, self.backend.driver.create_volume.call_count)
+        self.persistence.set_volumes.assert_called_once_with([res[1]])
+
+    def test_create_volumes_metrics(self):
+        registry = metrics.Registry()
+        registry.enabled = True
+        self.patch('cinderlib.metrics.REGISTRY', registry)
+        events = []
+        registry.add_callback(events.append)
+        self.backend.driver.create_volume.return_value = None
+
+        res = self.backend.create_volumes([{'size': 1}, {'size': 2}])
+
+        self.assertEqual({vol.id for vol in res},
+                         {event.resource_id for event in events})
+        self.assertEqual({'create_volume'},
+                         {event.operation for event in events})
+
     def test__volume_removed_no_list(self):
         vol = cinderlib.objects.Volume(self.backend, size=10)
         self.backend._volume_removed(vol)
@@ -186,6 +847,16 @@ class TestCinderlib(base.BaseTest):
         self.backend._volume_removed(vol2)
         self.assertEqual([], self.backend.volumes)
 
+    def test__creating_volume(self):
+        vol = cinderlib.objects.Volume(self.backend, size=10)
+        other = mock.Mock(_volumes_inflight=utils.InFlightRegistry())
+        self.backend.backends['other'] = other
+        self.assertIsNone(self.backend._get_inflight_volume(vol.id))
+        with self.backend._creating_volume(vol):
+            self.assertIs(vol, cinderlib.Backend._get_inflight_volume(vol.id))
+            self.assertEqual(0, len(other._volumes_inflight))
+        self.assertIsNone(self.backend._get_inflight_volume(vol.id))
+
     def test__volume_created(self):
         vol = cinderlib.objects.Volume(self.backend, size=10)
         self.backend._volume_created(vol)
@@ -219,6 +890,18 @@ class TestCinderlib(base.BaseTest):
         self.assertEqual(mock_pers_setup.return_value.db,
                          self.backend.driver.db)
 
+    @mock.patch('cinderlib.objects.setup')
+    @mock.patch('cinderlib.persistence.setup')
+    def test_set_persistence_lazy_driver(self, mock_pers_setup,
+                                         mock_obj_setup):
+        cinderlib.Backend.global_initialization = True
+        del self.backend.driver
+        self.backend._driver_lock = mock.Mock()
+
+        with mock.patch.object(self.backend, '_setup_driver') as mock_setup:
+            cinderlib.Backend.set_persistence(mock.sentinel.pers_cfg)
+            mock_setup.assert_not_called()
+
     def test_config(self):
         self.backend.output_all_backend_info = False
         res = self.backend.config
@@ -235,7 +918,136 @@ class TestCinderlib(base.BaseTest):
         self.persistence.get_volumes.assert_called_once_with(
             backend_name=self.backend.id)
 
+    def test_refresh_eager_load(self):
+        vols = [mock.Mock(id=i) for i in range(2)]
+        self.persistence.get_volumes.return_value = vols
+        self.backend.refresh(eager_load=True)
+        self.persistence.get_volumes.assert_called_once_with(
+            backend_name=self.backend.id, eager_load=True)
+        self.assertIsInstance(self.backend._volumes, utils.IdList)
+        self.assertEqual(vols, self.backend._volumes)
+
     def test_refresh_no_call(self):
         self.backend._volumes = None
         self.backend.refresh()
         self.persistence.get_volumes.assert_not_called()
+
+    DRIVERS = {
+        'LVMVolumeDriver': {
+            'class_name': 'LVMVolumeDriver',
+            'class_fqn': 'cinder.volume.drivers.lvm.LVMVolumeDriver',
+            'version': '3.0.0'},
+        'XtremIOISCSIDriver': {
+            'class_name': 'XtremIOISCSIDriver',
+            'class_fqn': ('cinder.volume.drivers.dell_emc.xtremio.'
+                          'XtremIOISCSIDriver'),
+            'version': '1.0.11'},
+    }
+
+    def _patch_drivers_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.patch('cinderlib.Backend.drivers_cache_dir', cache_dir)
+        self.patch('cinderlib.Backend._supported_drivers', None)
+        mock_key = self.patch('cinderlib.Backend._get_drivers_cache_key',
+                              return_value='key1')
+        mock_load = self.patch('cinderlib.Backend._load_supported_drivers',
+                               return_value=self.DRIVERS)
+        cache_file = os.path.join(cache_dir, 'supported_drivers.json')
+        return cache_file, mock_key, mock_load
+
+    def test_list_supported_drivers(self):
+        cache_file, mock_key, mock_load = self._patch_drivers_cache()
+
+        self.assertEqual(self.DRIVERS, cinderlib.list_supported_drivers())
+        mock_load.assert_called_once_with()
+        with open(cache_file) as f:
+            self.assertEqual({'key': 'key1', 'drivers': self.DRIVERS},
+                             json.load(f))
+
+        # Cached in memory
+        self.assertEqual(self.DRIVERS, cinderlib.list_supported_drivers())
+        # Cached on disk
+        cinderlib.Backend._supported_drivers = None
+        self.assertEqual(self.DRIVERS, cinderlib.list_supported_drivers())
+        mock_load.assert_called_once_with()
+
+    def test_list_supported_drivers_changed(self):
+        cache_file, mock_key, mock_load = self._patch_drivers_cache()
+        cinderlib.list_supported_drivers()
+        mock_key.return_value = 'key2'
+
+        cinderlib.list_supported_drivers()
+
+        self.assertEqual(2, mock_load.call_count)
+        with open(cache_file) as f:
+            self.assertEqual('key2', json.load(f)['key'])
+
+    def test_list_supported_drivers_corrupt_cache(self):
+        cache_file, mock_key, mock_load = self._patch_drivers_cache()
+        with open(cache_file, 'w') as f:
+            f.write('{"key": ')
+
+        self.assertEqual(self.DRIVERS, cinderlib.list_supported_drivers())
+        mock_load.assert_called_once_with()
+
+    def test_list_supported_drivers_no_cache(self):
+        cache_file, mock_key, mock_load = self._patch_drivers_cache()
+        cinderlib.list_supported_drivers()
+
+        cinderlib.list_supported_drivers(use_cache=False)
+
+        self.assertEqual(2, mock_load.call_count)
+        self.assertEqual(1, mock_key.call_count)
+
+    def test_list_supported_drivers_filters(self):
+        self._patch_drivers_cache()
+
+        res = cinderlib.list_supported_drivers(vendor='dell_emc',
+                                               fields=['version'])
+        self.assertEqual({'XtremIOISCSIDriver': {'version': '1.0.11'}}, res)
+
+        res = cinderlib.list_supported_drivers(
+            driver_names=['LVMVolumeDriver', 'Unknown'])
+        self.assertEqual(['LVMVolumeDriver'], list(res))
+        # Results don't share the cached dictionaries
+        res['LVMVolumeDriver']['version'] = '0'
+        self.assertEqual(
+            '3.0.0',
+            cinderlib.list_supported_drivers()['LVMVolumeDriver']['version'])
+
+    def test_list_supported_drivers_nested_copy(self):
+        self._patch_drivers_cache()
+        drivers = {'LVMVolumeDriver': {'class_name': 'LVMVolumeDriver',
+                                       'protocols': ['iSCSI']}}
+        cinderlib.Backend._load_supported_drivers.return_value = drivers
+
+        res = cinderlib.list_supported_drivers()
+        res['LVMVolumeDriver']['protocols'].append('FC')
+
+        self.assertEqual(
+            ['iSCSI'],
+            cinderlib.list_supported_drivers()['LVMVolumeDriver']['protocols'])
+
+    def test_compute_drivers_cache_key(self):
+        key = cinderlib.Backend._compute_drivers_cache_key()
+        self.assertEqual(key, cinderlib.Backend._compute_drivers_cache_key())
+        with mock.patch('os.path.getmtime', return_value=1):
+            self.assertNotEqual(
+                key, cinderlib.Backend._compute_drivers_cache_key())
+
+    @mock.patch('cinderlib.Backend._compute_drivers_cache_key',
+                return_value='key1')
+    def test_get_drivers_cache_key_once(self, mock_compute):
+        self.patch('cinderlib.Backend._drivers_cache_key', None)
+        self.assertEqual('key1', cinderlib.Backend._get_drivers_cache_key())
+        self.assertEqual('key1', cinderlib.Backend._get_drivers_cache_key())
+        mock_compute.assert_called_once_with()
+
+    def test_list_supported_drivers_no_cache_resets_key(self):
+        self._patch_drivers_cache()
+        self.patch('cinderlib.Backend._drivers_cache_key', 'key1')
+
+        cinderlib.list_supported_drivers(use_cache=False)
+
+        self.assertIsNone(cinderlib.Backend._drivers_cache_key)
@@ -0,0 +1,73 @@
+# Copyright (c) 2019, Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import subprocess
+import sys
+
+import unittest2
+
+import cinderlib
+from cinderlib import objects
+from cinderlib.tests.unit import base
+
+# Modules that are slow to import and must only be imported when needed
+HEAVY_MODULES = ('cinder.volume.manager', 'taskflow', 'cinder.cmd.volume',
+                 'cinderlib.nos_brick')
+# Modules only imported on Python 3.7+ when cinderlib's features are used
+LAZY_MODULES = ('cinder.volume.manager', 'os_brick.initiator',
+                'cinder.coordination', 'stevedore', 'urllib3')
+
+
+class TestImport(base.BaseTest):
+    def _run(self, code, *python_args):
+        cmd = [sys.executable] + list(python_args) + ['-c', code]
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        stdout, stderr = proc.communicate()
+        self.assertEqual(0, proc.returncode, stderr)
+        return stdout, stderr
+
+    def test_heavy_modules_not_imported(self):
+        vol = objects.Volume(self.backend, size=1, name='disk',
+                             user_id='user', project_id='project')
+        code = ('import json, sys\n'
+                'import cinderlib\n'
+                'vol = cinderlib.load(%r)\n'
+                'assert vol.id == %r and vol.backend == %r\n'
+                'print(json.dumps([m for m in %r if m in sys.modules]))' %
+                (vol.jsons, vol.id, self.backend_name, HEAVY_MODULES))
+        stdout, __ = self._run(code)
+        self.assertEqual([], json.loads(stdout.splitlines()[-1]))
+
+    @unittest2.skipIf(sys.version_info < (3, 7),
+                      'Lazy imports require Python 3.7')
+    def test_import_lazy(self):
+        code = ('import json, sys\n'
+                'import cinderlib\n'
+                'print(json.dumps([m for m in %r if m in sys.modules]))' %
+                (LAZY_MODULES,))
+        stdout, __ = self._run(code)
+        self.assertEqual([], json.loads(stdout.splitlines()[-1]))
+
+    def test_lazy_attribute(self):
+        self.assertIs(objects.Volume, cinderlib.__getattr__('Volume'))
+        self.assertEqual(cinderlib.Backend.list_supported_drivers,
+                         cinderlib.__getattr__('list_supported_drivers'))
+        self.assertIs(objects, cinderlib.__getattr__('objects'))
+
+    def test_lazy_attribute_missing(self):
+        self.assertRaises(AttributeError, cinderlib.__getattr__, 'missing')
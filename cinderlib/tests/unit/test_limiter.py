@@ -0,0 +1,113 @@
+# Copyright (c) 2019, Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+import time
+
+from cinderlib import limiter
+from cinderlib.tests.unit import base
+
+
+class TestFairSemaphore(base.BaseTest):
+    def _wait_for(self, condition):
+        for i in range(500):
+            if condition():
+                return
+            time.sleep(0.01)
+        self.fail('Condition not met')
+
+    def test_unlimited(self):
+        sem = limiter.FairSemaphore()
+        for i in range(3):
+            sem.acquire()
+        self.assertEqual(3, sem.in_flight)
+        sem.release()
+        self.assertEqual({'limit': None, 'in_flight': 2, 'waiting': 0,
+                          'max_waiting': 0, 'total': 3, 'waited': 0,
+                          'wait_time': 0.0},
+                         sem.stats())
+
+    def test_limit_fifo(self):
+        sem = limiter.FairSemaphore(1)
+        sem.acquire()
+        order = []
+
+        def worker(i):
+            with sem:
+                order.append(i)
+
+        threads = []
+        for i in range(3):
+            thread = threading.Thread(target=worker, args=(i,))
+            thread.start()
+            threads.append(thread)
+            # Make sure threads queue in order
+            self._wait_for(lambda: sem.waiting == i + 1)
+
+        self.assertEqual([], order)
+        stats = sem.stats()
+        self.assertEqual(1, stats['in_flight'])
+        self.assertEqual(3, stats['waiting'])
+
+        sem.release()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([0, 1, 2], order)
+        stats = sem.stats()
+        self.assertEqual(0, stats['in_flight'])
+        self.assertEqual(0, stats['waiting'])
+        self.assertEqual(3, stats['max_waiting'])
+        self.assertEqual(4, stats['total'])
+        self.assertEqual(3, stats['waited'])
+        self.assertGreater(stats['wait_time'], 0)
+
+    def test_release_frees_slot(self):
+        sem = limiter.FairSemaphore(2)
+        with sem:
+            with sem:
+                self.assertEqual(2, sem.in_flight)
+        with sem:
+            self.assertEqual(1, sem.in_flight)
+        self.assertEqual(0, sem.stats()['waited'])
+
+
+class TestOperationLimiter(base.BaseTest):
+    def test_limits(self):
+        op_limiter = limiter.OperationLimiter({'create_volume': 2,
+                                               'default': 5})
+        self.assertEqual(2, op_limiter.limit('create_volume').limit)
+        self.assertEqual(5, op_limiter.limit('delete_volume').limit)
+        self.assertIs(op_limiter.limit('create_volume'),
+                      op_limiter.limit('create_volume'))
+
+    def test_no_limits(self):
+        op_limiter = limiter.OperationLimiter()
+        self.assertIsNone(op_limiter.limit('create_volume').limit)
+
+    def test_invalid_limits(self):
+        for limit in (0, -1):
+            self.assertRaises(ValueError, limiter.OperationLimiter,
+                              {'connect': 1, 'default': limit})
+            self.assertRaises(ValueError, limiter.FairSemaphore, limit)
+
+    def test_stats(self):
+        op_limiter = limiter.OperationLimiter({'connect': 1})
+        with op_limiter.limit('connect'):
+            stats = op_limiter.stats()
+        self.assertEqual(['connect'], list(stats))
+        self.assertEqual(1, stats['connect']['limit'])
+        self.assertEqual(1, stats['connect']['in_flight'])
+        self.assertEqual(0, op_limiter.stats()['connect']['in_flight'])
@@ -0,0 +1,194 @@
+# Copyright (c) 2019, Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+
+import mock
+
+from cinderlib import metrics
+from cinderlib.tests.unit import base
+
+
+class TestHistogram(base.BaseTest):
+    def test_observe(self):
+        hist = metrics.Histogram((1, 5, float('inf')))
+        for value in (0.5, 1, 3, 10):
+            hist.observe(value)
+        self.assertEqual([2, 3, 4], hist.counts)
+        self.assertEqual(4, hist.count)
+        self.assertEqual(14.5, hist.sum)
+
+
+class TestRegistry(base.BaseTest):
+    def setUp(self):
+        super(TestRegistry, self).setUp()
+        self.registry = metrics.Registry(buckets=(1, float('inf')))
+        self.registry.enabled = True
+        self.events = []
+        self.registry.add_callback(self.events.append)
+
+    @mock.patch('time.time')
+    def test_operation_phases(self, mock_time):
+        mock_time.side_effect = range(10)
+        # Times are 0 on start, 1 and 2 entering the phases, 3 and 4 exiting
+        # them, and 5 on finish
+        with self.registry.operation('lvm', 'create_volume', 'id'):
+            with self.registry.phase('driver'):
+                with self.registry.phase('persistence'):
+                    pass
+
+        self.assertEqual(
+            [metrics.OperationEvent('lvm', 'create_volume', 'id', 'success',
+                                    None, 0, 5, {'driver': 2,
+                                                 'persistence': 1})],
+            self.events)
+
+    def test_operation_error(self):
+        def operation():
+            with self.registry.operation('lvm', 'delete_volume'):
+                raise ValueError()
+
+        self.assertRaises(ValueError, operation)
+        self.assertEqual('error', self.events[0].outcome)
+        self.assertEqual('ValueError', self.events[0].error)
+        operations, phases = self.registry.histograms()
+        self.assertEqual([('lvm', 'delete_volume', 'error')], list(operations))
+        self.assertEqual({}, phases)
+
+    def test_nested_operations(self):
+        with self.registry.operation('lvm', 'attach'):
+            with self.registry.operation('lvm', 'detach'):
+                with self.registry.phase('connector'):
+                    pass
+            with self.registry.phase('persistence'):
+                pass
+
+        self.assertEqual(['detach', 'attach'],
+                         [event.operation for event in self.events])
+        self.assertEqual(['connector'], list(self.events[0].phases))
+        self.assertEqual(['persistence'], list(self.events[1].phases))
+
+    def test_phase_no_operation(self):
+        self.assertIs(metrics._NULL_CONTEXT, self.registry.phase('driver'))
+
+    def test_phase_disabled(self):
+        self.registry.enabled = False
+        with self.registry.operation('lvm', 'connect'):
+            self.assertIs(metrics._NULL_CONTEXT,
+                          self.registry.phase('driver'))
+
+    def test_callback_failure(self):
+        failing = mock.Mock(side_effect=ValueError)
+        self.registry.callbacks.insert(0, failing)
+        with self.registry.operation('lvm', 'connect'):
+            pass
+        failing.assert_called_once_with(self.events[0])
+        self.registry.remove_callback(failing)
+        self.assertEqual([self.events.append], self.registry.callbacks)
+
+    def test_histograms_copy(self):
+        with self.registry.operation('lvm', 'connect'):
+            pass
+        operations, __ = self.registry.histograms()
+        operations[('lvm', 'connect', 'success')].observe(1)
+        operations, __ = self.registry.histograms()
+        self.assertEqual(1, operations[('lvm', 'connect', 'success')].count)
+        self.registry.reset()
+        self.assertEqual(({}, {}), self.registry.histograms())
+
+    def test_export_prometheus(self):
+        self.registry.record(metrics.OperationEvent(
+            'my "lvm"', 'connect', None, 'success', None, 0, 0.5,
+            {'driver': 2}))
+        expected = '''# HELP cinderlib_operation_duration_seconds \
+Duration of the operations on cinderlib resources.
+# TYPE cinderlib_operation_duration_seconds histogram
+cinderlib_operation_duration_seconds_bucket\
+{backend="my \\"lvm\\"",operation="connect",outcome="success",le="1.0"} 1
+cinderlib_operation_duration_seconds_bucket\
+{backend="my \\"lvm\\"",operation="connect",outcome="success",le="+Inf"} 1
+cinderlib_operation_duration_seconds_sum\
+{backend="my \\"lvm\\"",operation="connect",outcome="success"} 0.5
+cinderlib_operation_duration_seconds_count\
+{backend="my \\"lvm\\"",operation="connect",outcome="success"} 1
+# HELP cinderlib_operation_phase_duration_seconds \
+Time spent on each phase of the operations on cinderlib resources.
+# TYPE cinderlib_operation_phase_duration_seconds histogram
+cinderlib_operation_phase_duration_seconds_bucket\
+{backend="my \\"lvm\\"",operation="connect",phase="driver",le="1.0"} 0
+cinderlib_operation_phase_duration_seconds_bucket\
+{backend="my \\"lvm\\"",operation="connect",phase="driver",le="+Inf"} 1
+cinderlib_operation_phase_duration_seconds_sum\
+{backend="my \\"lvm\\"",operation="connect",phase="driver"} 2.0
+cinderlib_operation_phase_duration_seconds_count\
+{backend="my \\"lvm\\"",operation="connect",phase="driver"} 1
+'''
+        self.assertEqual(expected, self.registry.export_prometheus())
+
+    def test_write_prometheus(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'cinderlib.prom')
+
+        self.registry.write_prometheus(path)
+
+        with open(path) as f:
+            self.assertEqual(self.registry.export_prometheus(), f.read())
+        self.assertEqual(['cinderlib.prom'], os.listdir(tmp_dir))
+
+
+class TestInstrumented(base.BaseTest):
+    def setUp(self):
+        super(TestInstrumented, self).setUp()
+        self.registry = metrics.Registry()
+        self.patch('cinderlib.metrics.REGISTRY', self.registry)
+        self.resource = mock.Mock(id='resource_id', backend=self.backend)
+        self.func = mock.Mock(__name__='func', return_value=1)
+        self.decorated = metrics.instrumented('operation')(self.func)
+
+    def test_disabled(self):
+        self.assertEqual(1, self.decorated(self.resource, 2, a=3))
+        self.func.assert_called_once_with(self.resource, 2, a=3)
+        self.assertEqual(({}, {}), self.registry.histograms())
+
+    def test_enabled(self):
+        events = []
+        metrics.add_callback(events.append)
+        metrics.enable()
+        self.assertTrue(self.registry.enabled)
+
+        self.assertEqual(1, self.decorated(self.resource, 2, a=3))
+
+        self.func.assert_called_once_with(self.resource, 2, a=3)
+        self.assertEqual(1, len(events))
+        self.assertEqual((self.backend.id, 'operation', 'resource_id',
+                          'success'), events[0][:4])
+        metrics.disable()
+        self.assertFalse(self.registry.enabled)
+
+    def test_enabled_backend_name(self):
+        events = []
+        metrics.add_callback(events.append)
+        metrics.enable()
+        resource = mock.Mock(spec=['id', 'backend'], id='resource_id',
+                             backend='backend_name')
+
+        self.assertEqual(1, self.decorated(resource))
+
+        self.assertEqual(('backend_name', 'operation', 'resource_id',
+                          'success'), events[0][:4])
+        metrics.disable()
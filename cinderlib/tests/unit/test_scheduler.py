@@ -0,0 +1,258 @@
+# Copyright (c) 2019, Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import ddt
+import mock
+
+from cinderlib import exception
+from cinderlib import scheduler
+from cinderlib.tests.unit import base
+from cinderlib.tests.unit import utils
+
+
+def _pool(name, free, total=100, **kwargs):
+    pool = {'pool_name': name, 'free_capacity_gb': free,
+            'total_capacity_gb': total}
+    pool.update(kwargs)
+    return pool
+
+
+@ddt.ddt
+class TestCapacity(base.BaseTest):
+    @ddt.data((None, True), ({}, True), ({'provisioning:type': 'thin'}, True),
+              ({'provisioning:type': 'thick'}, False))
+    @ddt.unpack
+    def test_is_thin(self, extra_specs, expected):
+        self.assertEqual(expected, scheduler.is_thin(extra_specs))
+
+    @ddt.data(('unknown', 10), (10, 'unknown'), (None, 10), ('a', 10))
+    @ddt.unpack
+    def test_free_capacity_unknown(self, total, free):
+        self.assertIsNone(scheduler.free_capacity(_pool('p', free, total)))
+
+    def test_free_capacity_infinite(self):
+        self.assertEqual(scheduler.INFINITE,
+                         scheduler.free_capacity(_pool('p', 'infinite')))
+
+    def test_free_capacity_thick(self):
+        pool = _pool('p', 50, reserved_percentage=10)
+        self.assertEqual(40, scheduler.free_capacity(pool))
+
+    def test_free_capacity_thin(self):
+        pool = _pool('p', 50, '100', thin_provisioning_support=True,
+                     max_over_subscription_ratio=2.0,
+                     provisioned_capacity_gb=120)
+        self.assertEqual(80, scheduler.free_capacity(pool))
+        self.assertEqual(50, scheduler.free_capacity(pool, thin=False))
+
+    def test_consume_capacity_thick(self):
+        pool = _pool('p', 50, allocated_capacity_gb=5)
+        scheduler.consume_capacity(pool, 10)
+        self.assertEqual(_pool('p', 40, allocated_capacity_gb=15,
+                               provisioned_capacity_gb=15), pool)
+
+    def test_consume_capacity_thin(self):
+        pool = _pool('p', 50, thin_provisioning_support=True,
+                     provisioned_capacity_gb=20)
+        scheduler.consume_capacity(pool, 10)
+        self.assertEqual(50, pool['free_capacity_gb'])
+        self.assertEqual(30, pool['provisioned_capacity_gb'])
+        scheduler.consume_capacity(pool, 10, thin=False)
+        self.assertEqual(40, pool['free_capacity_gb'])
+
+    def test_consume_capacity_infinite(self):
+        pool = _pool('p', 'infinite', 'infinite')
+        scheduler.consume_capacity(pool, 10)
+        self.assertEqual(_pool('p', 'infinite', 'infinite',
+                               provisioned_capacity_gb=10), pool)
+
+
+@ddt.ddt
+class TestExtraSpecs(base.BaseTest):
+    CAPS = {'volume_backend_name': 'lvm', 'thin_provisioning_support': True,
+            'total_capacity_gb': 100, 'storage_protocol': 'iSCSI',
+            'compression': [True, False], 'nested': {'level': 'gold'}}
+
+    @ddt.data(None, {}, {'volume_backend_name': 'lvm'},
+              {'capabilities:volume_backend_name': 'lvm'},
+              {'thin_provisioning_support': '<is> True'},
+              {'total_capacity_gb': '>= 50'},
+              {'storage_protocol': '<or> FC <or> iSCSI'},
+              {'compression': '<is> False'},
+              {'capabilities:nested:level': 'gold'},
+              {'provisioning:type': 'thick', 'vendor:key': 'value'})
+    def test_satisfies_extra_specs(self, extra_specs):
+        self.assertTrue(scheduler.satisfies_extra_specs(self.CAPS,
+                                                        extra_specs))
+
+    @ddt.data({'volume_backend_name': 'ceph'},
+              {'thin_provisioning_support': '<is> False'},
+              {'total_capacity_gb': '>= 500'},
+              {'storage_protocol': '<or> FC <or> RBD'},
+              {'capabilities:nested:level': 'silver'},
+              {'capabilities:missing': 'value'},
+              {'capabilities:volume_backend_name:nested': 'lvm'})
+    def test_satisfies_extra_specs_fail(self, extra_specs):
+        self.assertFalse(scheduler.satisfies_extra_specs(self.CAPS,
+                                                         extra_specs))
+
+    def test_pools_capabilities(self):
+        pools = [_pool('p1', 10, reserved_percentage=5), _pool('p2', 20)]
+        stats = {'volume_backend_name': 'lvm', 'reserved_percentage': 0,
+                 'pools': pools}
+
+        res = scheduler.pools_capabilities(stats)
+
+        self.assertEqual(2, len(res))
+        self.assertIs(pools[0], res[0][0])
+        self.assertEqual(dict(pools[0], volume_backend_name='lvm'), res[0][1])
+        self.assertIs(pools[1], res[1][0])
+        self.assertEqual(dict(pools[1], volume_backend_name='lvm',
+                              reserved_percentage=0), res[1][1])
+
+
+class TestPoolSelectors(base.BaseTest):
+    def test_first_pool_selector(self):
+        pools = [_pool('p1', 1), _pool('p2', 50)]
+        selector = scheduler.FirstPoolSelector()
+        self.assertIs(pools[0], selector.select(self.backend, pools, 10))
+
+    def test_capacity_pool_selector(self):
+        pools = [_pool('p1', 1), _pool('p2', 50), _pool('p3', 40)]
+        selector = scheduler.CapacityPoolSelector()
+        self.assertIs(pools[1], selector.select(self.backend, pools, 10))
+
+    def test_capacity_pool_selector_stacking(self):
+        pools = [_pool('p1', 1), _pool('p2', 50), _pool('p3', 40)]
+        selector = scheduler.CapacityPoolSelector(multiplier=-1)
+        # p1 doesn't have enough space
+        self.assertIs(pools[2], selector.select(self.backend, pools, 10))
+
+    def test_capacity_pool_selector_no_space(self):
+        pools = [_pool('p1', 1), _pool('p2', 5)]
+        selector = scheduler.CapacityPoolSelector()
+        self.assertIs(pools[1], selector.select(self.backend, pools, 10))
+
+    def test_capacity_pool_selector_unknown(self):
+        pools = [_pool('p1', 'unknown'), _pool('p2', 5), _pool('p3', 20)]
+        selector = scheduler.CapacityPoolSelector()
+        self.assertIs(pools[2], selector.select(self.backend, pools, 10))
+        self.assertIs(pools[0], selector.select(self.backend, pools, 30))
+
+    def test_capacity_pool_selector_thick(self):
+        pools = [_pool('p1', 30),
+                 _pool('p2', 20, thin_provisioning_support=True)]
+        selector = scheduler.CapacityPoolSelector()
+        self.assertIs(pools[1], selector.select(self.backend, pools, 10))
+        self.assertIs(pools[0],
+                      selector.select(self.backend, pools, 10,
+                                      {'provisioning:type': 'thick'}))
+
+
+class TestScheduler(base.BaseTest):
+    def _backend(self, name, *pools, **capabilities):
+        backend = utils.FakeBackend(volume_backend_name=name)
+        backend._stats = dict(capabilities, volume_backend_name=name,
+                              pools=list(pools))
+        backend._stats_updated_at = 1
+        backend.driver.create_volume.return_value = None
+        return backend
+
+    def setUp(self):
+        super(TestScheduler, self).setUp()
+        self.scheduler = scheduler.Scheduler()
+        self.lvm = self._backend('lvm', _pool('lvm1', 50), _pool('lvm2', 70),
+                                 storage_protocol='iSCSI')
+        self.ceph = self._backend('ceph', _pool('ceph', 60),
+                                  storage_protocol='ceph')
+        self.backends = [self.lvm, self.ceph]
+
+    def _schedule_and_create(self, size):
+        extra_specs = {'provisioning:type': 'thick'}
+        backend, pool_name = self.scheduler.schedule(self.backends, size,
+                                                     extra_specs)
+        backend.create_volume(size, pool_name=pool_name, user_id='user',
+                              project_id='project', extra_specs=extra_specs)
+        return backend, pool_name
+
+    def test_schedule_capacity(self):
+        res = [self._schedule_and_create(10) for i in range(4)]
+        self.assertEqual([(self.lvm, 'lvm2'), (self.ceph, 'ceph'),
+                          (self.lvm, 'lvm2'), (self.lvm, 'lvm1')], res)
+        self.assertEqual(50, self.lvm._pools_stats()[1]['free_capacity_gb'])
+        # The driver's stats are not modified
+        self.assertEqual(70, self.lvm.stats()['pools'][1]['free_capacity_gb'])
+
+    def test_schedule_not_created(self):
+        backend = self._backend('nfs', _pool('nfs1', 50), _pool('nfs2', 50))
+        res = [self.scheduler.schedule([backend], 10)[1] for i in range(4)]
+        self.assertEqual(['nfs1', 'nfs2', 'nfs1', 'nfs2'], res)
+        self.assertEqual([30, 30], [pool['free_capacity_gb']
+                                    for pool in backend._pools_stats()])
+
+    def test_schedule_reservation_claimed(self):
+        backend, pool_name = self.scheduler.schedule(self.backends, 10)
+        vol = backend.create_volume(10, pool_name=pool_name, user_id='user',
+                                    project_id='project')
+
+        self.assertIsNone(vol._reservation)
+        self.assertEqual(60, self.lvm._pools_stats()[1]['free_capacity_gb'])
+        self.assertEqual({}, {k: v for k, v in
+                              self.lvm._consumed_capacity[2].items() if v})
+
+    def test_schedule_reservation_released(self):
+        self.lvm.driver.create_volume.side_effect = exception.NotFound
+        backend, pool_name = self.scheduler.schedule(self.backends, 10)
+        self.assertRaises(exception.NotFound, backend.create_volume, 10,
+                          pool_name=pool_name, user_id='user',
+                          project_id='project')
+        self.assertEqual(70, self.lvm._pools_stats()[1]['free_capacity_gb'])
+
+    def test_schedule_extra_specs(self):
+        res = self.scheduler.schedule(self.backends, 10,
+                                      {'storage_protocol': 'ceph'})
+        self.assertEqual((self.ceph, 'ceph'), res)
+
+    def test_schedule_filters_capacity(self):
+        res = self.scheduler.schedule(self.backends, 65)
+        self.assertEqual((self.lvm, 'lvm2'), res)
+        self.assertRaises(exception.NoValidBackend,
+                          self.scheduler.schedule, self.backends, 100)
+
+    def test_schedule_no_valid_backend(self):
+        self.assertRaises(exception.NoValidBackend,
+                          self.scheduler.schedule, self.backends, 1,
+                          {'volume_backend_name': 'nfs'})
+
+    def test_schedule_round_robin(self):
+        self.scheduler = scheduler.Scheduler(multiplier=0)
+        res = [self.scheduler.schedule(self.backends, 1)[1]
+               for i in range(6)]
+        self.assertEqual(['lvm1', 'lvm2', 'ceph'] * 2, res)
+
+    def test_capabilities_cache(self):
+        with mock.patch.object(scheduler, 'pools_capabilities',
+                               wraps=scheduler.pools_capabilities) as caps:
+            self.scheduler.schedule(self.backends, 1)
+            self.scheduler.schedule(self.backends, 1)
+            self.assertEqual(2, caps.call_count)
+
+            # Stats updated in place by the driver are used on refresh
+            self.lvm._stats['storage_protocol'] = 'FC'
+            self.lvm._stats_updated_at = 2
+            res = self.scheduler.schedule(self.backends, 1,
+                                          {'storage_protocol': 'FC'})
+            self.assertEqual(3, caps.call_count)
+            self.assertEqual((self.lvm, 'lvm2'), res)
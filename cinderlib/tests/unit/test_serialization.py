@@ -0,0 +1,259 @@
+# Copyright (c) 2019, Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+
+import mock
+import six
+
+import cinderlib
+from cinderlib import objects
+from cinderlib.persistence import base as persistence_base
+from cinderlib import serialization
+from cinderlib.tests.unit import base
+from cinderlib import utils as cinderlib_utils
+
+
+class TestSerialization(base.BaseTest):
+    def setUp(self):
+        super(TestSerialization, self).setUp()
+        # Other tests may have left non serializable ids in the context
+        objects.Object.setup(self.persistence, cinderlib.Backend, None, None,
+                             False)
+
+    def _create_volume(self):
+        vol = objects.Volume(self.backend, size=10, status='available',
+                             metadata={'k': 'v'})
+        snap = objects.Snapshot(vol, name='snap')
+        vol._snapshots.append(snap)
+        vol._ovo.snapshots.objects.append(snap._ovo)
+        self.backend._volumes.append(vol)
+        return vol, snap
+
+    def test_get_plan_cached(self):
+        plan = serialization._get_plan(objects.cinder_objs.Volume)
+        self.assertIs(plan,
+                      serialization._get_plan(objects.cinder_objs.Volume))
+        name, namespace, version, fields_plan = plan
+        self.assertEqual('Volume', name)
+        self.assertEqual(objects.cinder_objs.Volume.VERSION, version)
+        kinds = {field[0]: field[2] for field in fields_plan}
+        self.assertEqual(serialization._RAW, kinds['size'])
+        self.assertEqual(serialization._RAW_DICT, kinds['metadata'])
+        self.assertEqual(serialization._OBJECT, kinds['volume_type'])
+        self.assertEqual(serialization._OBJECT, kinds['volume_attachment'])
+        self.assertEqual(serialization._OTHER, kinds['created_at'])
+        list_plan = serialization._get_plan(objects.cinder_objs.VolumeList)
+        self.assertEqual([('objects', '_obj_objects',
+                           serialization._OBJECT_LIST)],
+                         [field[:3] for field in list_plan[3]])
+
+    def test_setup_clears_plans(self):
+        serialization._get_plan(objects.cinder_objs.Volume)
+        serialization.setup(serialization.BACKEND_CLASS)
+        self.assertEqual({}, serialization._PLANS)
+
+    def test_obj_to_primitive_skips_cycles(self):
+        vol, snap = self._create_volume()
+        primitive = vol._ovo.obj_to_primitive()
+        data = primitive['versioned_object.data']
+        self.assertEqual('Volume', primitive['versioned_object.name'])
+        self.assertEqual(10, data['size'])
+        self.assertEqual({'k': 'v'}, data['metadata'])
+        self.assertIsInstance(data['created_at'], six.string_types)
+        snaps = data['snapshots']['versioned_object.data']['objects']
+        self.assertEqual(1, len(snaps))
+        snap_data = snaps[0]['versioned_object.data']
+        self.assertEqual(snap.id, snap_data['id'])
+        self.assertNotIn('volume', snap_data)
+
+    def test_obj_to_primitive_copies_containers(self):
+        vol, snap = self._create_volume()
+        data = vol._ovo.obj_to_primitive()['versioned_object.data']
+        data['metadata']['k2'] = 'v2'
+        self.assertEqual({'k': 'v'}, vol._ovo.metadata)
+
+    def test_obj_to_primitive_nested_override(self):
+        vol, snap = self._create_volume()
+        with mock.patch.object(objects.cinder_objs.Snapshot,
+                               'obj_to_primitive',
+                               return_value={'custom': True}):
+            primitive = vol._ovo.obj_to_primitive()
+        snaps = primitive['versioned_object.data']['snapshots']
+        self.assertEqual([{'custom': True}],
+                         snaps['versioned_object.data']['objects'])
+
+    def test_to_dict(self):
+        vol, snap = self._create_volume()
+        primitive = vol._ovo.obj_to_primitive()
+        expected = serialization._only_ovo_data(primitive)
+        result = vol.to_dict()
+        self.assertEqual(expected, result)
+        data = result['volume']
+        self.assertEqual(10, data['size'])
+        self.assertEqual({'k': 'v'}, data['metadata'])
+        snaps = data['snapshots']['snapshotlist']['objects']
+        self.assertEqual([snap.id], [s['snapshot']['id'] for s in snaps])
+        self.assertNotIn('volume', snaps[0]['snapshot'])
+        self.assertNotIn('cinderlib.data', result)
+
+    @mock.patch.object(serialization, '_only_ovo_data',
+                       wraps=serialization._only_ovo_data)
+    def test_to_dict_single_walk(self, strip_mock):
+        vol, snap = self._create_volume()
+        vol.to_dict()
+        # Only the datetime fields go through the primitive stripping
+        for call in strip_mock.call_args_list:
+            self.assertIsInstance(call[0][0], six.string_types)
+
+    def test_to_dict_override(self):
+        vol, snap = self._create_volume()
+        primitive = {'versioned_object.name': 'Snapshot',
+                     'versioned_object.data': {'custom': True}}
+        with mock.patch.object(objects.cinder_objs.Snapshot,
+                               'obj_to_primitive', return_value=primitive):
+            result = vol.to_dict()
+        snaps = result['volume']['snapshots']['snapshotlist']['objects']
+        self.assertEqual([{'snapshot': {'custom': True}}], snaps)
+
+    def test_round_trip(self):
+        vol, snap = self._create_volume()
+        loaded = cinderlib.load(vol.jsons)
+        self.assertEqual(vol.id, loaded.id)
+        self.assertEqual(vol.size, loaded.size)
+        self.assertEqual([snap.id], [s.id for s in loaded.snapshots])
+
+    def test_write_jsons(self):
+        self._create_volume()
+        self._create_volume()
+        output = six.StringIO()
+        serialization.write_jsons(output)
+        self.assertEqual(json.loads(serialization.jsons()),
+                         json.loads(output.getvalue()))
+
+    def test_write_dumps(self):
+        self._create_volume()
+        output = six.StringIO()
+        serialization.write_dumps(output)
+        self.assertEqual(json.loads(serialization.dumps()),
+                         json.loads(output.getvalue()))
+
+    def test_write_dumps_no_volumes(self):
+        output = six.StringIO()
+        serialization.write_dumps(output)
+        self.assertEqual(serialization.dumps(), output.getvalue())
+
+    def test_dump_to(self):
+        vol, snap = self._create_volume()
+        output = six.StringIO()
+        serialization.dump_to(output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertEqual({'class': 'FakeBackend',
+                          'backend': self.backend.config},
+                         json.loads(lines[0]))
+        expected = vol.dump
+        expected['backend'] = {'volume_backend_name': self.backend.id}
+        self.assertEqual(json.loads(json.dumps(expected)),
+                         json.loads(lines[1]))
+
+    def test_dump_to_volumes_not_loaded(self):
+        vol, snap = self._create_volume()
+        self.backend._volumes = None
+        plugin = mock.create_autospec(persistence_base.PersistenceDriverBase,
+                                      instance=True)
+        self.persistence.get_volumes = plugin.get_volumes
+        self.persistence.get_volumes.return_value = [vol]
+        output = six.StringIO()
+        serialization.dump_to(output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertEqual(vol.id,
+                         json.loads(lines[1])['ovo']['versioned_object.data']
+                         ['id'])
+        self.persistence.get_volumes.assert_called_once_with(
+            backend_name=self.backend.id, volume_name=None,
+            limit=self.backend.volumes_page_size, eager_load=True)
+        self.assertIsNone(self.backend._volumes)
+
+    def test_load_from(self):
+        vol, snap = self._create_volume()
+        output = six.StringIO()
+        serialization.dump_to(output)
+        self.backend._volumes = []
+        self.persistence.reset_mock()
+        self.patch('cinderlib.objects.FakeBackend', type(self.backend),
+                   create=True)
+
+        res = serialization.load_from(six.StringIO(output.getvalue()))
+
+        self.assertEqual([self.backend], res)
+        self.assertEqual([vol.id], [v.id for v in self.backend.volumes])
+        loaded = self.backend.volumes[0]
+        self.assertIsNot(vol, loaded)
+        self.assertEqual([snap.id], [s.id for s in loaded.snapshots])
+        self.persistence.set_volume.assert_called_once_with(loaded)
+        self.persistence.set_snapshot.assert_called_once_with(
+            loaded.snapshots[0])
+
+    def test_load_from_volumes_not_loaded(self):
+        vol, snap = self._create_volume()
+        output = six.StringIO(vol.dumps + '\n\n')
+        self.backend._volumes = None
+
+        res = serialization.load_from(output)
+
+        self.assertEqual([], res)
+        self.assertIsNone(self.backend._volumes)
+        self.persistence.set_volume.assert_called_once()
+
+    def test_load_from_no_save(self):
+        vol, snap = self._create_volume()
+        output = six.StringIO(vol.dumps + '\n')
+        self.backend._volumes = None
+
+        serialization.load_from(output, save=False)
+
+        self.assertEqual([vol.id], [v.id for v in self.backend._volumes])
+        self.persistence.set_volume.assert_not_called()
+
+    def test_load_packed_volume(self):
+        vol, snap = self._create_volume()
+        packed = vol.jsonb
+        self.assertTrue(cinderlib_utils.is_packed(packed))
+        self.assertLess(len(packed), len(vol.jsons))
+        loaded = serialization.load(packed)
+        self.assertEqual(vol.json, loaded.json)
+
+    def test_to_jsonb(self):
+        vol, snap = self._create_volume()
+        self.assertEqual(vol.to_json(),
+                         cinderlib_utils.unpackb(vol.to_jsonb()))
+
+    def test_dumpb(self):
+        vol, snap = self._create_volume()
+        self.assertEqual(json.loads(serialization.dumps()),
+                         cinderlib_utils.unpackb(serialization.dumpb()))
+        self.assertEqual(json.loads(self.backend.dumps),
+                         cinderlib_utils.unpackb(self.backend.dumpb))
+        self.assertEqual(json.loads(vol.dumps),
+                         cinderlib_utils.unpackb(vol.dumpb))
+
+    def test_jsonb(self):
+        self._create_volume()
+        self.assertEqual(json.loads(serialization.jsons()),
+                         cinderlib_utils.unpackb(serialization.jsonb()))
+        self.assertEqual(json.loads(self.backend.jsons),
+                         cinderlib_utils.unpackb(self.backend.jsonb))
@@ -0,0 +1,248 @@
+# Copyright (c) 2019, Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from cinder import objects as cinder_objs
+import mock
+import msgpack
+
+from cinderlib import objects
+from cinderlib.tests.unit import base
+from cinderlib import utils
+
+
+class TestIdList(base.BaseTest):
+    def setUp(self):
+        super(TestIdList, self).setUp()
+        self.elements = [mock.Mock(id=i) for i in range(3)]
+        self.id_list = utils.IdList(self.elements)
+
+    def test_list_behavior(self):
+        self.assertEqual(3, len(self.id_list))
+        self.assertEqual(self.elements, self.id_list)
+        self.assertEqual(self.elements, list(self.id_list))
+        self.assertEqual(self.elements[1], self.id_list[1])
+        self.assertEqual(self.elements[1:], self.id_list[1:])
+        self.assertEqual(self.elements[::-1], list(reversed(self.id_list)))
+        self.assertIn(self.elements[2], self.id_list)
+        self.assertNotIn(mock.Mock(id=0), self.id_list)
+        self.assertEqual(1, self.id_list.index(self.elements[1]))
+
+    def test_append_replaces(self):
+        new = mock.Mock(id=1)
+        self.id_list.append(new)
+        self.assertEqual([self.elements[0], new, self.elements[2]],
+                         self.id_list)
+
+    def test_positional_changes(self):
+        new = mock.Mock(id=3)
+        self.id_list.insert(0, new)
+        self.assertEqual([new] + self.elements, self.id_list)
+        del self.id_list[1]
+        self.assertEqual([new] + self.elements[1:], self.id_list)
+        self.id_list[0] = self.elements[0]
+        self.assertEqual(self.elements, self.id_list)
+
+    def test_positional_access_cached(self):
+        self.assertEqual(self.elements[1], self.id_list[1])
+        cached = self.id_list._list
+        self.assertEqual(self.elements[2], self.id_list[-1])
+        self.assertIs(cached, self.id_list._list)
+
+        new = mock.Mock(id=3)
+        self.id_list.append(new)
+        self.assertEqual(new, self.id_list[-1])
+        del self.id_list[0]
+        self.assertEqual(self.elements[1], self.id_list[0])
+        self.assertEqual(self.elements[1:] + [new], self.id_list)
+
+    def test_set_item_same_id(self):
+        new = mock.Mock(id=1)
+        self.id_list[1] = new
+        self.assertEqual([self.elements[0], new, self.elements[2]],
+                         self.id_list)
+        self.assertIs(new, self.id_list.get(1))
+
+    def test_insert_end(self):
+        new = mock.Mock(id=3)
+        self.id_list.insert(10, new)
+        self.assertEqual(self.elements + [new], self.id_list)
+
+    def test_sort(self):
+        self.id_list.sort(key=lambda x: x.id, reverse=True)
+        self.assertEqual(self.elements[::-1], self.id_list)
+        self.assertIs(self.elements[0], self.id_list.get(0))
+        self.assertEqual(self.elements[0], self.id_list[-1])
+
+    def test_add(self):
+        new = mock.Mock(id=3)
+        self.assertEqual(self.elements + [new], self.id_list + [new])
+        self.assertEqual([new] + self.elements, [new] + self.id_list)
+        self.assertEqual(self.elements * 2, self.id_list + self.id_list)
+
+    def test_ovo_list(self):
+        vol = objects.Volume(self.backend, size=1, user_id='user',
+                             project_id='project')
+        snaps = [objects.Snapshot(vol, name=name) for name in ('b', 'a')]
+        ovo_list = cinder_objs.SnapshotList(
+            objects=[snap._ovo for snap in snaps])
+        objects._index_ovo_list(ovo_list)
+
+        ovo_list.sort(key=lambda x: x.display_name)
+        self.assertEqual(['a', 'b'],
+                         [snap.display_name for snap in ovo_list])
+        self.assertIsInstance(ovo_list.objects, utils.IdList)
+
+        res = ovo_list + ovo_list
+        self.assertIsInstance(res, cinder_objs.SnapshotList)
+        self.assertEqual(4, len(res))
+
+    def test_get(self):
+        self.assertIs(self.elements[1], self.id_list.get(1))
+        self.assertIsNone(self.id_list.get(3))
+
+    def test_pop_id(self):
+        self.assertIs(self.elements[1], self.id_list.pop_id(1))
+        self.assertEqual([self.elements[0], self.elements[2]], self.id_list)
+        self.assertIsNone(self.id_list.pop_id(1))
+
+    def test_remove(self):
+        self.id_list.remove(self.elements[0])
+        self.assertEqual(self.elements[1:], self.id_list)
+        self.assertRaises(ValueError, self.id_list.remove, mock.Mock(id=1))
+
+
+class TestByIdHelpers(base.BaseTest):
+    def _test_add_by_id(self, container):
+        elements = container([mock.Mock(id=0), mock.Mock(id=1)])
+        new = mock.Mock(id=0)
+        utils.add_by_id(new, elements)
+        self.assertEqual(new, elements[0])
+        new2 = mock.Mock(id=2)
+        utils.add_by_id(new2, elements)
+        self.assertEqual(new2, elements[-1])
+        self.assertEqual(3, len(elements))
+
+    def test_add_by_id_list(self):
+        self._test_add_by_id(list)
+
+    def test_add_by_id_id_list(self):
+        self._test_add_by_id(utils.IdList)
+
+    def _test_remove_by_id(self, container):
+        original = [mock.Mock(id=0), mock.Mock(id=1)]
+        elements = container(original)
+        self.assertIs(original[0], utils.remove_by_id(0, elements))
+        self.assertIsNone(utils.remove_by_id(0, elements))
+        self.assertEqual([original[1]], elements)
+
+    def test_remove_by_id_list(self):
+        self._test_remove_by_id(list)
+
+    def test_remove_by_id_id_list(self):
+        self._test_remove_by_id(utils.IdList)
+
+    def test_remove_by_id_none(self):
+        self.assertIsNone(utils.remove_by_id(0, None))
+
+
+class TestPhaseTimer(base.BaseTest):
+    @mock.patch('time.time', side_effect=[10, 11, 13, 13, 16])
+    def test_phases(self, mock_time):
+        timer = utils.PhaseTimer()
+        with timer.phase('first'):
+            pass
+        with timer.phase('second'):
+            pass
+        self.assertEqual({'started_at': 10, 'total': 5,
+                          'phases': {'first': 2, 'second': 3}},
+                         timer.report())
+        self.assertEqual(['first', 'second'],
+                         list(timer.report()['phases']))
+
+    def test_phase_failure(self):
+        timer = utils.PhaseTimer()
+        with self.assertRaises(ValueError):
+            with timer.phase('failed'):
+                raise ValueError()
+        self.assertEqual(['failed'], list(timer.phases))
+
+    def test_disabled(self):
+        timer = utils.PhaseTimer(enabled=False)
+        with timer.phase('first'):
+            pass
+        self.assertEqual({}, timer.report()['phases'])
+
+
+class TestInFlightRegistry(base.BaseTest):
+    def setUp(self):
+        super(TestInFlightRegistry, self).setUp()
+        self.registry = utils.InFlightRegistry()
+        self.resource = mock.Mock(id=1)
+
+    def test_track(self):
+        with self.registry.track(self.resource) as res:
+            self.assertIs(self.resource, res)
+            self.assertIn(1, self.registry)
+            self.assertIs(self.resource, self.registry.get(1))
+            self.assertEqual([self.resource], self.registry.values())
+        self.assertEqual(0, len(self.registry))
+
+    def test_track_failure(self):
+        def create():
+            with self.registry.track(self.resource):
+                raise ValueError()
+
+        self.assertRaises(ValueError, create)
+        self.assertNotIn(1, self.registry)
+        self.assertIsNone(self.registry.get(1))
+
+    def test_remove_different_resource(self):
+        other = mock.Mock(id=1)
+        self.registry.add(self.resource)
+        self.registry.remove(other)
+        self.assertIs(self.resource, self.registry.get(1))
+        self.registry.remove(self.resource)
+        self.assertEqual(0, len(self.registry))
+
+
+class TestPacked(base.BaseTest):
+    DATA = {'name': u'vol\xe9',
+            'size': 1,
+            'data': [{'name': 'snap', 'size': None, 'ok': True},
+                     {'name': 'snap2', 'metadata': {'name': 'value'}}],
+            'empty': {}}
+
+    def test_round_trip(self):
+        packed = utils.packb(self.DATA)
+        self.assertIsInstance(packed, bytes)
+        self.assertTrue(utils.is_packed(packed))
+        self.assertEqual(self.DATA, utils.unpackb(packed))
+
+    def test_keys_stored_once(self):
+        packed = utils.packb(self.DATA)
+        self.assertEqual(1, packed.count(b'name'))
+
+    def test_is_packed(self):
+        self.assertFalse(utils.is_packed(u'{"name": "vol"}'))
+        self.assertFalse(utils.is_packed(b'{"name": "vol"}'))
+        self.assertFalse(utils.is_packed({'name': 'vol'}))
+
+    def test_unpackb_not_packed(self):
+        self.assertRaises(ValueError, utils.unpackb, b'{"name": "vol"}')
+
+    def test_unpackb_unsupported_version(self):
+        packed = (utils.PACKED_MAGIC + msgpack.packb([2, []]) +
+                  msgpack.packb({}))
+        self.assertRaises(ValueError, utils.unpackb, packed)
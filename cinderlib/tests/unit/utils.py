@@ -13,6 +13,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import threading
+
 import mock
 
 import cinderlib
@@ -31,4 +33,7 @@ class FakeBackend(cinderlib.Backend):
         self.driver = mock.Mock()
         self.driver.persistence = cinderlib.Backend.persistence
         self._pool_names = (driver_name,)
+        self._stats = {'pools': [{'pool_name': driver_name}]}
         self._volumes = []
+        self._volumes_inflight = cinderlib.utils.InFlightRegistry()
+        self._pools_lock = threading.Lock()
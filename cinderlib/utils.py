@@ -13,6 +13,256 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+try:
+    from collections import abc
+except ImportError:  # Python 2
+    abc = collections
+import contextlib
+import importlib
+import threading
+import time
+
+import msgpack
+import six
+
+
+# Prefix of the compact binary serialization, 0xC1 is never used by msgpack
+# and cannot start a JSON document.
+PACKED_MAGIC = b'\xc1CL'
+PACKED_VERSION = 1
+
+_CONTAINERS = (dict, list, tuple)
+_UNPACK_KWARGS = {'raw': False, 'use_list': True}
+# Our packed maps use integer keys that newer versions reject by default
+if msgpack.version >= (1, 0):
+    _UNPACK_KWARGS['strict_map_key'] = False
+
+
+class IdList(abc.MutableSequence):
+    """List of resources indexed by their id.
+
+    Lookups, additions, and removals by id take constant time, and so does
+    positional access, using a list of the resources that is rebuilt after
+    the first access following a change.  Positional changes take linear
+    time like they do on a list.  There can only be one resource with a
+    given id, so appending a resource that is already present replaces it in
+    place.
+
+    It can also replace the list of an OVO list, as it supports the sort and
+    concatenation the OVO lists use.
+    """
+
+    def __init__(self, resources=()):
+        self._resources = collections.OrderedDict()
+        self._list = None
+        self.extend(resources)
+
+    def _reset(self, resources):
+        self._resources = collections.OrderedDict(
+            (resource.id, resource) for resource in resources)
+        self._list = None
+
+    def _as_list(self):
+        if self._list is None:
+            self._list = list(self._resources.values())
+        return self._list
+
+    def __len__(self):
+        return len(self._resources)
+
+    def __iter__(self):
+        return iter(self._resources.values())
+
+    def __reversed__(self):
+        return reversed(self._as_list())
+
+    def __contains__(self, resource):
+        resource_id = getattr(resource, 'id', None)
+        return (resource_id in self._resources and
+                self._resources[resource_id] == resource)
+
+    def __getitem__(self, index):
+        return self._as_list()[index]
+
+    def __setitem__(self, index, resource):
+        if not isinstance(index, slice):
+            current = self._as_list()[index]
+            # Replacing with the same id doesn't change the positions
+            if current.id == resource.id:
+                self._resources[resource.id] = resource
+                self._list[index] = resource
+                return
+        resources = list(self._as_list())
+        resources[index] = resource
+        self._reset(resources)
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            resources = list(self._as_list())
+            del resources[index]
+            self._reset(resources)
+        else:
+            del self._resources[self._as_list()[index].id]
+            self._list = None
+
+    def insert(self, index, resource):
+        # Inserting at the end doesn't need to rebuild the index
+        if (index >= len(self._resources) and
+                resource.id not in self._resources):
+            self.append(resource)
+            return
+        resources = [res for res in self._resources.values()
+                     if res.id != resource.id]
+        resources.insert(index, resource)
+        self._reset(resources)
+
+    def append(self, resource):
+        self._resources[resource.id] = resource
+        self._list = None
+
+    def remove(self, resource):
+        if resource not in self:
+            raise ValueError('%s is not in list' % resource)
+        del self._resources[resource.id]
+        self._list = None
+
+    def get(self, resource_id, default=None):
+        return self._resources.get(resource_id, default)
+
+    def pop_id(self, resource_id, default=None):
+        self._list = None
+        return self._resources.pop(resource_id, default)
+
+    def sort(self, key=None, reverse=False):
+        self._reset(sorted(self._resources.values(), key=key,
+                           reverse=reverse))
+
+    def __add__(self, other):
+        if not isinstance(other, (IdList, list)):
+            return NotImplemented
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        if not isinstance(other, list):
+            return NotImplemented
+        return other + list(self)
+
+    def __eq__(self, other):
+        if not isinstance(other, (IdList, list)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class LazyModule(object):
+    """Proxy that imports a module the first time it's used.
+
+    Used for modules that are slow to import and are not needed by all
+    cinderlib's features, like the serialization.
+    """
+
+    def __init__(self, name):
+        self.__dict__['_lazy_name'] = name
+        self.__dict__['_lazy_module'] = None
+
+    @staticmethod
+    def load(module):
+        """Import the module if it hasn't been imported yet and return it."""
+        if not isinstance(module, LazyModule):
+            return module
+        if module._lazy_module is None:
+            module.__dict__['_lazy_module'] = importlib.import_module(
+                module._lazy_name)
+        return module._lazy_module
+
+    def __getattr__(self, name):
+        return getattr(LazyModule.load(self), name)
+
+    def __repr__(self):
+        return '<lazy module %r>' % self._lazy_name
+
+
+class PhaseTimer(object):
+    """Record the duration of the phases of a process.
+
+    When it's not enabled phases are not timed or recorded.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.started_at = time.time()
+        self.phases = collections.OrderedDict()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.time() - start
+
+    def report(self):
+        """Return a dictionary with the start time and the durations."""
+        return {'started_at': self.started_at,
+                'total': sum(self.phases.values()),
+                'phases': collections.OrderedDict(self.phases)}
+
+
+class InFlightRegistry(object):
+    """Thread-safe registry of the resources that are being created.
+
+    Resources should be registered with the track context manager, which
+    guarantees they are removed from the registry once the creation has
+    completed, whether it succeeded or not.
+    """
+
+    def __init__(self):
+        self._resources = {}
+        self._lock = threading.Lock()
+
+    def add(self, resource):
+        with self._lock:
+            self._resources[resource.id] = resource
+
+    def remove(self, resource):
+        """Remove the resource if it's the one registered with its id."""
+        with self._lock:
+            if self._resources.get(resource.id) is resource:
+                del self._resources[resource.id]
+
+    def get(self, resource_id, default=None):
+        return self._resources.get(resource_id, default)
+
+    def __contains__(self, resource_id):
+        return resource_id in self._resources
+
+    def __len__(self):
+        return len(self._resources)
+
+    def values(self):
+        with self._lock:
+            return list(self._resources.values())
+
+    @contextlib.contextmanager
+    def track(self, resource):
+        self.add(resource)
+        try:
+            yield resource
+        finally:
+            self.remove(resource)
+
 
 def find_by_id(resource_id, elements):
     if elements:
@@ -23,9 +273,79 @@ def find_by_id(resource_id, elements):
 
 
 def add_by_id(resource, elements):
-    if elements is not None:
+    if isinstance(elements, IdList):
+        elements.append(resource)
+    elif elements is not None:
         i, element = find_by_id(resource.id, elements)
         if element:
             elements[i] = resource
         else:
             elements.append(resource)
+
+
+def remove_by_id(resource_id, elements):
+    """Remove the resource with the id and return it if it was present."""
+    if isinstance(elements, IdList):
+        return elements.pop_id(resource_id)
+    i, element = find_by_id(resource_id, elements)
+    if element:
+        del elements[i]
+    return element
+
+
+def _intern_keys(data, indexes):
+    """Replace dictionary keys with their index in the keys table."""
+    if isinstance(data, dict):
+        result = {}
+        for key, value in data.items():
+            index = indexes.get(key)
+            if index is None:
+                index = indexes[key] = len(indexes)
+            if isinstance(value, _CONTAINERS):
+                value = _intern_keys(value, indexes)
+            result[index] = value
+        return result
+    return [_intern_keys(value, indexes)
+            if isinstance(value, _CONTAINERS) else value
+            for value in data]
+
+
+def packb(data):
+    """Serialize Json compatible data into the compact binary format.
+
+    The format is msgpack with all dictionary keys replaced by their index in
+    a keys table that is stored once, in a header, before the data.
+    """
+    indexes = {}
+    data = _intern_keys(data, indexes)
+    keys = sorted(indexes, key=indexes.get)
+    return (PACKED_MAGIC +
+            msgpack.packb([PACKED_VERSION, keys], use_bin_type=True) +
+            msgpack.packb(data, use_bin_type=True))
+
+
+def is_packed(data):
+    """Check if data is in the compact binary format."""
+    return (isinstance(data, six.binary_type) and
+            data.startswith(PACKED_MAGIC))
+
+
+def unpackb(data):
+    """Deserialize data in the compact binary format."""
+    if not is_packed(data):
+        raise ValueError('Data is not in the compact binary format')
+
+    keys = []
+
+    def restore_keys(pairs):
+        return {keys[index]: value for index, value in pairs}
+
+    unpacker = msgpack.Unpacker(object_pairs_hook=restore_keys,
+                                **_UNPACK_KWARGS)
+    unpacker.feed(data[len(PACKED_MAGIC):])
+    version, header_keys = next(unpacker)
+    if version != PACKED_VERSION:
+        raise ValueError('Unsupported compact binary format version %s' %
+                         version)
+    keys.extend(header_keys)
+    return next(unpacker)
@@ -0,0 +1,248 @@
+#!/bin/env python
+# Copyright (c) 2019, Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Benchmark cinderlib's hot paths
+
+This tool uses an in-process fake volume driver, so it doesn't need any
+storage, and measures cinderlib's own overhead, including the persistence
+plugin, in 3 suites:
+
+- lifecycle: Throughput and latency of creating and deleting volumes,
+  snapshots, and connections.
+- scale: Latency of the persistence plugin operations and of listing the
+  backend's volumes with 1k, 10k, and 100k volumes stored.
+- serialization: Time of the dumps and load round trip of a backend with the
+  same number of volumes.
+
+Suites run for each of the persistence plugins, each one on its own process,
+where "db" is the DB plugin on a SQLite file in a temporary directory.
+
+ benchmark.py [--suites lifecycle,scale,serialization]
+              [--persistence memory,memory_db,db] [--sizes 1000,10000,100000]
+              [--operations 1000] [--repetitions 3] [--output FILE]
+
+Results are written as Json, to stdout by default, with one entry per
+operation including ops/sec and latency percentiles in milliseconds, so they
+can be stored and compared to track regressions.  Progress is reported on
+stderr.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import cinderlib
+from cinderlib.tests import fake_driver
+from cinderlib.tests import perf_utils
+
+
+BACKEND_NAME = 'benchmark'
+CONNECTOR = {'platform': 'x86_64', 'os_type': 'linux', 'ip': '127.0.0.1',
+             'host': 'benchmark', 'multipath': False,
+             'initiator': 'iqn.1993-08.org.debian:01:benchmark'}
+SUITES = ('lifecycle', 'scale', 'serialization')
+# Queries by id and name are sampled to keep large sizes manageable
+SAMPLES = 1000
+
+
+def _log(msg, *args):
+    print(msg % args, file=sys.stderr)
+
+
+def _set_persistence(name, tmp_dir):
+    if name == 'db':
+        config = {'storage': 'db',
+                  'connection': 'sqlite:///' + os.path.join(
+                      tmp_dir, 'cinderlib.sqlite')}
+    else:
+        config = {'storage': name}
+    cinderlib.Backend.set_persistence(config)
+
+
+def lifecycle(backend, persistence, operations):
+    """Create and delete volumes, snapshots, and connections."""
+    results = []
+
+    def measure(operation, func, elements):
+        res, latencies = perf_utils.timed_each(func, elements)
+        results.append(perf_utils.summarize('lifecycle', operation,
+                                            latencies,
+                                            persistence=persistence,
+                                            size=None))
+        return res
+
+    volumes = measure('create_volume', backend.create_volume,
+                      [1] * operations)
+    snapshots = measure('create_snapshot', lambda vol: vol.create_snapshot(),
+                        volumes)
+    conns = measure('connect', lambda vol: vol.connect(CONNECTOR), volumes)
+    measure('disconnect', lambda conn: conn.disconnect(), conns)
+    measure('delete_snapshot', lambda snap: snap.delete(), snapshots)
+    measure('delete_volume', lambda vol: vol.delete(), volumes)
+    return results
+
+
+def _new_volume(backend, i):
+    return cinderlib.Volume(backend, size=1, name='vol%s' % i,
+                            description='Benchmark volume %s' % i,
+                            status='available',
+                            metadata={'key%s' % j: 'value%s' % j
+                                      for j in range(5)})
+
+
+def scale(backend, persistence, size, repetitions, serialize):
+    """Measure the persistence and listing operations with size volumes."""
+    results = []
+    pers = backend.persistence
+
+    def measure(operation, func, elements, suite='scale'):
+        res, latencies = perf_utils.timed_each(func, elements)
+        results.append(perf_utils.summarize(
+            suite, operation, latencies, size=size,
+            persistence=None if suite == 'serialization' else persistence))
+        return res
+
+    volumes = [_new_volume(backend, i) for i in range(size)]
+    measure('set_volume_insert', pers.set_volume, volumes)
+
+    sample = random.sample(volumes, min(size, SAMPLES))
+    measure('get_volume_by_id',
+            lambda vol: pers.get_volumes(volume_id=vol.id), sample)
+    measure('get_volume_by_name',
+            lambda vol: backend.volumes_filtered(volume_name=vol.name),
+            sample)
+
+    def update(volume):
+        volume._ovo.status = 'in-use'
+        pers.set_volume(volume)
+    measure('set_volume_update', update, sample)
+
+    def list_volumes(i):
+        backend._volumes = None
+        return len(backend.volumes)
+    counts = measure('backend_volumes', list_volumes, range(repetitions))
+    assert counts[0] == size, 'Listed %s volumes' % counts[0]
+
+    measure('iter_volumes', lambda i: sum(1 for v in backend.iter_volumes()),
+            range(repetitions))
+
+    if serialize:
+        dumps = measure('dumps', lambda i: cinderlib.dumps(),
+                        range(repetitions), 'serialization')
+        measure('load', cinderlib.load, dumps, 'serialization')
+        # Load replaced the backend's volumes with the loaded ones
+        backend._volumes = None
+
+    measure('delete_volume', pers.delete_volume, volumes)
+    return results
+
+
+def run(args, persistence):
+    """Run the suites with a persistence plugin in this process."""
+    cinderlib.setup(disable_logs=True)
+    tmp_dir = tempfile.mkdtemp()
+    results = []
+    try:
+        _set_persistence(persistence, tmp_dir)
+        backend = cinderlib.Backend(
+            volume_driver=fake_driver.FakeVolumeDriver.PATH,
+            volume_backend_name=BACKEND_NAME)
+
+        if 'lifecycle' in args.suites:
+            _log('lifecycle: %s with %s operations', persistence,
+                 args.operations)
+            results.extend(lifecycle(backend, persistence, args.operations))
+
+        if 'scale' in args.suites or 'serialization' in args.suites:
+            for size in args.sizes:
+                _log('scale: %s with %s volumes', persistence, size)
+                res = scale(backend, persistence, size, args.repetitions,
+                            'serialization' in args.suites)
+                results.extend(r for r in res if r['suite'] in args.suites)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
+
+
+def run_subprocess(args, persistence, suites):
+    """Run the suites with a persistence plugin in a new process.
+
+    The DB persistence plugins can only be set up once per process.
+    """
+    fd, path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        subprocess.check_call([
+            sys.executable, os.path.abspath(__file__),
+            '--suites', ','.join(suites),
+            '--persistence', persistence,
+            '--sizes', ','.join(str(size) for size in args.sizes),
+            '--operations', str(args.operations),
+            '--repetitions', str(args.repetitions),
+            '--output', path])
+        with open(path) as f:
+            return json.load(f)['results']
+    finally:
+        os.unlink(path)
+
+
+def main(args):
+    if len(args.persistence) == 1:
+        results = run(args, args.persistence[0])
+    else:
+        results = []
+        suites = args.suites
+        for persistence in args.persistence:
+            results.extend(run_subprocess(args, persistence, suites))
+            # Serialization doesn't depend on the persistence plugin
+            suites = [suite for suite in suites if suite != 'serialization']
+
+    perf_utils.write_report(results, args.output,
+                            persistence=args.persistence, sizes=args.sizes,
+                            operations=args.operations,
+                            repetitions=args.repetitions)
+
+
+def _list(convert=str):
+    return lambda value: [convert(v) for v in value.split(',') if v]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark cinderlib with a fake volume driver.')
+    parser.add_argument('--suites', type=_list(), default=list(SUITES),
+                        help='Comma separated suites to run: %s' %
+                        ','.join(SUITES))
+    parser.add_argument('--persistence', type=_list(),
+                        default=['memory', 'memory_db', 'db'],
+                        help='Comma separated persistence plugins')
+    parser.add_argument('--sizes', type=_list(int),
+                        default=[1000, 10000, 100000],
+                        help='Comma separated number of volumes for the '
+                             'scale and serialization suites')
+    parser.add_argument('--operations', type=int, default=1000,
+                        help='Number of resources of the lifecycle suite')
+    parser.add_argument('--repetitions', type=int, default=3,
+                        help='Repetitions of the listing and serialization '
+                             'operations')
+    parser.add_argument('--output', help='File for the Json results')
+    main(parser.parse_args())
@@ -0,0 +1,91 @@
+#!/bin/env python
+# Copyright (c) 2019, Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Compare the Json and compact binary serialization formats
+
+This tool creates in memory volumes, without a real backend, and reports the
+size of their serialization, and the time it takes to serialize and load them,
+for the Json and the compact binary formats.
+
+ serialization-benchmark.py [number_of_volumes] [repetitions]
+
+Defaults to 1000 volumes and 5 repetitions, and reports the best time.
+"""
+
+from __future__ import print_function
+
+import json
+import sys
+import timeit
+
+import cinderlib
+from cinderlib import utils
+
+
+BACKEND_NAME = 'benchmark'
+
+
+def _create_volumes(count):
+    return [cinderlib.Volume(BACKEND_NAME, pool_name=BACKEND_NAME, size=1,
+                             name='vol%s' % i,
+                             description='Benchmark volume %s' % i,
+                             metadata={'key%s' % j: 'value%s' % j
+                                       for j in range(5)},
+                             extra_specs={'thin_provisioning': '<is> True'})
+            for i in range(count)]
+
+
+def _time(func, repetitions):
+    return min(timeit.repeat(func, number=1, repeat=repetitions))
+
+
+def _report(name, serialize, parse, repetitions):
+    data = serialize()
+    if not isinstance(data, list):
+        data = [data]
+    size = sum(len(d) for d in data)
+    dump_time = _time(serialize, repetitions)
+    parse_time = _time(lambda: [parse(d) for d in data], repetitions)
+    load_time = _time(lambda: [cinderlib.load(d) for d in data], repetitions)
+    print('%-14s %12d %12.4f %12.4f %12.4f' %
+          (name, size, dump_time, parse_time, load_time))
+
+
+def main(count, repetitions):
+    cinderlib.setup(fail_on_missing_backend=False, disable_logs=True)
+    volumes = _create_volumes(count)
+
+    print('%d volumes, best of %d' % (count, repetitions))
+    print('%-14s %12s %12s %12s %12s' % ('format', 'size (B)', 'dump (s)',
+                                         'parse (s)', 'load (s)'))
+    # Each volume serialized on its own, like persistence plugins do
+    _report('json', lambda: [v.jsons for v in volumes], json.loads,
+            repetitions)
+    _report('binary', lambda: [v.jsonb for v in volumes], utils.unpackb,
+            repetitions)
+
+    # All volumes in a single document, like the library level methods do
+    _report('json (all)',
+            lambda: json.dumps([v.json for v in volumes],
+                               separators=(',', ':')),
+            json.loads, repetitions)
+    _report('binary (all)', lambda: utils.packb([v.json for v in volumes]),
+            utils.unpackb, repetitions)
+
+
+if __name__ == '__main__':
+    count = 1000 if len(sys.argv) < 2 else int(sys.argv[1])
+    repetitions = 5 if len(sys.argv) < 3 else int(sys.argv[2])
+    main(count, repetitions)